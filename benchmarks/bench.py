@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import httpx
+
+# Benchmark harness: starts the FileMaker Data API simulator and the weaver as separate processes,
+# drives /api/dataApi for each method at the given concurrency levels and writes throughput,
+# p50/p99 latency, error counts and the weaver's RSS to a JSON file. Pass --baseline with an
+# earlier result file to print the change per scenario.
+
+ROOT = Path(__file__).resolve().parent.parent
+CITIES = ["Pune", "Berlin", "Austin", "Osaka", "Lagos", "Lima", "Oslo", "Perth"]
+AUTHORIZATION = "Basic " + base64.b64encode(b"bench:bench").decode()
+DATABASE = "BenchDB"
+LAYOUT = "Customers"
+
+
+# Request for the i-th call of each scenario, as keyword arguments for httpx.AsyncClient.post
+def scenario_request(method, i, fm_server, page_size):
+    body = {"fmServer": fm_server, "method": method, "methodBody": {"database": DATABASE, "layout": LAYOUT}}
+    method_body = body["methodBody"]
+    record_id = str(i % 1000 + 1)
+    if method == "getAllRecords":
+        method_body.update(offset=(i * page_size) % 4000 + 1, limit=page_size)
+    elif method == "findRecord":
+        method_body.update(query=[{"city": CITIES[i % len(CITIES)]}], limit=page_size)
+    elif method == "createRecord":
+        method_body.update(record={"name": f"Bench {i}", "city": CITIES[i % len(CITIES)], "amount": i})
+    elif method == "updateRecord":
+        method_body.update(recordId=record_id, record={"status": "paid"})
+    elif method == "downloadContainer":
+        method_body.update(recordId=record_id, fieldName="photo")
+    elif method == "batch":
+        body["methodBody"] = {
+            "database": DATABASE,
+            "layout": LAYOUT,
+            "operations": [
+                {"method": "updateRecord", "methodBody": {"recordId": str((i + n) % 1000 + 1), "record": {"status": "open"}}}
+                for n in range(10)
+            ],
+        }
+    elif method == "uploadContainer":
+        method_body.update(recordId=record_id, fieldName="photo")
+        return {
+            "data": {"data": json.dumps(body)},
+            "files": {"file": ("bench.bin", os.urandom(64 * 1024), "application/octet-stream")},
+        }
+    return {"json": body}
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+# Resident set size of a process in bytes (Linux /proc, or psutil when installed)
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+async def run_scenario(client, url, method, concurrency, total, fm_server, page_size):
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            request = scenario_request(method, i, fm_server, page_size)
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, headers={"Authorization": AUTHORIZATION}, **request)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return {
+        "method": method,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughputRps": round(total / elapsed, 1),
+        "p50Ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99Ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def start_process(args, env=None):
+    return subprocess.Popen(args, cwd=ROOT, env={**os.environ, **(env or {})})
+
+
+def wait_until_up(url, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout} seconds")
+
+
+def compare(results, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text())
+    previous = {(row["method"], row["concurrency"]): row for row in baseline["results"]}
+    print(f"\nCompared with {baseline_path} ({baseline.get('version')}):")
+    for row in results:
+        old = previous.get((row["method"], row["concurrency"]))
+        if old is None:
+            continue
+        change = (row["throughputRps"] - old["throughputRps"]) / old["throughputRps"] * 100
+        print(
+            f"  {row['method']:<18} c={row['concurrency']:<4} throughput {change:+6.1f}%  "
+            f"p99 {old['p99Ms']}ms -> {row['p99Ms']}ms"
+        )
+
+
+def package_version():
+    try:
+        from importlib.metadata import version
+        return version("python-fm-dapi-weaver")
+    except Exception:
+        return None
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run(args):
+    fm_server = f"127.0.0.1:{args.simulator_port}"
+    url = f"http://127.0.0.1:{args.port}/api/dataApi"
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2, max_keepalive_connections=max(args.concurrency) * 2)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        for method in args.methods:
+            for concurrency in args.concurrency:
+                # Warm up connections, sessions and caches before measuring
+                await run_scenario(client, url, method, concurrency, min(args.requests, concurrency * 2), fm_server, args.page_size)
+                row = await run_scenario(client, url, method, concurrency, args.requests, fm_server, args.page_size)
+                row["rssBytes"] = rss_bytes(args.weaver_pid)
+                results.append(row)
+                print(
+                    f"{method:<18} c={concurrency:<4} {row['throughputRps']:>9} req/s  "
+                    f"p50 {row['p50Ms']:>8}ms  p99 {row['p99Ms']:>8}ms  errors {row['errors']}"
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the weaver against the FileMaker Data API simulator")
+    parser.add_argument("--methods", default="findRecord,getAllRecords,createRecord,updateRecord,downloadContainer,batch",
+                        help="Comma separated dataApi methods to run")
+    parser.add_argument("--concurrency", default="1,10,50", help="Comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per method and concurrency level")
+    parser.add_argument("--page-size", type=int, default=100, help="Records per getAllRecords/findRecord call")
+    parser.add_argument("--port", type=int, default=8901, help="Port for the weaver")
+    parser.add_argument("--simulator-port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated FileMaker latency")
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of simulated 'host busy' failures")
+    parser.add_argument("--records", type=int, default=5000, help="Records in the simulated table")
+    parser.add_argument("--output", default=None, help="Result file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier result file to compare with")
+    args = parser.parse_args()
+    args.methods = [method for method in args.methods.split(",") if method]
+    args.concurrency = [int(level) for level in args.concurrency.split(",") if level]
+
+    simulator = start_process([
+        sys.executable, str(ROOT / "benchmarks" / "fm_simulator.py"),
+        "--port", str(args.simulator_port),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate),
+        "--records", str(args.records),
+    ])
+    # The weaver reaches the simulator over plain HTTP
+    weaver = start_process(
+        [sys.executable, "-m", "uvicorn", "python_fm_dapi_weaver.main:app",
+         "--port", str(args.port), "--log-level", "warning", "--no-access-log"],
+        env={"FM_URL_SCHEME": "http"},
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.simulator_port}/docs")
+        wait_until_up(f"http://127.0.0.1:{args.port}/")
+        args.weaver_pid = weaver.pid
+        results = asyncio.run(run(args))
+    finally:
+        for process in (weaver, simulator):
+            process.terminate()
+            process.wait(timeout=10)
+
+    started = datetime.now(timezone.utc)
+    report = {
+        "version": package_version(),
+        "revision": git_revision(),
+        "timestamp": started.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "requests": args.requests,
+            "pageSize": args.page_size,
+            "latencyMs": args.latency_ms,
+            "jitterMs": args.jitter_ms,
+            "errorRate": args.error_rate,
+            "records": args.records,
+        },
+        "results": results,
+    }
+    output = Path(args.output or ROOT / "benchmarks" / "results" / f"{started.strftime('%Y%m%dT%H%M%SZ')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
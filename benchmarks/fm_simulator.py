@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# Local stand-in for the FileMaker Data API, used by the benchmark harness.
+# It keeps an in-memory table of synthetic records and answers the calls the weaver makes:
+# sessions, validateSession, layout metadata, records (list/get/create/edit/delete), _find and containers.
+# Latency, page size limits and error rates are configurable so runs are reproducible.
+
+API = "/fmi/data/vLatest"
+
+CITIES = ["Pune", "Berlin", "Austin", "Osaka", "Lagos", "Lima", "Oslo", "Perth"]
+STATUSES = ["open", "paid", "void"]
+# Field types of the synthetic records, for the layout metadata endpoint
+FIELD_RESULTS = {
+    "id": "number",
+    "name": "text",
+    "city": "text",
+    "status": "text",
+    "amount": "number",
+    "notes": "text",
+    "photo": "container",
+    "ModificationTimestamp": "timeStamp",
+}
+
+
+class SimulatorSettings:
+    def __init__(self, records=5000, latency_ms=5.0, jitter_ms=2.0, max_page_size=5000,
+                 error_rate=0.0, container_bytes=256 * 1024, seed=1):
+        self.records = records
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.max_page_size = max_page_size
+        self.error_rate = error_rate
+        self.container_bytes = container_bytes
+        self.seed = seed
+
+
+# Modification timestamps in the Data API's ISO 8601 format (dateformats 2)
+def timestamp():
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+
+
+def ok(response=None):
+    return JSONResponse({"response": response or {}, "messages": [{"code": "0", "message": "OK"}]})
+
+
+def fm_error(status_code, code, message):
+    return JSONResponse(status_code=status_code, content={"response": {}, "messages": [{"code": code, "message": message}]})
+
+
+def create_app(settings=None):
+    settings = settings or SimulatorSettings()
+    rng = random.Random(settings.seed)
+    app = FastAPI()
+    tokens = set()
+    records = {}
+    next_id = [1]
+    container = bytes(rng.getrandbits(8) for _ in range(min(settings.container_bytes, 4096)))
+    container = (container * (settings.container_bytes // max(len(container), 1) + 1))[:settings.container_bytes]
+
+    def add_record(field_data):
+        record_id = str(next_id[0])
+        next_id[0] += 1
+        records[record_id] = {"fieldData": field_data, "portalData": {}, "recordId": record_id, "modId": "0"}
+        return records[record_id]
+
+    for i in range(1, settings.records + 1):
+        add_record({
+            "id": i,
+            "name": f"Customer {i}",
+            "city": CITIES[i % len(CITIES)],
+            "status": STATUSES[i % len(STATUSES)],
+            "amount": round(rng.uniform(1, 10000), 2),
+            "notes": "x" * rng.randint(10, 200),
+            "photo": "",
+            "ModificationTimestamp": timestamp(),
+        })
+
+    # Simulated server work: latency plus, at the configured rate, a "host busy" failure
+    async def server_work():
+        delay = settings.latency_ms + rng.uniform(-settings.jitter_ms, settings.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if settings.error_rate and rng.random() < settings.error_rate:
+            return fm_error(500, "812", "Exceeded host's capacity")
+        return None
+
+    def authorized(request):
+        header = request.headers.get("Authorization", "")
+        return header.startswith("Bearer ") and header[len("Bearer "):] in tokens
+
+    def invalid_token():
+        return fm_error(401, "952", "Invalid FileMaker Data API token (*)")
+
+    def data_info(database, layout, found_count, returned_count):
+        return {
+            "database": database,
+            "layout": layout,
+            "table": layout,
+            "totalRecordCount": len(records),
+            "foundCount": found_count,
+            "returnedCount": returned_count,
+        }
+
+    def page(found, offset, limit):
+        limit = min(limit, settings.max_page_size)
+        return found[offset - 1:offset - 1 + limit]
+
+    def with_container_url(request, record):
+        if not record["fieldData"].get("photo"):
+            url = request.url_for("container_data", record_id=record["recordId"])
+            record = {**record, "fieldData": {**record["fieldData"], "photo": str(url)}}
+        return record
+
+    @app.post(API + "/databases/{database}/sessions")
+    async def login(database: str, request: Request):
+        if not request.headers.get("Authorization", "").startswith("Basic "):
+            return fm_error(401, "212", "Invalid user account and/or password; please try again")
+        error = await server_work()
+        if error:
+            return error
+        token = uuid.uuid4().hex
+        tokens.add(token)
+        return ok({"token": token})
+
+    @app.delete(API + "/databases/{database}/sessions/{token}")
+    async def logout(database: str, token: str):
+        tokens.discard(token)
+        return ok()
+
+    @app.get(API + "/validateSession")
+    async def validate_session(request: Request):
+        error = await server_work()
+        if error:
+            return error
+        return ok() if authorized(request) else invalid_token()
+
+    @app.get(API + "/databases/{database}/layouts/{layout}/records")
+    async def get_records(database: str, layout: str, request: Request, _offset: int = 1, _limit: int = 100):
+        if not authorized(request):
+            return invalid_token()
+        error = await server_work()
+        if error:
+            return error
+        found = list(records.values())
+        data = [with_container_url(request, record) for record in page(found, _offset, _limit)]
+        return ok({"dataInfo": data_info(database, layout, len(found), len(data)), "data": data})
+
+    @app.get(API + "/databases/{database}/layouts/{layout}/records/{record_id}")
+    async def get_record(database: str, layout: str, record_id: str, request: Request):
+        if not authorized(request):
+            return invalid_token()
+        error = await server_work()
+        if error:
+            return error
+        record = records.get(record_id)
+        if record is None:
+            return fm_error(500, "101", "Record is missing")
+        return ok({"dataInfo": data_info(database, layout, 1, 1), "data": [with_container_url(request, record)]})
+
+    @app.post(API + "/databases/{database}/layouts/{layout}/records")
+    async def create_record(database: str, layout: str, request: Request):
+        if not authorized(request):
+            return invalid_token()
+        body = await request.json()
+        error = await server_work()
+        if error:
+            return error
+        record = add_record({**(body.get("fieldData") or {}), "ModificationTimestamp": timestamp()})
+        return ok({"recordId": record["recordId"], "modId": record["modId"]})
+
+    @app.patch(API + "/databases/{database}/layouts/{layout}/records/{record_id}")
+    async def edit_record(database: str, layout: str, record_id: str, request: Request):
+        if not authorized(request):
+            return invalid_token()
+        body = await request.json()
+        error = await server_work()
+        if error:
+            return error
+        record = records.get(record_id)
+        if record is None:
+            return fm_error(500, "101", "Record is missing")
+        record["fieldData"].update(body.get("fieldData") or {})
+        record["fieldData"]["ModificationTimestamp"] = timestamp()
+        record["modId"] = str(int(record["modId"]) + 1)
+        return ok({"modId": record["modId"]})
+
+    @app.delete(API + "/databases/{database}/layouts/{layout}/records/{record_id}")
+    async def delete_record(database: str, layout: str, record_id: str, request: Request):
+        if not authorized(request):
+            return invalid_token()
+        error = await server_work()
+        if error:
+            return error
+        if records.pop(record_id, None) is None:
+            return fm_error(500, "101", "Record is missing")
+        return ok()
+
+    # Find requests are OR-ed; within one request every field must match. "==value" matches
+    # exactly, "*" any non-empty value, ">=value"/">value" compare as text, and anything else
+    # matches case-insensitively at the start of the field value.
+    def matches(record, query):
+        for request in query:
+            for field, criteria in request.items():
+                value = str(record["fieldData"].get(field, ""))
+                criteria = str(criteria)
+                if criteria == "*":
+                    if not value:
+                        break
+                elif criteria.startswith(">="):
+                    if value < criteria[2:]:
+                        break
+                elif criteria.startswith(">"):
+                    if value <= criteria[1:]:
+                        break
+                elif criteria.startswith("=="):
+                    if value != criteria[2:]:
+                        break
+                elif not value.lower().startswith(criteria.lower()):
+                    break
+            else:
+                return True
+        return False
+
+    @app.get(API + "/databases/{database}/layouts/{layout}")
+    async def layout_metadata(database: str, layout: str, request: Request):
+        if not authorized(request):
+            return invalid_token()
+        error = await server_work()
+        if error:
+            return error
+        fields = [
+            {"name": name, "type": "normal", "displayType": "editText", "result": result, "global": False,
+             "autoEnter": name in ("id", "ModificationTimestamp"), "maxRepeat": 1, "maxCharacters": 0,
+             "notEmpty": False, "numeric": False, "repetitionStart": 1, "repetitionEnd": 1}
+            for name, result in FIELD_RESULTS.items()
+        ]
+        return ok({"fieldMetaData": fields, "portalMetaData": {}, "valueLists": []})
+
+    @app.post(API + "/databases/{database}/layouts/{layout}/_find")
+    async def find(database: str, layout: str, request: Request):
+        if not authorized(request):
+            return invalid_token()
+        body = await request.json()
+        error = await server_work()
+        if error:
+            return error
+        found = [record for record in records.values() if matches(record, body.get("query") or [])]
+        for sort in reversed(body.get("sort") or []):
+            found.sort(key=lambda record: str(record["fieldData"].get(sort["fieldName"], "")),
+                       reverse=sort.get("sortOrder") == "descend")
+        if not found:
+            return fm_error(500, "401", "No records match the request")
+        data = page(found, int(body.get("offset") or 1), int(body.get("limit") or 100))
+        data = [with_container_url(request, record) for record in data]
+        return ok({"dataInfo": data_info(database, layout, len(found), len(data)), "data": data})
+
+    @app.post(API + "/databases/{database}/layouts/{layout}/records/{record_id}/containers/{field}")
+    @app.post(API + "/databases/{database}/layouts/{layout}/records/{record_id}/containers/{field}/{repetition}")
+    async def upload(database: str, layout: str, record_id: str, field: str, request: Request, repetition: int = 1):
+        if not authorized(request):
+            return invalid_token()
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        error = await server_work()
+        if error:
+            return error
+        record = records.get(record_id)
+        if record is None:
+            return fm_error(500, "101", "Record is missing")
+        record["modId"] = str(int(record["modId"]) + 1)
+        return ok({"modId": record["modId"]})
+
+    # Container URLs behave like FileMaker's streaming URLs: the first hit redirects and sets a
+    # session cookie, the data is only served to requests that send it back
+    @app.get("/Streaming_SSL/MainDB/{record_id}.bin", name="container_data")
+    async def container_data(record_id: str, request: Request):
+        if request.cookies.get("X-FMS-Session-Key") is None:
+            response = Response(status_code=302, headers={"Location": str(request.url)})
+            response.set_cookie("X-FMS-Session-Key", uuid.uuid4().hex)
+            return response
+        error = await server_work()
+        if error:
+            return error
+        return Response(container, media_type="application/octet-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the FileMaker Data API simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--max-page-size", type=int, default=5000)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--container-bytes", type=int, default=256 * 1024)
+    args = parser.parse_args()
+
+    import uvicorn
+    settings = SimulatorSettings(
+        records=args.records,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        max_page_size=args.max_page_size,
+        error_rate=args.error_rate,
+        container_bytes=args.container_bytes,
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import os
+
+# Runtime settings. Every value can be overridden through an environment variable of the same name.
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Verify the FileMaker Server TLS certificate
+FM_VERIFY_SSL = _env_bool("FM_VERIFY_SSL", False)
+# Scheme used to reach fmServer; "http" is only meant for local stand-ins such as the benchmark simulator
+FM_URL_SCHEME = os.getenv("FM_URL_SCHEME", "https")
+
+# Connection pool kept per FileMaker host
+FM_MAX_CONNECTIONS = _env_int("FM_MAX_CONNECTIONS", 100)
+FM_MAX_KEEPALIVE_CONNECTIONS = _env_int("FM_MAX_KEEPALIVE_CONNECTIONS", 20)
+# Seconds an idle keep-alive connection stays in the pool
+FM_KEEPALIVE_EXPIRY = _env_float("FM_KEEPALIVE_EXPIRY", 60.0)
+# FileMaker hosts (fmServer values) whose connection pool and circuit breaker are kept; the least
+# recently used host beyond this is dropped, as fmServer comes from the request body
+FM_MAX_HOSTS = _env_int("FM_MAX_HOSTS", 64)
+
+# Upstream timeouts in seconds
+FM_CONNECT_TIMEOUT = _env_float("FM_CONNECT_TIMEOUT", 10.0)
+FM_READ_TIMEOUT = _env_float("FM_READ_TIMEOUT", 120.0)
+FM_WRITE_TIMEOUT = _env_float("FM_WRITE_TIMEOUT", 120.0)
+# Seconds to wait for a free pooled connection
+FM_POOL_TIMEOUT = _env_float("FM_POOL_TIMEOUT", 30.0)
+
+# Session token cache. FileMaker expires idle sessions after 15 minutes, so tokens are
+# trusted without a validateSession call for a little less than that. 0 disables the cache.
+FM_SESSION_CACHE_TTL = _env_float("FM_SESSION_CACHE_TTL", 840.0)
+FM_SESSION_CACHE_SIZE = _env_int("FM_SESSION_CACHE_SIZE", 1000)
+
+# Pools of pre-authenticated sessions for service accounts. FM_SESSION_POOL_ACCOUNTS is a JSON
+# list such as [{"fmServer": "...", "database": "...", "authToken": "<base64 user:pass>", "size": 5}]
+FM_SESSION_POOL_ACCOUNTS = os.getenv("FM_SESSION_POOL_ACCOUNTS", "")
+FM_SESSION_POOL_SIZE = _env_int("FM_SESSION_POOL_SIZE", 5)
+# Seconds to wait for a free pooled session before answering 503
+FM_SESSION_POOL_TIMEOUT = _env_float("FM_SESSION_POOL_TIMEOUT", 30.0)
+# Idle sessions are re-validated after this many seconds, well before FileMaker's 15-minute timeout
+FM_SESSION_POOL_KEEPALIVE = _env_float("FM_SESSION_POOL_KEEPALIVE", 600.0)
+
+# Chunk size in bytes used when streaming container uploads
+FM_UPLOAD_CHUNK_SIZE = _env_int("FM_UPLOAD_CHUNK_SIZE", 64 * 1024)
+
+# Records per Data API page when getAllRecords/findRecord read a whole found set ("stream"/"parallel")
+FM_STREAM_PAGE_SIZE = _env_int("FM_STREAM_PAGE_SIZE", 1000)
+# Upper bound for the "parallel" page fan-out option
+FM_MAX_PARALLEL_PAGES = _env_int("FM_MAX_PARALLEL_PAGES", 8)
+
+# batch method: sub-operations run concurrently over the batch's session
+FM_BATCH_MAX_OPERATIONS = _env_int("FM_BATCH_MAX_OPERATIONS", 1000)
+FM_BATCH_CONCURRENCY = _env_int("FM_BATCH_CONCURRENCY", 8)
+FM_BATCH_MAX_CONCURRENCY = _env_int("FM_BATCH_MAX_CONCURRENCY", 32)
+
+# Read cache for findRecord/getAllRecords. Disabled while every TTL is 0.
+# FM_RESPONSE_CACHE_LAYOUT_TTLS overrides the TTL per layout, e.g. {"Dashboard": 5, "Orders": 0}
+FM_RESPONSE_CACHE_TTL = _env_float("FM_RESPONSE_CACHE_TTL", 0.0)
+FM_RESPONSE_CACHE_LAYOUT_TTLS = os.getenv("FM_RESPONSE_CACHE_LAYOUT_TTLS", "")
+FM_RESPONSE_CACHE_MAX_BYTES = _env_int("FM_RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+# JSON library for request bodies, upstream payloads and responses: "auto" picks orjson, then
+# msgspec, when installed and falls back to the standard library; "orjson", "msgspec" or "json" force one
+FM_JSON_BACKEND = os.getenv("FM_JSON_BACKEND", "auto")
+
+# Request size limits in bytes, enforced while the body is read (413 once exceeded).
+# FM_MAX_BODY_SIZE covers JSON bodies and the multipart 'data' field; FM_MAX_UPLOAD_SIZE covers a
+# whole multipart upload, 0 = no limit
+FM_MAX_BODY_SIZE = _env_int("FM_MAX_BODY_SIZE", 16 * 1024 * 1024)
+FM_MAX_UPLOAD_SIZE = _env_int("FM_MAX_UPLOAD_SIZE", 0)
+
+# Upstream retries: reads (GET, _find) are retried on transport errors and busy/unavailable
+# answers, writes and scripted reads only when the connection failed before the request was sent.
+# Delays grow exponentially from FM_RETRY_BACKOFF seconds, capped and fully jittered.
+FM_RETRY_ATTEMPTS = _env_int("FM_RETRY_ATTEMPTS", 2)
+FM_RETRY_BACKOFF = _env_float("FM_RETRY_BACKOFF", 0.2)
+FM_RETRY_MAX_BACKOFF = _env_float("FM_RETRY_MAX_BACKOFF", 5.0)
+
+# Per-fmServer circuit breaker: after FM_BREAKER_FAILURES consecutive host failures, calls fail
+# fast with 503 for FM_BREAKER_RESET_TIMEOUT seconds, then a single probe call is let through
+FM_BREAKER_FAILURES = _env_int("FM_BREAKER_FAILURES", 5)
+FM_BREAKER_RESET_TIMEOUT = _env_float("FM_BREAKER_RESET_TIMEOUT", 30.0)
+
+# Concurrent dataApi requests allowed per FileMaker host, 0 = no limit. Requests over the limit
+# queue fairly across callers, by priority class, for up to FM_CONCURRENCY_QUEUE_TIMEOUT seconds.
+# FM_HOST_CONCURRENCY_LIMITS overrides the limit per host, e.g. {"fm1.example.com": 8}
+FM_HOST_CONCURRENCY = _env_int("FM_HOST_CONCURRENCY", 0)
+FM_HOST_CONCURRENCY_LIMITS = os.getenv("FM_HOST_CONCURRENCY_LIMITS", "")
+# Apply the limit to every database of a host separately
+FM_CONCURRENCY_PER_DATABASE = _env_bool("FM_CONCURRENCY_PER_DATABASE", False)
+FM_CONCURRENCY_QUEUE_TIMEOUT = _env_float("FM_CONCURRENCY_QUEUE_TIMEOUT", 10.0)
+# Priority class per method (lower runs first), overriding the defaults, e.g. {"batch": 2}
+FM_METHOD_PRIORITIES = os.getenv("FM_METHOD_PRIORITIES", "")
+
+# Add a Server-Timing header with phase timings to every dataApi response
+FM_SERVER_TIMING = _env_bool("FM_SERVER_TIMING", False)
+# Share of dataApi requests (0.0 - 1.0) logged as one JSON line with the same phase timings
+FM_TRACE_SAMPLE_RATE = _env_float("FM_TRACE_SAMPLE_RATE", 0.0)
+
+# Production server mode (start_server(production=True)). FM_WORKERS defaults to the CPU count.
+FM_WORKERS = _env_int("FM_WORKERS", 0)
+FM_BACKLOG = _env_int("FM_BACKLOG", 2048)
+# Seconds an idle client keep-alive connection is kept open
+FM_KEEPALIVE_TIMEOUT = _env_int("FM_KEEPALIVE_TIMEOUT", 75)
+# Connections per worker before new ones are answered 503, 0 = no limit
+FM_LIMIT_CONCURRENCY = _env_int("FM_LIMIT_CONCURRENCY", 0)
+# Seconds in-flight requests may take to finish after SIGTERM
+FM_GRACEFUL_TIMEOUT = _env_int("FM_GRACEFUL_TIMEOUT", 30)
+# Number of worker processes sharing the configured session pools (set by start_server)
+FM_WORKER_COUNT = _env_int("FM_WORKER_COUNT", 1)
+
+# SQLite file shared by worker processes so they reuse each other's FileMaker session tokens.
+# Empty keeps tokens per process; production mode with several workers picks a temp file.
+FM_SESSION_STORE = os.getenv("FM_SESSION_STORE", "")
+
+# syncRecords: default modification timestamp field, and records returned per call at most
+FM_SYNC_TIMESTAMP_FIELD = os.getenv("FM_SYNC_TIMESTAMP_FIELD", "ModificationTimestamp")
+FM_SYNC_MAX_RECORDS = _env_int("FM_SYNC_MAX_RECORDS", 5000)
+
+# Local SQLite mirrors of read-heavy layouts, read with "source": "mirror". FM_READ_MIRRORS is a
+# JSON list such as [{"fmServer": "...", "database": "...", "layout": "...", "authToken": "<base64
+# user:pass>", "indexes": ["City", "Status"], "timestampField": "...", "interval": 30}]
+FM_READ_MIRRORS = os.getenv("FM_READ_MIRRORS", "")
+FM_READ_MIRROR_PATH = os.getenv("FM_READ_MIRROR_PATH", "fm-read-mirror.sqlite3")
+# Seconds between delta syncs of a mirror
+FM_READ_MIRROR_INTERVAL = _env_float("FM_READ_MIRROR_INTERVAL", 30.0)
+# Reads fall back to FileMaker when the last sync is older than this many seconds, 0 = never
+FM_READ_MIRROR_MAX_STALENESS = _env_float("FM_READ_MIRROR_MAX_STALENESS", 300.0)
+# Seconds between full passes, which also drop records deleted in FileMaker
+FM_READ_MIRROR_FULL_SYNC = _env_float("FM_READ_MIRROR_FULL_SYNC", 3600.0)
+
+# Seconds layout metadata (GET layouts/{layout}) is cached per layout and account
+FM_LAYOUT_METADATA_TTL = _env_float("FM_LAYOUT_METADATA_TTL", 300.0)
+# Check field names (and coerce values) of createRecord/updateRecord/findRecord against the
+# cached layout metadata before calling FileMaker; "validate" in methodBody overrides it
+FM_VALIDATE_FIELDS = _env_bool("FM_VALIDATE_FIELDS", False)
+
+# Slim layouts for reads that ask for a few "fields": JSON object mapping a layout to a layout
+# with fewer fields, e.g. {"Customers": "Customers_Mobile"}. It is used as layout.response when
+# it holds every requested field.
+FM_RESPONSE_LAYOUTS = os.getenv("FM_RESPONSE_LAYOUTS", "")
+
+# dataApi response compression: encodings offered in order of preference (br and zstd need the
+# brotli / zstandard packages), empty to disable, and the smallest complete body compressed
+FM_COMPRESSION_ENCODINGS = os.getenv("FM_COMPRESSION_ENCODINGS", "zstd,br,gzip")
+FM_COMPRESSION_MIN_SIZE = _env_int("FM_COMPRESSION_MIN_SIZE", 1024)
@@ -1,6 +1,17 @@
 from fastapi import FastAPI, HTTPException, Header, Request, APIRouter
-from starlette.responses import JSONResponse
-import requests
+from starlette.responses import JSONResponse, Response
+import httpx
+from ..utils.fm_client import fm_client
+from ..utils.helpers import handle_api_error
+from ..utils.session_cache import session_cache, credentials_key
+from ..utils.singleflight import SingleFlight
+from ..utils.session_pool import SessionPoolManager
+from ..utils.circuit_breaker import CircuitOpenError
+from ..utils import metrics
+from .. import config
+
+# In-flight logins, keyed by (fmServer, database, credentials hash)
+login_flights = SingleFlight()
 
 # Validates the 'Authorization' header and extracts the Basic Auth token
 async def validate_token(req: Request):
@@ -29,43 +40,73 @@ async def validate_session(req: Request):
     database = method_body.get("database")
     fm_server = body.get("fmServer")
     method=body.get("method")
+    cache_key = credentials_key(fm_server, database, basic_auth_token)
+    req.state.fmSessionFromCache = False
+
+    pool = session_pools.get(cache_key)
+    if (not session or not token) and pool is not None and method != "signout":
+        # Service accounts borrow a pre-authenticated session for the length of the request
+        pooled_session = await pool.acquire(config.FM_SESSION_POOL_TIMEOUT)
+        req.state.fmPooledSession = (pool, pooled_session)
+        req.state.fmSessionToken = pooled_session.token
+        req.state.fmSessionFromCache = True
+        metrics.session_sources.inc("pool")
+        return
 
     if not session or not token:
+        # Reuse the token already held for these credentials, if it is still fresh
+        cached_token = session_cache.get(cache_key)
+        if cached_token:
+            req.state.fmSessionToken = cached_token
+            req.state.fmSessionFromCache = True
+            metrics.session_sources.inc("cache")
+            return
         try:
-            # If session or token is missing, attempt to login and validate session
-            fm_session_token = await fm_login(fm_server, database, basic_auth_token)
+            # If session or token is missing, attempt to login. A freshly issued token
+            # is valid by definition, so no validateSession round trip is needed.
+            fm_session_token = await fm_login_shared(fm_server, database, basic_auth_token)
 
             if fm_session_token:
-                is_session_valid = await fm_validate_session(fm_server, fm_session_token)
-                if is_session_valid:
-                     req.state.fmSessionToken = fm_session_token
-
-                else:
-                    return JSONResponse(status_code=401, content={"error": "Session token validation failed"})
+                req.state.fmSessionToken = fm_session_token
+                metrics.session_sources.inc("login")
+            else:
+                return JSONResponse(status_code=401, content={"error": "Session token validation failed"})
+        except CircuitOpenError:
+            raise
         except Exception as error:
             return JSONResponse(status_code=401, content={"error": str(error)})
     else:
+        # Tokens this server logged in for, used within FileMaker's idle window, skip validateSession
+        if session_cache.is_valid(cache_key, token):
+            req.state.fmSessionToken = token
+            req.state.fmSessionFromCache = True
+            metrics.session_sources.inc("cache")
+            return
         try:
             is_session_valid = await fm_validate_session(fm_server, token)
             if is_session_valid:
+                 # Not cached: validateSession does not tell which database or account the token
+                 # belongs to, and the cache hands its tokens to token-less requests
                  req.state.fmSessionToken = token
+                 metrics.session_sources.inc("validated")
             else:
                 if token:
                     try:
-                        fm_session_token = await fm_login(fm_server, database, basic_auth_token)
+                        fm_session_token = await fm_login_shared(fm_server, database, basic_auth_token)
                         if fm_session_token:
-                            is_session_valid = await fm_validate_session(fm_server, fm_session_token)                            
-                            if is_session_valid:
-                                  req.state.fmSessionToken = fm_session_token
-
-                            else:
-                                return JSONResponse(status_code=401, content={"error": "Re-validation of session token failed"})
+                            req.state.fmSessionToken = fm_session_token
+                            metrics.session_sources.inc("login")
                         else:
                             return JSONResponse(status_code=401, content={"error": "Re-authentication failed"})
+                    except CircuitOpenError:
+                        raise
                     except Exception as error:
                         return JSONResponse(status_code=401, content={"error": str(error)})
                 else:
                     return JSONResponse(status_code=401, content={"error": "Invalid session token"})
+        except CircuitOpenError:
+            # The host is down, not the session: answer 503 rather than 401
+            raise
         except Exception as error:
             return JSONResponse(status_code=401, content={"error": "Session validation failed"})
 
@@ -81,7 +122,7 @@ async def signin(req: Request):
         if not fm_server or not database:
           raise HTTPException(status_code=400, detail="Missing fmServer or database in request body")
 
-        session_token = await fm_login(fm_server, database, basic_auth_token)
+        session_token = await fm_login_shared(fm_server, database, basic_auth_token)
 
         return {
           "message": "Signin Successful",
@@ -94,41 +135,60 @@ async def signin(req: Request):
         raise HTTPException(status_code=500, detail=f"Signin failed: {str(e)}")
 
 async def fm_login(fm_server, database, basic_auth_token):
-    url = f"https://{fm_server}/fmi/data/vLatest/databases/{database}/sessions"
-    
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Basic {basic_auth_token}"
     }
     
     try:
-        login_response = requests.post(url, headers=headers, json={}, verify=False)
+        login_response = await fm_client.post(fm_server, f"databases/{database}/sessions", headers=headers, json={})
         login_response.raise_for_status()
         return login_response.json()["response"]["token"]
-    except requests.HTTPError as error:
+    except httpx.HTTPStatusError as error:
         print("fmLogin Error:", error)
-        response_json = {
-            "error": "An error occurred while logging in."
-        }
-        if error.response and error.response.status_code:
-            response_json["statusText"] = error.response.status_code
-            response_json["error"] = error.response.json()
-        raise response_json
+        raise handle_api_error(error, "An error occurred while logging in.")
+
+
+# Logs in once for all concurrent callers sharing the same credentials and caches the token.
+# A failed login is raised to every waiting caller.
+async def fm_login_shared(fm_server, database, basic_auth_token):
+    cache_key = credentials_key(fm_server, database, basic_auth_token)
+
+    async def login():
+        session_token = await fm_login(fm_server, database, basic_auth_token)
+        session_cache.put(cache_key, session_token)
+        return session_token
+
+    return await login_flights.do(cache_key, login)
+
+
+# A pooled session stays with the pool, so its token is never handed to the caller: it is dropped
+# from the response body, or from the X-Session-Token header of streamed and binary responses
+def hide_pooled_session(req: Request, response):
+    if getattr(req.state, "fmPooledSession", None) is None:
+        return
+    if isinstance(response, dict):
+        response.pop("session", None)
+    elif isinstance(response, Response) and "x-session-token" in response.headers:
+        del response.headers["x-session-token"]
+
+
+# Gives a borrowed pooled session back; `discard` replaces it when FileMaker rejected it
+def release_pooled_session(req: Request, discard=False):
+    pooled = getattr(req.state, "fmPooledSession", None)
+    if pooled is not None:
+        req.state.fmPooledSession = None
+        pool, pooled_session = pooled
+        pool.release(pooled_session, discard=discard)
 
 
 # Validates session token against the FileMaker server
 async def fm_validate_session(fm_server, session_token):
-    url = f"https://{fm_server}/fmi/data/vLatest/validateSession"
-
-    headers = {
-        "Authorization": f"Bearer {session_token}"
-    }
-    
     try:
-        validate_response = requests.get(url, headers=headers, verify=False)
+        validate_response = await fm_client.get(fm_server, "validateSession", token=session_token)
         validate_response.raise_for_status()
         return validate_response.json()["messages"][0]["message"] == "OK"
-    except requests.HTTPError as error:
+    except httpx.HTTPStatusError as error:
         return False  # Return false if there was an error
 
 
@@ -142,28 +202,36 @@ async def signout(req: Request):
         token = req.state.fmSessionToken
         if not (fm_server and database):
             raise HTTPException(status_code=400, detail="Missing fmServer, database.")
-       
-        url = f"https://{fm_server}/fmi/data/vLatest/databases/{database}/sessions/{token}"
-        headers = {
-        "Authorization": f"Bearer {token}"
-        }
-
+        if getattr(req.state, "fmPooledSession", None) is not None or session_pools.owns(token):
+            raise HTTPException(status_code=400, detail="Pooled FileMaker sessions cannot be signed out")
 
 
-        response = requests.delete(url, headers=headers, verify=False)
+        response = await fm_client.delete(fm_server, f"databases/{database}/sessions/{token}", token=token)
         if response.status_code == 200 and response.json().get("messages", [{}])[0].get("message") == "OK":
+            session_cache.invalidate_token(token)
             return {"message": "Signout success"}
         else:
             return JSONResponse(status_code=401, content={"error": "Signout failed"})
 
-    except requests.RequestException as error:
+    except httpx.HTTPError as error:
         response_json = {
             "error": "An error occurred while signing out.",
         }
-        if error.response and error.response.status_code:
-            response_json["statusText"] = error.response.status_code
+        error_response = getattr(error, "response", None)
+        if error_response is not None and error_response.status_code:
+            response_json["statusText"] = error_response.status_code
             try:
-                response_json["error"] = error.response.json()
+                response_json["error"] = error_response.json()
             except Exception:
                 response_json["error"] = str(error)
-        return JSONResponse(status_code=500, content=response_json)
\ No newline at end of file
+        return JSONResponse(status_code=500, content=response_json)
+
+
+# Closes a FileMaker session, returning True when the server confirmed it
+async def fm_logout(fm_server, database, session_token):
+    response = await fm_client.delete(fm_server, f"databases/{database}/sessions/{session_token}", token=session_token)
+    return response.status_code == 200
+
+
+# Pre-authenticated sessions for the service accounts listed in FM_SESSION_POOL_ACCOUNTS
+session_pools = SessionPoolManager(fm_login, fm_logout, fm_validate_session)
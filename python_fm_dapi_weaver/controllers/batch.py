@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+from fastapi import HTTPException, Request
+from .. import config
+from ..utils.session_cache import is_invalid_token_error
+from ..utils.concurrency_limiter import admitted_width
+from .auth import validate_session, release_pooled_session
+from .records import create_record, update_record, delete_record, find_record, positive_int
+
+# Methods that can run inside a batch
+BATCH_HANDLERS = {
+    "createRecord": create_record,
+    "updateRecord": update_record,
+    "deleteRecord": delete_record,
+    "findRecord": find_record,
+}
+
+
+# Stand-in for the Request the record handlers read from, carrying one sub-operation's body
+# together with the session that was validated once for the whole batch
+class SubRequest:
+    def __init__(self, req: Request, body):
+        self.headers = req.headers
+        self.state = SimpleNamespace(
+            body=body,
+            basicAuthToken=req.state.basicAuthToken,
+            fmSessionToken=req.state.fmSessionToken,
+            # Each operation counts as one of the upstream calls the batch was admitted for
+            fmConcurrencySlot=SimpleNamespace(weight=1),
+        )
+
+
+async def batch(req: Request):
+    data = req.state.body
+    method_body = data.get("methodBody", {})
+    operations = method_body.get("operations")
+
+    if not isinstance(operations, list) or not operations:
+        raise HTTPException(status_code=400, detail="Missing required parameters: operations")
+    if len(operations) > config.FM_BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {config.FM_BATCH_MAX_OPERATIONS} operations")
+
+    concurrency = min(positive_int(method_body, "concurrency", config.FM_BATCH_CONCURRENCY), config.FM_BATCH_MAX_CONCURRENCY)
+    concurrency = admitted_width(req, concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    # database, layout and validate given at the batch level apply to every operation that does not set its own
+    defaults = {key: method_body[key] for key in ("database", "layout", "validate") if key in method_body}
+    # Operations FileMaker rejected for an invalid session token, which never ran
+    rejected = []
+
+    async def run(index, operation):
+        method = operation.get("method") if isinstance(operation, dict) else None
+        result = {"index": index, "method": method}
+        handler = BATCH_HANDLERS.get(method)
+        if handler is None:
+            return {**result, "status": "error", "statusCode": 400, "error": f"Invalid batch method {method}"}
+        operation_body = {**defaults, **(operation.get("methodBody") or {})}
+        if operation_body.get("stream"):
+            return {**result, "status": "error", "statusCode": 400, "error": "stream is not supported inside a batch"}
+        if operation_body.get("format") in ("arrow", "parquet"):
+            return {**result, "status": "error", "statusCode": 400, "error": f"format {operation_body['format']} is not supported inside a batch"}
+        sub_request = SubRequest(req, {**data, "method": method, "methodBody": operation_body})
+
+        async with semaphore:
+            try:
+                response = await handler(sub_request)
+            except HTTPException as e:
+                if is_invalid_token_error(e):
+                    rejected.append(index)
+                return {**result, "status": "error", "statusCode": e.status_code, "error": e.detail}
+            except Exception as e:
+                return {**result, "status": "error", "statusCode": 502, "error": str(e)}
+
+        if isinstance(response, dict):
+            response.pop("session", None)
+        return {**result, "status": "ok", "result": response}
+
+    results = await asyncio.gather(*[run(index, operation) for index, operation in enumerate(operations)])
+    if rejected and req.state.fmSessionFromCache:
+        # The cached or pooled token expired (e.g. after a server restart): sign in again once and
+        # run only the rejected operations with the new session
+        retry, rejected = sorted(rejected), []
+        release_pooled_session(req, discard=True)
+        if await validate_session(req) is None:
+            retried = await asyncio.gather(*[run(index, operations[index]) for index in retry])
+            for index, result in zip(retry, retried):
+                results[index] = result
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+
+    return {
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "session": req.state.fmSessionToken
+    }
@@ -1,13 +1,26 @@
-from fastapi import FastAPI, Request, Response
-from .auth import validate_session, validate_token,signin,signout
+import hashlib
+from fastapi import FastAPI, HTTPException, Request, Response
+from starlette.responses import StreamingResponse
+from .auth import validate_session, validate_token,signin,signout,release_pooled_session,hide_pooled_session
 from .records import (
     create_record,
     get_all_records,
     find_record,
     update_record,
     delete_record,
-    upload_container
+    upload_container,
+    download_container,
+    sync_records,
+    positive_int
 )
+from .batch import batch
+from .layouts import get_layout_metadata
+from ..utils.session_cache import is_invalid_token_error
+from ..utils.streaming import close_after
+from ..utils.request_body import parse_body
+from ..utils.concurrency_limiter import concurrency_limiter
+from ..utils.tracing import phase
+from .. import config
 
 # List of method names that do not require token/session validation.
 controllers_to_skip_validation = ["signin"]
@@ -22,21 +35,91 @@ METHOD_HANDLERS = {
     "deleteRecord": delete_record,
     "signin": signin,
     "signout" : signout,
-    "uploadContainer":upload_container
-    
+    "uploadContainer":upload_container,
+    "downloadContainer": download_container,
+    "batch": batch,
+    "syncRecords": sync_records,
+    "getLayoutMetadata": get_layout_metadata
 }
 
 
 async def data_api(req: Request, res: Response):
-    method = req.state.body.get("method")
+    with phase("parse"):
+        body = await parse_body(req)
+    method = body.get("method")
     if method not in METHOD_HANDLERS:
         return {"error": f"Invalid method ${method}"}
+
+    # Wait for a free slot on the target FileMaker host; the slot is held until the response is done
+    req.state.fmConcurrencySlot = await concurrency_limiter.acquire(
+        body.get("fmServer"),
+        body.get("methodBody", {}).get("database"),
+        caller_key(req),
+        method,
+        fan_out_width(method, body.get("methodBody", {})),
+    )
+    try:
+        response = await handle(req, method)
+    except BaseException:
+        release_request(req)
+        raise
+    hide_pooled_session(req, response)
+    if isinstance(response, StreamingResponse):
+        # Streamed responses keep using the session and the slot until the last chunk is sent
+        response.body_iterator = close_after(response.body_iterator, lambda: release_request(req))
+    else:
+        release_request(req)
+    return response
+
+
+async def handle(req: Request, method):
     if method not in controllers_to_skip_validation:
         # If the method is not in the skip list, apply the validateToken  first
-        await validate_token(req)        
+        with phase("validate_token"):
+            await validate_token(req)
         # After token validation, apply the validateSession middleware
-        await validate_session(req)
-               
-    handler = METHOD_HANDLERS[method]
-    return await handler(req)
+        with phase("validate_session"):
+            session_error = await validate_session(req)
+        if session_error is not None:
+            return session_error
+
+    return await dispatch(req, METHOD_HANDLERS[method])
+
+
+# Upstream calls a request runs at once, all counted against the host's concurrency limit:
+# a batch runs `concurrency` operations and a parallel read fetches `parallel` pages at a time
+def fan_out_width(method, method_body):
+    if method == "batch" and isinstance(method_body.get("operations"), list):
+        concurrency = positive_int(method_body, "concurrency", config.FM_BATCH_CONCURRENCY)
+        return max(1, min(concurrency, config.FM_BATCH_MAX_CONCURRENCY, len(method_body["operations"])))
+    if method in ("getAllRecords", "findRecord") and method_body.get("parallel"):
+        return min(positive_int(method_body, "parallel", 1), config.FM_MAX_PARALLEL_PAGES)
+    return 1
+
+
+# Identifies the API caller for fair scheduling, without keeping their credentials around
+def caller_key(req: Request):
+    return hashlib.sha256(req.headers.get("Authorization", "").encode("utf-8")).hexdigest()
+
+
+# Gives back what the request borrowed: its pooled session and its concurrency slot
+def release_request(req: Request):
+    release_pooled_session(req)
+    slot = getattr(req.state, "fmConcurrencySlot", None)
+    if slot is not None:
+        slot.release()
+
 
+async def dispatch(req: Request, handler):
+    try:
+        return await handler(req)
+    except HTTPException as error:
+        # A cached or pooled token FileMaker no longer accepts (e.g. after a server restart):
+        # the call was rejected before it ran, so sign in again and retry once
+        if not getattr(req.state, "fmSessionFromCache", False) or not is_invalid_token_error(error):
+            raise
+        release_pooled_session(req, discard=True)
+        session_error = await validate_session(req)
+        if session_error is not None:
+            return session_error
+        return await handler(req)
@@ -0,0 +1,80 @@
+import time
+import httpx
+from fastapi import HTTPException, Request
+from .. import config
+from ..utils.fm_client import fm_client
+from ..utils.helpers import handle_api_error, validate_required_params
+from ..utils import fast_json
+from ..utils.layout_metadata import layout_metadata
+from ..utils.session_cache import credentials_key
+
+# Cached metadata older than this is fetched again before a request is rejected for an unknown
+# field, in case the layout changed since
+REFRESH_BEFORE_REJECTING = 10.0
+
+
+async def get_layout_metadata(req: Request):
+    data = req.state.body
+    token = req.state.fmSessionToken
+    method_body = data.get("methodBody", {})
+    database = method_body.get("database")
+    layout = method_body.get("layout")
+    fm_server = data.get("fmServer")
+
+    validate_required_params({
+        "fmSessionToken": token,
+        "fmServer": fm_server,
+        "database": database,
+        "layout": layout
+    })
+
+    fields = await layout_fields(req, fm_server, database, layout, refresh=method_body.get("refresh") is True)
+    return {**fields.metadata, "session": token}
+
+
+# Returns the cached LayoutFields of a layout as seen by the caller's account
+async def layout_fields(req: Request, fm_server, database, layout, refresh=False):
+    token = req.state.fmSessionToken
+    _, _, credentials = credentials_key(fm_server, database, req.state.basicAuthToken)
+    key = (fm_server, database, layout, credentials)
+
+    async def fetch():
+        try:
+            response = await fm_client.get(fm_server, f"databases/{database}/layouts/{layout}", token=token)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise handle_api_error(e, "An error occurred while fetching the layout metadata.")
+        return fast_json.loads(response.content)["response"]
+
+    return await layout_metadata.get(key, fetch, refresh=refresh)
+
+
+# Field validation is opt-in: FM_VALIDATE_FIELDS for every request, or "validate" in methodBody
+def validation_enabled(req: Request):
+    validate = req.state.body.get("methodBody", {}).get("validate")
+    return config.FM_VALIDATE_FIELDS if validate is None else validate is True
+
+
+# Runs `check` on the layout's fields, refreshing stale metadata once before giving up
+async def check_layout(req: Request, fm_server, database, layout, check):
+    fields = await layout_fields(req, fm_server, database, layout)
+    try:
+        return check(fields)
+    except HTTPException:
+        if time.monotonic() - fields.fetched_at < REFRESH_BEFORE_REJECTING:
+            raise
+    return check(await layout_fields(req, fm_server, database, layout, refresh=True))
+
+
+# The record of a createRecord/updateRecord with its values coerced to the field types, or the
+# record unchanged when validation is off
+async def checked_record(req: Request, fm_server, database, layout, record):
+    if not validation_enabled(req) or not isinstance(record, dict):
+        return record
+    return await check_layout(req, fm_server, database, layout, lambda fields: fields.check_record(record))
+
+
+async def check_find(req: Request, fm_server, database, layout, query, sort, portals):
+    if not validation_enabled(req):
+        return
+    await check_layout(req, fm_server, database, layout, lambda fields: fields.check_find(query, sort, portals))
@@ -1,8 +1,41 @@
-import requests
+import asyncio
+import httpx
+from collections import deque, namedtuple
 import json
 import base64
+import mimetypes
 from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Form
+from starlette.responses import StreamingResponse
+from .. import config
+from ..utils.fm_client import fm_client
 from ..utils.helpers import handle_api_error,validate_required_params
+from ..utils import fast_json
+from ..utils.streaming import multipart_file_body, close_after
+from ..utils.session_cache import credentials_key, is_invalid_token_error
+from ..utils.response_cache import response_cache
+from ..utils.singleflight import SingleFlight
+from ..utils.read_mirror import ReadMirrorManager
+from ..utils.concurrency_limiter import admitted_width
+from ..utils import metrics, record_formats
+from .auth import session_pools, fm_login
+from .layouts import checked_record, check_find, layout_fields
+
+# Identical findRecord/getAllRecords reads in flight
+read_flights = SingleFlight()
+
+# Slim layouts that answer reads asking for a few `fields`, e.g. {"Customers": "Customers_Mobile"}
+RESPONSE_LAYOUTS = json.loads(config.FM_RESPONSE_LAYOUTS or "{}")
+
+# Upstream container headers passed through to the caller of downloadContainer
+CONTAINER_RESPONSE_HEADERS = [
+    "content-length",
+    "content-range",
+    "content-encoding",
+    "content-disposition",
+    "accept-ranges",
+    "etag",
+    "last-modified",
+]
 
 async def create_record(req: Request):
     data = req.state.body
@@ -22,18 +55,16 @@ async def create_record(req: Request):
 
     })
 
-    apiUrl = f"https://{fm_server}/fmi/data/vLatest/databases/{database}/layouts/{layout}/records"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
+    apiPath = f"databases/{database}/layouts/{layout}/records"
+    record = await checked_record(req, fm_server, database, layout, record)
 
     requestData = {
         "fieldData": record
     }
 
     try:
-        response = requests.post(apiUrl, headers=headers, json=requestData, verify=False)
+        response = await fm_client.post(fm_server, apiPath, token=token, json=requestData)
+        invalidate_reads(fm_server, database, layout)
         response.raise_for_status()
         recordId = response.json().get("response", {}).get("recordId")
         return {
@@ -43,7 +74,7 @@ async def create_record(req: Request):
             "session": token
         }
         
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         raise handle_api_error(e,"An error occurred while creating the record.")
 
 
@@ -65,42 +96,323 @@ async def get_all_records(req: Request):
     })
 
     
-    apiUrl = f"https://{fm_server}/fmi/data/vLatest/databases/{database}/layouts/{layout}/records"
-
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
+    apiPath = f"databases/{database}/layouts/{layout}/records"
 
     query_params = {
         "_offset": offset,
-        "_limit": limit
+        "_limit": limit,
+        "layout.response": method_body.get("layout.response")
     }
+    # GET takes the portal list as a JSON array and the portal windows as _limit.<portal>/_offset.<portal>
+    for key, val in portal_options(method_body).items():
+        query_params["portal" if key == "portal" else "_" + key] = json.dumps(val) if key == "portal" else val
+    query_params = {key: val for key, val in query_params.items() if val is not None}
+    scope = read_scope(req, fm_server, database, layout)
+    shape = record_shaper(method_body)
+    output = record_formats.requested_format(method_body)
+
+    mirrored = await read_from_mirror(req, scope, offset=offset, limit=limit)
+    if mirrored is not None:
+        return await record_formats.render(output, {**mirrored, "session": token})
+
+    slim_layout = await response_layout(req, fm_server, database, layout)
+    if slim_layout is not None:
+        query_params["layout.response"] = slim_layout
+
+    if method_body.get("stream") or method_body.get("parallel"):
+        async def fetch_page(page_offset, page_limit, page_token):
+            page_params = {**query_params, "_offset": page_offset, "_limit": page_limit}
+            return await fetch_records_page("GET", fm_server, apiPath, page_token, "An error occurred while fetching the records.", scope=scope, params=page_params)
+
+        return await record_formats.render(output, await read_all_pages(req, fetch_page, offset, limit))
+
+    page = await fetch_records_page("GET", fm_server, apiPath, token, "An error occurred while fetching the records.", scope=scope, params=query_params)
+    return await record_formats.render(output, records_response(page, page["data"], token, shape))
+
 
+# What identifies a read besides the request itself: the layout and the caller's credentials,
+# since different FileMaker accounts may see different records
+ReadScope = namedtuple("ReadScope", ["layout_key", "credentials", "use_cache", "coalesce"])
+
+
+# A read that runs scripts may change data or depend on more than the layout, so its result is
+# never cached and every caller gets its own upstream call (and script run)
+def read_scope(req: Request, fm_server, database, layout):
+    method_body = req.state.body.get("methodBody", {})
+    _, _, credentials = credentials_key(fm_server, database, req.state.basicAuthToken)
+    scripted = bool(method_body.get("scripts"))
+    use_cache = response_cache.enabled and method_body.get("cache") is not False and not scripted
+    return ReadScope((fm_server, database, layout), credentials, use_cache, not scripted)
+
+
+# Fetches one page of records (getAllRecords or _find) and returns the Data API "response" object.
+# Within a scope, identical reads are answered from the response cache, and identical reads that
+# are already in flight share one upstream call instead of each hitting FileMaker.
+async def fetch_records_page(http_method, fm_server, api_path, token, error_message, scope=None, **kwargs):
+    if scope is None or not scope.coalesce:
+        page, _ = await request_records_page(http_method, fm_server, api_path, token, error_message, **kwargs)
+        return page
+
+    read_key = (*scope.layout_key, scope.credentials, http_method, api_path, json.dumps(kwargs, sort_keys=True, default=str))
+    if scope.use_cache:
+        page = response_cache.get(read_key)
+        if page is not None:
+            return page
+
+    async def read():
+        page, size = await request_records_page(http_method, fm_server, api_path, token, error_message, **kwargs)
+        if scope.use_cache:
+            response_cache.put(read_key, scope.layout_key, page, size)
+        return page
+
+    return await read_flights.do(read_key, read)
+
+
+async def request_records_page(http_method, fm_server, api_path, token, error_message, **kwargs):
     try:
-        response = requests.get(apiUrl, params=query_params, headers=headers, verify=False)
+        response = await fm_client.request(http_method, fm_server, api_path, token=token, **kwargs)
         response.raise_for_status()
-        json_data = response.json()
-        if "messages" in json_data and json_data["messages"][0]["message"] == "OK":
-            # records = [record["fieldData"] for record in response.json()["response"]["data"]]
-            records = [{
-                 "recordId": record["recordId"],
-                 **record["fieldData"]
-                 } for record in json_data["response"]["data"]]
+    except httpx.HTTPStatusError as e:
+        raise handle_api_error(e, error_message)
+    return fast_json.loads(response.content)["response"], len(response.content)
+
+
+# Called after every write on a layout: drops its cached reads and detaches reads already in
+# flight, so nobody who arrives after the write is handed a result fetched before it.
+# A mirrored layout is read from FileMaker again until its next sync.
+def invalidate_reads(fm_server, database, layout, deleted_record_id=None):
+    response_cache.invalidate_layout(fm_server, database, layout)
+    read_flights.forget(lambda read_key: read_key[:3] == (fm_server, database, layout))
+    read_mirrors.note_write(fm_server, database, layout, deleted_record_id)
+
+
+# Options of a read that only FileMaker can answer: portal data, scripts and other layouts' fields
+# are not in the mirror, and it does not stream
+MIRROR_UNSUPPORTED_OPTIONS = ("stream", "parallel", "portal", "layout.response", "scripts")
+
+
+# Serves a getAllRecords/findRecord read with "source": "mirror" from the layout's read mirror.
+# Returns None, for FileMaker to answer, when the layout is not mirrored for the caller, the mirror
+# is not current or the read needs something the mirror cannot translate. Mirror dates are ISO 8601,
+# so only reads asking for "dateformats": 2 can be served; FileMaker defaults to MM/DD/YYYY.
+async def read_from_mirror(req: Request, scope, **read):
+    method_body = req.state.body.get("methodBody", {})
+    if method_body.get("source") != "mirror":
+        return None
+    mirrored = None
+    if not any(method_body.get(key) for key in MIRROR_UNSUPPORTED_OPTIONS) and method_body.get("dateformats") == 2:
+        try:
+            mirrored = await read_mirrors.read(*scope.layout_key, scope.credentials, fields=method_body.get("fields"), **read)
+        except HTTPException:
+            metrics.mirror_reads.inc("mirror")
+            raise
+    metrics.mirror_reads.inc("fallback" if mirrored is None else "mirror")
+    return mirrored
+
+
+# Builds the getAllRecords/findRecord response from a Data API page and its records
+def records_response(page, records, token, shape):
+    record_info = page["dataInfo"]
+    return {
+        "recordInfo": {
+            "table": record_info["table"],
+            "layout": record_info["layout"],
+            "totalRecordCount": record_info["totalRecordCount"],
+            "foundCount": record_info["foundCount"],
+        },
+        "records": [shape(record) for record in records],
+        "session": token
+    }
 
-            record_info = json_data["response"]["dataInfo"]
 
-            return {
-                "recordInfo": {
-                    "table": record_info["table"],
-                    "layout": record_info["layout"],
-                    "totalRecordCount": record_info["totalRecordCount"],
-                    "foundCount": record_info["foundCount"],
-                },
-                "records": records,
-                "session": token
-            }
-    except requests.HTTPError as e:
-        raise handle_api_error(e,"An error occurred while fetching the records.")
+# Returns the function that turns a Data API record into a response record. With "fields" only
+# the listed fields are copied, in that order; with "portal" the rows of the requested portals
+# are added as "portalData".
+def record_shaper(method_body):
+    fields = method_body.get("fields")
+    if fields is not None and (not isinstance(fields, list) or not all(isinstance(name, str) for name in fields)):
+        raise HTTPException(status_code=400, detail="fields must be a list of field names")
+    with_portals = bool(method_body.get("portal"))
+
+    def shape(record):
+        field_data = record["fieldData"]
+        if fields is None:
+            shaped = {"recordId": record["recordId"], **field_data}
+        else:
+            shaped = {"recordId": record["recordId"]}
+            for name in fields:
+                if name in field_data:
+                    shaped[name] = field_data[name]
+        if with_portals:
+            shaped["portalData"] = record.get("portalData", {})
+        return shaped
+
+    return shape
+
+
+# Portal options of a read as named in a Data API _find body: "portal" (the portals to return)
+# and "limit.<portal>"/"offset.<portal>" (the window of related rows per portal)
+def portal_options(method_body):
+    options = {key: val for key, val in method_body.items() if key.startswith(("limit.", "offset."))}
+    if method_body.get("portal") is not None:
+        options["portal"] = method_body["portal"]
+    return {key: val for key, val in options.items() if val is not None}
+
+
+# The slim layout (FM_RESPONSE_LAYOUTS) to read through when the request only asks for `fields`
+# that are all on it, so FileMaker sends fewer fields; None to read through the layout itself
+async def response_layout(req: Request, fm_server, database, layout):
+    method_body = req.state.body.get("methodBody", {})
+    slim_layout = RESPONSE_LAYOUTS.get(layout)
+    fields = method_body.get("fields")
+    if not slim_layout or not fields or method_body.get("layout.response"):
+        return None
+    try:
+        slim_fields = await layout_fields(req, fm_server, database, slim_layout)
+    except HTTPException:
+        return None
+    if all(slim_fields.field(name) is not None for name in fields):
+        return slim_layout
+    return None
+
+
+# Reads an optional whole-number option of at least 1 from methodBody, answering 400 otherwise
+def positive_int(method_body, name, default):
+    value = method_body.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value) if isinstance(value, (int, str)) and not isinstance(value, bool) else 0
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise HTTPException(status_code=400, detail=f"{name} must be a whole number of at least 1")
+    return number
+
+
+# Offsets and sizes of the pages that follow the first one, bounded by the found set and `limit`
+def remaining_pages(offset, limit, found_count, page_size, first_count):
+    last = found_count if limit is None else min(found_count, offset + limit - 1)
+    pages = []
+    page_offset = offset + first_count
+    while page_offset <= last:
+        pages.append((page_offset, min(page_size, last - page_offset + 1)))
+        page_offset += page_size
+    return pages
+
+
+# Fetches pages with up to `parallel` requests in flight and yields them as they become available:
+# in offset order, or in completion order when `ordered` is false. Pages are requested ahead while
+# earlier ones are being consumed, so at most `parallel` + 1 pages are held in memory.
+async def iter_pages(fetch_page, pages, parallel, ordered=True):
+    pending = deque()
+    queued = iter(pages)
+
+    def schedule():
+        for page_offset, page_limit in queued:
+            pending.append(asyncio.ensure_future(fetch_page(page_offset, page_limit)))
+            if len(pending) >= parallel:
+                return
+
+    try:
+        schedule()
+        while pending:
+            if ordered:
+                task = pending.popleft()
+                page = await task
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                task = done.pop()
+                pending.remove(task)
+                page = task.result()
+            schedule()
+            yield page
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# Spreads page requests over pooled sessions of the caller's account when it has a session pool,
+# falling back to the request's own token whenever the pool has no session to spare. Callers
+# without a pool send all of their parallel pages on their one session token.
+def pooled_page_fetcher(req: Request, fetch_page):
+    body = req.state.body
+    database = body.get("methodBody", {}).get("database")
+    pool = session_pools.get(credentials_key(body.get("fmServer"), database, req.state.basicAuthToken))
+    token = req.state.fmSessionToken
+
+    async def fetch(page_offset, page_limit):
+        pooled_session = await pool.acquire_nowait() if pool is not None else None
+        if pooled_session is None:
+            return await fetch_page(page_offset, page_limit, token)
+        discard = False
+        try:
+            return await fetch_page(page_offset, page_limit, pooled_session.token)
+        except HTTPException as e:
+            discard = is_invalid_token_error(e)
+            raise
+        finally:
+            pool.release(pooled_session, discard=discard)
+
+    return fetch
+
+
+# Reads the whole found set (from `offset`, up to `limit` records) page by page.
+# With "stream": true the records are sent as NDJSON, one record per line; otherwise they are
+# returned in the usual JSON shape. "parallel" sets how many pages are fetched concurrently
+# and "ordered": false lets a stream emit pages in completion order.
+async def read_all_pages(req: Request, fetch_page, offset, limit):
+    method_body = req.state.body.get("methodBody", {})
+    token = req.state.fmSessionToken
+    offset = int(offset) if offset else 1
+    limit = int(limit) if limit else None
+    page_size = positive_int(method_body, "pageSize", config.FM_STREAM_PAGE_SIZE)
+    parallel = admitted_width(req, min(positive_int(method_body, "parallel", 1), config.FM_MAX_PARALLEL_PAGES))
+    ordered = method_body.get("ordered", True) is not False
+    fetch = pooled_page_fetcher(req, fetch_page)
+    shape = record_shaper(method_body)
+
+    # The first page is fetched up front: it gives the found count, and errors still
+    # produce a proper status code
+    first_limit = min(page_size, limit) if limit is not None else page_size
+    first_page = await fetch_page(offset, first_limit, token)
+    record_info = first_page["dataInfo"]
+    pages = remaining_pages(offset, limit, record_info["foundCount"], page_size, len(first_page["data"]))
+    if len(first_page["data"]) < first_limit:
+        pages = []
+
+    if not method_body.get("stream"):
+        records = list(first_page["data"])
+        async for page in iter_pages(fetch, pages, parallel):
+            records.extend(page["data"])
+        return records_response(first_page, records, token, shape)
+
+    def ndjson(page):
+        return b"".join(
+            fast_json.dumps(shape(record)) + b"\n"
+            for record in page["data"]
+        )
+
+    async def lines():
+        yield ndjson(first_page)
+        try:
+            async for page in iter_pages(fetch, pages, parallel, ordered):
+                yield ndjson(page)
+        except HTTPException as e:
+            # Headers are already sent, so report the failure in-band as the last line
+            yield fast_json.dumps({"error": e.detail, "statusCode": e.status_code}) + b"\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={
+            "X-Table": str(record_info["table"]),
+            "X-Layout": str(record_info["layout"]),
+            "X-Total-Record-Count": str(record_info["totalRecordCount"]),
+            "X-Found-Count": str(record_info["foundCount"]),
+            "X-Session-Token": token,
+        },
+    )
 
 
 async def update_record(req:Request):
@@ -123,19 +435,16 @@ async def update_record(req:Request):
 
    
 
-    apiUrl = f"https://{fm_server}/fmi/data/vLatest/databases/{database}/layouts/{layout}/records/{record_id}"
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
+    apiPath = f"databases/{database}/layouts/{layout}/records/{record_id}"
+    record = await checked_record(req, fm_server, database, layout, record)
 
     requestData = {
         "fieldData": record
     }
 
     try:
-        response = requests.patch(apiUrl, json=requestData, headers=headers, verify=False)
+        response = await fm_client.patch(fm_server, apiPath, token=token, json=requestData)
+        invalidate_reads(fm_server, database, layout)
         response.raise_for_status()
 
         return {
@@ -144,7 +453,7 @@ async def update_record(req:Request):
             "fieldData": record,
             "session": token
         }
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         raise handle_api_error(e,"An error occurred while updating the record.")
 
 
@@ -170,9 +479,9 @@ async def find_record(req: Request):
         "sort": method_body.get("sort"),
         "limit": method_body.get("limit"),
         "offset": method_body.get("offset"),
-        "portal": method_body.get("portal"),
         "dateformats": method_body.get("dateformats"),
-        "layout.response": method_body.get("layout.response")
+        "layout.response": method_body.get("layout.response"),
+        **portal_options(method_body)
     }
 
     if method_body.get("scripts"):
@@ -187,36 +496,166 @@ async def find_record(req: Request):
         })
     request_body = {key: val for key, val in request_body.items() if val is not None}
 
-    apiUrl = f"https://{fm_server}/fmi/data/vLatest/databases/{database}/layouts/{layout}/_find"
+    apiPath = f"databases/{database}/layouts/{layout}/_find"
+    scope = read_scope(req, fm_server, database, layout)
+    await check_find(req, fm_server, database, layout, request_body.get("query"), request_body.get("sort"), request_body.get("portal"))
+    shape = record_shaper(method_body)
+    output = record_formats.requested_format(method_body)
+
+    mirrored = await read_from_mirror(
+        req, scope, query=request_body.get("query"), sort=request_body.get("sort"),
+        offset=request_body.get("offset"), limit=request_body.get("limit"),
+    )
+    if mirrored is not None:
+        return await record_formats.render(output, {**mirrored, "session": token})
+
+    slim_layout = await response_layout(req, fm_server, database, layout)
+    if slim_layout is not None:
+        request_body["layout.response"] = slim_layout
+
+    if method_body.get("stream") or method_body.get("parallel"):
+        async def fetch_page(page_offset, page_limit, page_token):
+            page_body = {**request_body, "offset": page_offset, "limit": page_limit}
+            return await fetch_records_page("POST", fm_server, apiPath, page_token, "An error occurred while fetching the record.", scope=scope, json=page_body)
+
+        return await record_formats.render(output, await read_all_pages(req, fetch_page, request_body.get("offset"), request_body.get("limit")))
+
+    page = await fetch_records_page("POST", fm_server, apiPath, token, "An error occurred while fetching the record.", scope=scope, json=request_body)
+    return await record_formats.render(output, records_response(page, page["data"], token, shape))
+
+# Returns the records changed since `cursor`: a _find on the modification timestamp field,
+# sorted ascending and read page by page. The new cursor holds the last timestamp returned
+# and the modId of every record returned at that timestamp, so the next call can ask for
+# ">= timestamp" (FileMaker timestamps have one-second resolution) without repeating them.
+async def sync_records(req: Request):
+    data = req.state.body
+    token = req.state.fmSessionToken
+    method_body = data.get("methodBody", {})
+    database = method_body.get("database")
+    layout = method_body.get("layout")
+    fm_server = data.get("fmServer")
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
+    validate_required_params({
+        "fmSessionToken": token,
+        "fmServer": fm_server,
+        "database": database,
+        "layout": layout
+    })
+
+    field = method_body.get("timestampField") or config.FM_SYNC_TIMESTAMP_FIELD
+    limit = min(positive_int(method_body, "limit", config.FM_SYNC_MAX_RECORDS), config.FM_SYNC_MAX_RECORDS)
+    page_size = min(positive_int(method_body, "pageSize", config.FM_STREAM_PAGE_SIZE), limit)
+    since, seen = decode_sync_cursor(method_body.get("cursor"), field)
+    # Never served from the read cache: changes made outside the weaver must show up
+    scope = read_scope(req, fm_server, database, layout)._replace(use_cache=False)
+
+    changes = await read_changes(fm_server, database, layout, token, field, since, seen, limit, page_size, scope=scope)
+    return {
+        "records": [{"recordId": record["recordId"], "modId": record["modId"], **record["fieldData"]} for record in changes.records],
+        "cursor": encode_sync_cursor(field, changes.since, changes.seen) if changes.since else method_body.get("cursor"),
+        "hasMore": changes.has_more,
+        "session": token
     }
 
+
+# Result of read_changes: the changed Data API records, the new (since, seen) cursor position,
+# whether more changes are waiting, the dataInfo of the last page read (None when none matched)
+# and the foundCount of the first page, i.e. how many records had changed when the read began
+Changes = namedtuple("Changes", ["records", "since", "seen", "has_more", "data_info", "found_count"])
+
+
+# Reads up to `limit` records changed since the (since, seen) cursor position, `page_size` at a time.
+# Pages are not read by offset: a record edited during the read moves to the end of the sort
+# order and would shift every later record down one place. Each page is a new ">= last
+# timestamp" find instead, and the records already returned at that timestamp, which come first,
+# are skipped (the page asks for that many more records).
+async def read_changes(fm_server, database, layout, token, field, since, seen, limit, page_size, scope=None):
+    apiPath = f"databases/{database}/layouts/{layout}/_find"
+
+    records = []
+    last = since
+    boundary = dict(seen)
+    has_more = False
+    data_info = None
+    found_count = None
+    while True:
+        page_limit = min(page_size, limit - len(records) + 1) + len(boundary)
+        request_body = {
+            # "*" matches every record with a timestamp on the first sync
+            "query": [{field: f">={last}" if last else "*"}],
+            "sort": [{"fieldName": field, "sortOrder": "ascend"}],
+            # ISO 8601 timestamps sort as text and round-trip through the cursor unchanged
+            "dateformats": 2,
+            "offset": 1,
+            "limit": page_limit,
+        }
+        try:
+            page = await fetch_records_page(
+                "POST", fm_server, apiPath, token, "An error occurred while syncing the records.",
+                scope=scope, json=request_body,
+            )
+        except HTTPException as e:
+            if is_no_records_error(e):
+                break
+            raise
+        data_info = page["dataInfo"]
+        if found_count is None:
+            found_count = data_info["foundCount"]
+        page_since = last
+        added = 0
+        for record in page["data"]:
+            stamp = record["fieldData"].get(field)
+            if stamp == page_since and boundary.get(record["recordId"]) == record["modId"]:
+                continue
+            if len(records) >= limit:
+                has_more = True
+                break
+            records.append(record)
+            added += 1
+            if stamp != last:
+                last = stamp
+                boundary = {}
+            boundary[record["recordId"]] = record["modId"]
+        if has_more or len(page["data"]) >= data_info["foundCount"]:
+            break
+        if not added:
+            # The host returned fewer records than asked for, all of them already seen: stop
+            # rather than asking again for the same page
+            has_more = True
+            break
+
+    return Changes(records, last, boundary, has_more, data_info, found_count)
+
+
+# Layouts mirrored locally (FM_READ_MIRRORS), kept current with read_changes
+read_mirrors = ReadMirrorManager(fm_login, read_changes)
+
+
+def encode_sync_cursor(field, since, seen):
+    state = json.dumps({"field": field, "since": since, "seen": seen}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(state.encode("utf-8")).decode("ascii")
+
+
+# Returns (timestamp, {recordId: modId}) from a cursor, or (None, {}) for a first sync
+def decode_sync_cursor(cursor, field):
+    if not cursor:
+        return None, {}
     try:
-        response = requests.post(apiUrl, json=request_body, headers=headers, verify=False)
-        response.raise_for_status()
-        json_data = response.json()
-        if "messages" in json_data  and json_data["messages"][0]["message"] == "OK":
-            records = [{
-                 "recordId": record["recordId"],
-                 **record["fieldData"]
-                 } for record in json_data["response"]["data"]]
-            record_info = json_data["response"]["dataInfo"]
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        since, seen = state["since"], state["seen"]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+    if state.get("field") != field:
+        raise HTTPException(status_code=400, detail=f"The sync cursor was issued for field '{state.get('field')}'")
+    return since, seen
+
+
+# FileMaker answers a find without matches with error 401 "No records match the request"
+def is_no_records_error(error: HTTPException):
+    detail = error.detail if isinstance(error.detail, dict) else {}
+    messages = detail.get("messages") or [{}]
+    return str(messages[0].get("code")) == "401"
 
-            return {
-                "recordInfo": {
-                    "table": record_info["table"],
-                    "layout": record_info["layout"],
-                    "totalRecordCount": record_info["totalRecordCount"],
-                    "foundCount": record_info["foundCount"],
-                },
-                "records": records,
-                "session": token
-            }
-    except requests.HTTPError as e:
-        raise handle_api_error(e,"An error occurred while fetching the record.")
 
 async def delete_record(req: Request):
     data = req.state.body
@@ -239,14 +678,11 @@ async def delete_record(req: Request):
     if not all([database, layout, record_id, fm_server]):
         raise HTTPException(status_code=400, detail="Missing required parameters")
 
-    apiUrl = f"https://{fm_server}/fmi/data/vLatest/databases/{database}/layouts/{layout}/records/{record_id}"
-
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
+    apiPath = f"databases/{database}/layouts/{layout}/records/{record_id}"
 
     try:
-        response = requests.delete(apiUrl, headers=headers, verify=False)
+        response = await fm_client.delete(fm_server, apiPath, token=token)
+        invalidate_reads(fm_server, database, layout, record_id if response.status_code == 200 else None)
         response.raise_for_status()
 
         return {
@@ -255,7 +691,7 @@ async def delete_record(req: Request):
             "session": token
         }
 
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         raise handle_api_error(e,"An error occurred while deleting the record.")
  
 async def upload_container(req: Request):
@@ -263,13 +699,8 @@ async def upload_container(req: Request):
         file_info = getattr(req.state, "file", None)
         if not file_info:
             raise HTTPException(status_code=400, detail="No file uploaded")
-        file_content = file_info["data"]
         file_name = file_info["filename"]
         file_type = file_info["content_type"]
-
-        files = {
-            'upload': (file_name, file_content, file_type)
-        }
         data = req.state.body
         token =   req.state.fmSessionToken 
         fm_server = data.get("fmServer")
@@ -288,19 +719,21 @@ async def upload_container(req: Request):
             "fieldName": field_name,
         })
 
-        api_url = f"https://{fm_server}/fmi/data/vLatest/databases/{database}/layouts/{layout}/records/{record_id}/containers/{field_name}"
+        api_path = f"databases/{database}/layouts/{layout}/records/{record_id}/containers/{field_name}"
 
-        headers = {
-            "Authorization": f"Bearer {token}"
-        }
+        # The upload is streamed chunk by chunk from the incoming request into FileMaker,
+        # so memory use does not grow with the file size
+        upload_content_type, upload_body = multipart_file_body("upload", file_name, file_type, file_info["stream"])
 
         try:
-            response = requests.post(
-                    api_url,
-                    files=files,
-                    headers=headers,
-                    verify=False 
+            response = await fm_client.post(
+                    fm_server,
+                    api_path,
+                    token=token,
+                    headers={"Content-Type": upload_content_type},
+                    content=upload_body
             )
+            invalidate_reads(fm_server, database, layout)
             response.raise_for_status()
 
             return {
@@ -311,10 +744,71 @@ async def upload_container(req: Request):
                     "session": token
             }
 
-        except requests.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             raise handle_api_error(e,"An error occurred while uploading the file.")
 
     except Exception as e:
 
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+
+
+async def download_container(req: Request):
+    data = req.state.body
+    token =   req.state.fmSessionToken
+    fm_server = data.get("fmServer")
+    method_body = data.get("methodBody", {})
+    database = method_body.get("database")
+    layout = method_body.get("layout")
+    record_id = method_body.get("recordId")
+    field_name = method_body.get("fieldName")
+
+    validate_required_params({
+        "fmSessionToken": token,
+        "fmServer": fm_server,
+        "database": database,
+        "layout": layout,
+        "recordId": record_id,
+        "fieldName": field_name,
+    })
+
+    apiPath = f"databases/{database}/layouts/{layout}/records/{record_id}"
+
+    try:
+        response = await fm_client.get(fm_server, apiPath, token=token)
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        raise handle_api_error(e,"An error occurred while fetching the record.")
+
+    record = fast_json.loads(response.content)["response"]["data"][0]
+    if field_name not in record["fieldData"]:
+        raise HTTPException(status_code=400, detail=f"Field '{field_name}' is not on layout '{layout}'")
+    container_url = record["fieldData"][field_name]
+    if not container_url:
+        raise HTTPException(status_code=404, detail=f"Container field '{field_name}' is empty")
+
+    # Forward byte ranges so clients can resume or seek within large files
+    range_header = req.headers.get("Range") or method_body.get("range")
+    upstream_headers = {"Range": range_header} if range_header else {}
+
+    container_response = await fm_client.stream_url(container_url, headers=upstream_headers)
+    if container_response.status_code not in (200, 206):
+        await container_response.aclose()
+        raise HTTPException(status_code=container_response.status_code, detail="An error occurred while downloading the container data.")
+
+    headers = {
+        name: container_response.headers[name]
+        for name in CONTAINER_RESPONSE_HEADERS
+        if name in container_response.headers
+    }
+    media_type = container_response.headers.get("content-type")
+    if not media_type or media_type == "application/octet-stream":
+        media_type = mimetypes.guess_type(httpx.URL(container_url).path)[0] or "application/octet-stream"
+
+    # Bytes are relayed as they arrive, so memory does not grow with the file size
+    return StreamingResponse(
+        close_after(container_response.aiter_raw(config.FM_UPLOAD_CHUNK_SIZE), container_response.aclose),
+        status_code=container_response.status_code,
+        headers=headers,
+        media_type=media_type,
+    )
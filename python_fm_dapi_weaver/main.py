@@ -1,60 +1,92 @@
-from fastapi import FastAPI, APIRouter,HTTPException,UploadFile
-from starlette.responses import Response
-from .routes.index import router
-import json
+import os
+import shutil
+import sys
+import tempfile
+from fastapi import FastAPI, APIRouter,HTTPException
+from contextlib import asynccontextmanager
+from .routes.index import router, metrics_route
+from .utils.fm_client import fm_client
+from .controllers.auth import session_pools
+from .controllers.records import read_mirrors
+from .utils.session_cache import session_cache
+from .utils.compression import CompressionMiddleware
+from . import config
 
 
-app = FastAPI()
+# Opens shared resources on startup and releases them on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sign in the configured service account sessions
+    await session_pools.start()
+    # Start syncing the configured read mirrors
+    await read_mirrors.start()
+    yield
+    # Stop the mirror syncs, sign out pooled sessions, then close the pooled FileMaker connections
+    await read_mirrors.close()
+    await session_pools.close()
+    await fm_client.close()
+    if session_cache.store is not None:
+        session_cache.store.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Compress dataApi responses for clients that accept gzip, brotli or zstd
+app.add_middleware(
+    CompressionMiddleware,
+    encodings=[encoding.strip() for encoding in config.FM_COMPRESSION_ENCODINGS.split(",") if encoding.strip()],
+    minimum_size=config.FM_COMPRESSION_MIN_SIZE,
+    paths=("/api/dataApi",),
+)
 
 app.include_router(router, prefix="/api")
+# Also at /metrics, the path Prometheus scrapes by default
+app.add_api_route("/metrics", metrics_route, methods=["GET"])
 
 # Routes
 @app.get("/")
 async def home():
     return "server is running"
 
-# Middleware to parse request body
-@app.middleware("http")
-async def body_parser(request, call_next):
-    content_type = request.headers.get("Content-Type", "")
-
-    if "application/json" in content_type:
-
-        # Parse the request body once and store it in request.state for easy access throughout the request 
-        request.state.body = await request.json()
-        
-    elif "multipart/form-data" in content_type:
-        form = await request.form()
-
-        json_data = form.get("data")
-        if not json_data:
-            raise HTTPException(status_code=400, detail="Missing 'data' in form")
-        try:
-            request.state.body = json.loads(json_data)
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=400, detail="Invalid JSON in 'data'")
-        file: UploadFile = form.get("file")
-        
-        if not file:
-            raise HTTPException(status_code=400, detail="No file provided")
-        else:
-            
-            try:
-                contents = await file.read()
-                request.state.file = {
-                    "filename": file.filename,
-                    "content_type": file.content_type,
-                    "data": contents
-                }            
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Failed to read file: {str(e)}")
-            
-    return await call_next(request)
-
-
-def start_server(host="127.0.0.1", port=8000, reload=False):
+
+# Development: one process, optionally reloading on code changes.
+# Production: `workers` processes (FM_WORKERS or the CPU count) with tuned socket settings,
+# uvloop/httptools when installed, and a graceful drain of in-flight requests on SIGTERM.
+def start_server(host="127.0.0.1", port=8000, reload=False, production=False, workers=None):
     import uvicorn
-    uvicorn.run("python_fm_dapi_weaver.main:app", host=host, port=port, reload=reload) 
+    if not production:
+        uvicorn.run("python_fm_dapi_weaver.main:app", host=host, port=port, reload=reload)
+        return
+
+    workers = workers or config.FM_WORKERS or os.cpu_count() or 1
+    # Workers split the session pool sizes between them and share session tokens through SQLite
+    os.environ["FM_WORKER_COUNT"] = str(workers)
+    store_dir = None
+    if workers > 1 and not config.FM_SESSION_STORE:
+        # The store lives in a directory only this user can enter (mkdtemp creates it with mode
+        # 0700), made here before the workers start so no other local user can plant or read it
+        store_dir = tempfile.mkdtemp(prefix="fm-dapi-weaver-")
+        os.environ["FM_SESSION_STORE"] = os.path.join(store_dir, "sessions.sqlite3")
+
+    try:
+        uvicorn.run(
+            "python_fm_dapi_weaver.main:app",
+            host=host,
+            port=port,
+            workers=workers,
+            backlog=config.FM_BACKLOG,
+            timeout_keep_alive=config.FM_KEEPALIVE_TIMEOUT,
+            limit_concurrency=config.FM_LIMIT_CONCURRENCY or None,
+            timeout_graceful_shutdown=config.FM_GRACEFUL_TIMEOUT,
+            # "auto" picks uvloop and httptools when they are installed
+            loop="auto",
+            http="auto",
+        )
+    finally:
+        if store_dir is not None:
+            shutil.rmtree(store_dir, ignore_errors=True)
+
 
 if __name__ == "__main__":
-    start_server(reload=True)  
\ No newline at end of file
+    production = "--production" in sys.argv[1:]
+    start_server(reload=not production, production=production)
@@ -1,9 +1,97 @@
-from fastapi import APIRouter, Request, Response
-from ..controllers.index import data_api
+import time
+from fastapi import APIRouter, HTTPException, Request, Response
+from starlette.responses import StreamingResponse
+from ..controllers.index import data_api, METHOD_HANDLERS
+from ..controllers.auth import session_pools
+from ..controllers.records import read_mirrors
+from ..utils.fm_client import fm_client
+from ..utils.session_cache import session_cache
+from ..utils.response_cache import response_cache
+from ..utils.layout_metadata import layout_metadata
+from ..utils.fast_json import FastJSONResponse
+from ..utils.concurrency_limiter import concurrency_limiter
+from ..utils.streaming import close_after
+from ..utils import metrics, tracing
+from .. import config
 
 router = APIRouter()
 
 @router.post("/dataApi")
 # Forwards the request to the data_api controller
 async def data_api_route(req: Request, res: Response):
-    return await data_api(req, res)
\ No newline at end of file
+    started = time.perf_counter()
+    trace = tracing.start_trace()
+    metrics.requests_in_flight.inc()
+    try:
+        response = await data_api(req, res)
+        if not isinstance(response, Response):
+            # Controller results are plain JSON data, so they are serialized as they are
+            # instead of being walked by jsonable_encoder first
+            with tracing.phase("serialize"):
+                response = FastJSONResponse(response)
+    except BaseException as error:
+        metrics.requests_in_flight.dec()
+        status = error.status_code if isinstance(error, HTTPException) else 500
+        metrics.observe_request(metric_method(req), status, started, request_size(req), 0)
+        if trace is not None:
+            trace.log(getattr(req.state, "body", None), status)
+        raise
+
+    if trace is not None and config.FM_SERVER_TIMING:
+        response.headers["Server-Timing"] = trace.server_timing()
+    if isinstance(response, StreamingResponse):
+        response.body_iterator = metrics.observe_stream(
+            response.body_iterator, metric_method(req), response.status_code, started, request_size(req)
+        )
+        if trace is not None:
+            # Streamed bodies are logged once the last chunk is sent
+            response.body_iterator = close_after(
+                response.body_iterator, lambda: trace.log(req.state.body, response.status_code)
+            )
+    else:
+        metrics.requests_in_flight.dec()
+        metrics.observe_request(metric_method(req), response.status_code, started, request_size(req), len(response.body))
+        if trace is not None:
+            trace.log(req.state.body, response.status_code)
+    return response
+
+
+# Label for the request metrics; unknown methods share one label to keep the series bounded
+def metric_method(req: Request):
+    body = getattr(req.state, "body", None) or {}
+    method = body.get("method")
+    return method if method in METHOD_HANDLERS else "invalid"
+
+
+def request_size(req: Request):
+    content_length = req.headers.get("Content-Length", "")
+    return int(content_length) if content_length.isdigit() else 0
+
+
+# Prometheus metrics: request counts and latencies per method, FileMaker call latencies per phase,
+# cache and pool counters, in-flight gauges and payload sizes
+@router.get("/metrics")
+async def metrics_route():
+    state = metrics.state_lines(
+        session_cache.stats(),
+        response_cache.stats(),
+        session_pools.stats(),
+        fm_client.stats(),
+        concurrency_limiter.stats(),
+    )
+    return Response(metrics.render(state), media_type=metrics.CONTENT_TYPE)
+
+
+# Cache hit/miss counters, session pool occupancy / wait-time statistics, circuit breaker states
+# per-host concurrency queues, read mirror sync state and the layout metadata cache
+@router.get("/stats")
+async def stats_route():
+    return {
+        "sessionCache": session_cache.stats(),
+        "sessionPools": session_pools.stats(),
+        "responseCache": response_cache.stats(),
+        "circuitBreakers": fm_client.stats(),
+        "concurrency": concurrency_limiter.stats(),
+        "readMirrors": read_mirrors.stats(),
+        "layoutMetadata": layout_metadata.stats(),
+    }
@@ -0,0 +1,79 @@
+import math
+import time
+from fastapi import HTTPException
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(HTTPException):
+    # Raised instead of calling a FileMaker host whose circuit is open
+
+    def __init__(self, fm_server, retry_after):
+        super().__init__(
+            status_code=503,
+            detail=f"FileMaker Server {fm_server} is unavailable, retry later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+class CircuitBreaker:
+    # Tracks the health of one fmServer. Closed: calls pass. Open: calls fail fast until
+    # `reset_timeout` has passed. Half-open: one probe call passes; its outcome closes the
+    # circuit again or re-opens it, and other calls keep failing fast meanwhile.
+
+    def __init__(self, fm_server, failure_threshold, reset_timeout):
+        self.fm_server = fm_server
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def enabled(self):
+        return self.failure_threshold > 0
+
+    # Call before each upstream request; raises CircuitOpenError while the host is considered down
+    def before_call(self):
+        if not self.enabled or self.state == CLOSED:
+            return
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        if self.state == OPEN and remaining <= 0:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.fm_server, max(remaining, 1))
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.enabled and self.failures >= self.failure_threshold):
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.trips += 1
+        self.probing = False
+
+    # The call let through by before_call() ended without telling anything about the host
+    # (e.g. it was cancelled), so the next call may probe instead
+    def abandon(self):
+        self.probing = False
+
+    def stats(self):
+        return {
+            "fmServer": self.fm_server,
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
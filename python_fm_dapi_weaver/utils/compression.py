@@ -0,0 +1,179 @@
+import asyncio
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+try:
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None
+
+# Content types worth compressing; container downloads and Parquet are sent as they are
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/vnd.apache.arrow.stream",
+    "text/",
+)
+# Bodies this large are compressed off the event loop (zlib, brotli and zstd release the GIL)
+THREAD_THRESHOLD = 256 * 1024
+
+
+# Compressors share one interface: compress() returns everything produced for a chunk, flushed so
+# a streamed chunk reaches the client right away, and finish() ends the stream. Levels favour speed.
+
+class GzipCompressor:
+    def __init__(self):
+        self._compressor = zlib.compressobj(5, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+COMPRESSORS = {"gzip": GzipCompressor}
+if brotli is not None:
+    COMPRESSORS["br"] = BrotliCompressor
+if zstandard is not None:
+    COMPRESSORS["zstd"] = ZstdCompressor
+
+
+# Picks the first of `encodings` (server preference) the client accepts with a non-zero q-value
+def negotiate(accept_encoding, encodings):
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in encodings:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0 and encoding in COMPRESSORS:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    # Compresses responses of the given path prefixes with gzip, brotli or zstd, as negotiated
+    # through Accept-Encoding. Complete bodies under `minimum_size` bytes are sent as they are;
+    # streamed bodies are compressed chunk by chunk, each one flushed to the client.
+
+    def __init__(self, app, encodings=("zstd", "br", "gzip"), minimum_size=1024, paths=("/",)):
+        self.app = app
+        self.encodings = tuple(encodings)
+        self.minimum_size = minimum_size
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await CompressedResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class CompressedResponder:
+    def __init__(self, app, encoding, minimum_size):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            # Ranges (206, Content-Range) count bytes of the uncompressed body, so they are sent as is
+            self.passthrough = (
+                "content-encoding" in headers
+                or "content-range" in headers
+                or message["status"] == 206
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            )
+            if self.passthrough:
+                await self.send(message)
+            else:
+                # Held back until the first body chunk shows whether compressing is worth it
+                self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self.compressor = COMPRESSORS[self.encoding]()
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body:
+                body = await self._compress(body, finish=True)
+                headers["Content-Length"] = str(len(body))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            del headers["Content-Length"]
+            await self.send(start)
+
+        body = await self._compress(body, finish=not more_body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def _compress(self, body, finish):
+        def run():
+            data = self.compressor.compress(body) if body else b""
+            return data + self.compressor.finish() if finish else data
+
+        if len(body) >= THREAD_THRESHOLD:
+            return await asyncio.to_thread(run)
+        return run()
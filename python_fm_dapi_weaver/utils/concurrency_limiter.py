@@ -0,0 +1,182 @@
+import asyncio
+import json
+from collections import OrderedDict, deque
+from fastapi import HTTPException
+from .. import config
+
+# Interactive reads go ahead of bulk writes when a host is saturated
+DEFAULT_METHOD_PRIORITIES = {
+    "signin": 0,
+    "signout": 0,
+    "findRecord": 0,
+    "getAllRecords": 0,
+    "downloadContainer": 0,
+    "getLayoutMetadata": 0,
+    "createRecord": 1,
+    "updateRecord": 1,
+    "deleteRecord": 1,
+    "uploadContainer": 1,
+    "batch": 1,
+    "syncRecords": 1,
+}
+
+
+class Slot:
+    # One admitted request, holding `weight` units of its host's limit; release() hands them to
+    # the requests queued next
+    def __init__(self, limiter, weight=1):
+        self.limiter = limiter
+        self.weight = weight
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter._release(self.weight)
+
+
+class HostLimiter:
+    # Caps concurrent upstream calls for one FileMaker host (or database). A request that fans
+    # out (a batch, a parallel read) is admitted with a weight of as many calls as it runs at once.
+    # Waiting requests are grouped by priority class, then by caller; the highest class is served
+    # first and its callers take turns, so one client flooding the queue cannot starve the others.
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.timeouts = 0
+        self.max_queued = 0
+        self._queues = {}
+
+    async def acquire(self, caller, priority, timeout, weight=1):
+        weight = max(1, min(weight, self.limit))
+        if self.active + weight <= self.limit and not self.queued:
+            self.active += weight
+            self.admitted += 1
+            return Slot(self, weight)
+
+        waiter = asyncio.get_running_loop().create_future()
+        callers = self._queues.setdefault(priority, OrderedDict())
+        callers.setdefault(caller, deque()).append((waiter, weight))
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except BaseException as error:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended: pass it on
+                self._release(weight)
+            else:
+                waiter.cancel()
+                self._forget(priority, caller, waiter)
+                # A wide request leaving the head of the queue may let narrower ones in
+                self._admit()
+            if isinstance(error, asyncio.TimeoutError):
+                self.timeouts += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"Too many concurrent requests for {self.name}, retry later",
+                    headers={"Retry-After": "1"},
+                )
+            raise
+        self.admitted += 1
+        return Slot(self, weight)
+
+    def _forget(self, priority, caller, waiter):
+        callers = self._queues.get(priority)
+        waiters = callers.get(caller) if callers else None
+        entry = next((entry for entry in waiters if entry[0] is waiter), None) if waiters else None
+        if entry is None:
+            return
+        waiters.remove(entry)
+        self.queued -= 1
+        if not waiters:
+            del callers[caller]
+        if not callers:
+            del self._queues[priority]
+
+    def _release(self, weight):
+        self.active -= weight
+        self._admit()
+
+    # Admits queued requests in turn while the next one fits; it is not overtaken by narrower
+    # requests, so a wide request waits for capacity instead of starving
+    def _admit(self):
+        while self._queues:
+            priority = min(self._queues)
+            callers = self._queues[priority]
+            caller, waiters = next(iter(callers.items()))
+            waiter, weight = waiters[0]
+            if self.active + weight > self.limit:
+                return
+            waiters.popleft()
+            self.queued -= 1
+            # Round robin: the caller goes to the back of its class
+            del callers[caller]
+            if waiters:
+                callers[caller] = waiters
+            if not callers:
+                del self._queues[priority]
+            self.active += weight
+            waiter.set_result(None)
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "maxQueued": self.max_queued,
+            "admitted": self.admitted,
+            "timeouts": self.timeouts,
+        }
+
+
+class ConcurrencyLimiter:
+    # One HostLimiter per fmServer, or per (fmServer, database) with FM_CONCURRENCY_PER_DATABASE
+
+    def __init__(self, default_limit, host_limits, per_database, queue_timeout, method_priorities):
+        self.default_limit = default_limit
+        self.host_limits = host_limits
+        self.per_database = per_database
+        self.queue_timeout = queue_timeout
+        self.method_priorities = {**DEFAULT_METHOD_PRIORITIES, **method_priorities}
+        self._limiters = {}
+
+    def priority_for(self, method):
+        return self.method_priorities.get(method, 1)
+
+    # Returns a Slot to release when the request is done, or None when the host has no limit.
+    # `width` is how many upstream calls the request runs at once.
+    async def acquire(self, fm_server, database, caller, method, width=1):
+        limit = self.host_limits.get(fm_server, self.default_limit)
+        if limit <= 0 or not fm_server:
+            return None
+        key = (fm_server, database) if self.per_database else (fm_server,)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = HostLimiter("/".join(str(part) for part in key), limit)
+            self._limiters[key] = limiter
+        return await limiter.acquire(caller, self.priority_for(method), self.queue_timeout, width)
+
+    def stats(self):
+        return [limiter.stats() for limiter in self._limiters.values()]
+
+
+# How many of `width` upstream calls a request may run at once: the width its slot was admitted
+# with, which is never more than the host's limit
+def admitted_width(req, width):
+    slot = getattr(req.state, "fmConcurrencySlot", None)
+    return width if slot is None else min(width, slot.weight)
+
+
+concurrency_limiter = ConcurrencyLimiter(
+    config.FM_HOST_CONCURRENCY,
+    json.loads(config.FM_HOST_CONCURRENCY_LIMITS or "{}"),
+    config.FM_CONCURRENCY_PER_DATABASE,
+    config.FM_CONCURRENCY_QUEUE_TIMEOUT,
+    json.loads(config.FM_METHOD_PRIORITIES or "{}"),
+)
@@ -0,0 +1,77 @@
+import json
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+from .. import config
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+try:
+    import msgspec
+except ModuleNotFoundError:
+    msgspec = None
+
+
+# JSON codec used on the hot paths. Every backend takes str or bytes, produces compact UTF-8 bytes
+# and raises ValueError on malformed input, so callers do not depend on which one is active.
+
+def _select_backend(name):
+    if name == "auto":
+        name = "orjson" if orjson is not None else "msgspec" if msgspec is not None else "json"
+    if name == "orjson" and orjson is None or name == "msgspec" and msgspec is None:
+        raise RuntimeError(f"FM_JSON_BACKEND={name} but {name} is not installed")
+    if name not in ("orjson", "msgspec", "json"):
+        raise RuntimeError(f"Unknown FM_JSON_BACKEND {name}")
+    return name
+
+
+BACKEND = _select_backend(config.FM_JSON_BACKEND)
+
+if BACKEND == "orjson":
+    # orjson.JSONDecodeError is a ValueError, and a TypeError is raised for unsupported types
+    loads = orjson.loads
+    _dumps = orjson.dumps
+elif BACKEND == "msgspec":
+    _decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder()
+
+    def loads(data):
+        try:
+            return _decoder.decode(data)
+        except msgspec.DecodeError as error:
+            raise ValueError(str(error)) from None
+
+    def _dumps(obj):
+        try:
+            return _encoder.encode(obj)
+        except msgspec.EncodeError as error:
+            raise TypeError(str(error)) from None
+else:
+    loads = json.loads
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+if BACKEND == "json":
+    _dumps = _stdlib_dumps
+
+
+# Serializes plain JSON data directly; anything else (models, dates, sets, ...) goes through
+# FastAPI's jsonable_encoder and the standard library, like a regular route return value would
+def dumps(obj):
+    try:
+        return _dumps(obj)
+    except (TypeError, ValueError):
+        return _stdlib_dumps(jsonable_encoder(obj))
+
+
+class FastJSONResponse(JSONResponse):
+    # JSONResponse rendered with the selected backend. Returning it from a route skips FastAPI's
+    # recursive jsonable_encoder pass, which is the costly part for large record pages.
+
+    def render(self, content):
+        return dumps(content)
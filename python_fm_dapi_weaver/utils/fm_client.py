@@ -0,0 +1,289 @@
+import asyncio
+import random
+import time
+import httpx
+from collections import OrderedDict
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from fastapi import HTTPException
+from .. import config
+from .session_cache import session_cache, is_invalid_token_response
+from .circuit_breaker import CircuitBreaker
+from . import metrics, tracing
+
+FM_API_PATH = "/fmi/data/vLatest"
+
+# Answers that mean the host could not take the call right now, and FileMaker's
+# "Exceeded host's capacity" error code
+UNAVAILABLE_STATUS_CODES = {502, 503, 504}
+BUSY_ERROR_CODES = {"812"}
+# Data API options that run a script as part of a call
+SCRIPT_OPTIONS = ("script", "script.prerequest", "script.presort")
+
+# Transport errors raised before any part of the request reached the server.
+# PoolTimeout is left out: it means our own connection pool is exhausted, not that the host is down.
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def default_limits():
+    return httpx.Limits(
+        max_connections=config.FM_MAX_CONNECTIONS,
+        max_keepalive_connections=config.FM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.FM_KEEPALIVE_EXPIRY,
+    )
+
+
+def default_timeout():
+    return httpx.Timeout(
+        connect=config.FM_CONNECT_TIMEOUT,
+        read=config.FM_READ_TIMEOUT,
+        write=config.FM_WRITE_TIMEOUT,
+        pool=config.FM_POOL_TIMEOUT,
+    )
+
+
+# The Data API authenticates with bearer tokens, so the shared clients never store cookies.
+# This keeps one caller's container-streaming cookie from leaking into another caller's request.
+def no_cookies():
+    return CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+
+
+# Reads can be repeated safely; a _find is a POST that only reads. A read that runs a script
+# (given in its JSON body or query parameters) may change data, so it is treated as a write.
+def is_idempotent(method, path, json=None, params=None):
+    for options in (json, params):
+        if isinstance(options, dict) and any(options.get(key) for key in SCRIPT_OPTIONS):
+            return False
+    return method in ("GET", "HEAD", "OPTIONS") or (method == "POST" and path.rstrip("/").endswith("/_find"))
+
+
+def is_busy_response(response):
+    if response.status_code in UNAVAILABLE_STATUS_CODES:
+        return True
+    if response.status_code != 500:
+        return False
+    try:
+        messages = response.json().get("messages") or [{}]
+    except ValueError:
+        return False
+    return str(messages[0].get("code")) in BUSY_ERROR_CODES
+
+
+# Full jitter: a random delay up to the exponential backoff, so clients retrying the same
+# outage do not come back in lockstep
+def retry_delay(attempt):
+    return random.uniform(0, min(config.FM_RETRY_MAX_BACKOFF, config.FM_RETRY_BACKOFF * 2 ** (attempt - 1)))
+
+
+# Body of a streamed response that gives its client back once the response is closed
+class CheckedOutStream(httpx.AsyncByteStream):
+    def __init__(self, stream, checkin):
+        self.stream = stream
+        self.checkin = checkin
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            await self.checkin()
+
+
+class FileMakerClient:
+    # Shared async transport for every call the controllers make to the FileMaker Data API.
+    # Each fmServer gets its own keep-alive connection pool, so TLS handshakes are paid once per
+    # connection instead of once per request. fmServer comes from the request body, so only the
+    # `max_hosts` most recently used pools are kept: an evicted pool is closed as soon as no call
+    # is using it any more.
+
+    def __init__(self, verify=None, timeout=None, limits=None, transport=None, max_hosts=None):
+        self.verify = config.FM_VERIFY_SSL if verify is None else verify
+        self.timeout = timeout or default_timeout()
+        self.limits = limits or default_limits()
+        self.transport = transport
+        self.max_hosts = config.FM_MAX_HOSTS if max_hosts is None else max_hosts
+        self._clients = OrderedDict()
+        self._breakers = OrderedDict()
+        # Calls using each client, and evicted clients (with their host) waiting for their last call
+        self._users = {}
+        self._retired = {}
+
+    def client_for(self, fm_server):
+        client = self._clients.get(fm_server)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=f"{config.FM_URL_SCHEME}://{fm_server}{FM_API_PATH}/",
+                verify=self.verify,
+                timeout=self.timeout,
+                limits=self.limits,
+                transport=self.transport,
+                cookies=no_cookies(),
+            )
+            self._clients[fm_server] = client
+        self._clients.move_to_end(fm_server)
+        while len(self._clients) > max(1, self.max_hosts):
+            evicted_server, evicted = self._clients.popitem(last=False)
+            self._retired[evicted] = evicted_server
+        return client
+
+    def breaker_for(self, fm_server):
+        breaker = self._breakers.get(fm_server)
+        if breaker is None:
+            breaker = CircuitBreaker(fm_server, config.FM_BREAKER_FAILURES, config.FM_BREAKER_RESET_TIMEOUT)
+            self._breakers[fm_server] = breaker
+        self._breakers.move_to_end(fm_server)
+        while len(self._breakers) > max(1, self.max_hosts):
+            self._breakers.popitem(last=False)
+        return breaker
+
+    # Takes the host's client for one call, which must give it back with checkin()
+    def checkout(self, fm_server):
+        client = self.client_for(fm_server)
+        self._users[client] = self._users.get(client, 0) + 1
+        return client
+
+    async def checkin(self, client):
+        users = self._users.pop(client) - 1
+        if users:
+            self._users[client] = users
+        for retired, fm_server in list(self._retired.items()):
+            if retired in self._users:
+                continue
+            del self._retired[retired]
+            await retired.aclose()
+            if fm_server not in self._clients:
+                metrics.upstream_in_flight.remove(fm_server)
+
+    async def request(self, method, fm_server, path, token=None, headers=None, **kwargs):
+        request_headers = {}
+        if token:
+            request_headers["Authorization"] = f"Bearer {token}"
+        if headers:
+            request_headers.update(headers)
+
+        phase = metrics.upstream_phase(method, path)
+        started = time.perf_counter()
+        client = self.checkout(fm_server)
+        metrics.upstream_in_flight.inc(fm_server)
+        response = None
+        try:
+            with tracing.phase("upstream"):
+                response = await self._send(method, client, fm_server, path, request_headers, **kwargs)
+        finally:
+            metrics.upstream_in_flight.dec(fm_server)
+            metrics.upstream_duration.observe(time.perf_counter() - started, phase)
+            metrics.upstream_requests_total.inc(phase, str(response.status_code) if response is not None else "error")
+            if response is not None:
+                metrics.upstream_response_bytes.inc(phase, amount=len(response.content))
+            await self.checkin(client)
+
+        if token:
+            if response.is_success:
+                session_cache.touch(token)
+            elif is_invalid_token_response(response):
+                session_cache.invalidate_token(token)
+        return response
+
+    # Sends one call through the host's circuit breaker, retrying as the retry policy allows
+    async def _send(self, method, client, fm_server, path, headers, **kwargs):
+        breaker = self.breaker_for(fm_server)
+        retry_reads = is_idempotent(method, path, kwargs.get("json"), kwargs.get("params"))
+        attempt = 0
+        while True:
+            breaker.before_call()
+            try:
+                response = await client.request(method, path.lstrip("/"), headers=headers, **kwargs)
+            except httpx.TransportError as error:
+                if isinstance(error, httpx.PoolTimeout):
+                    breaker.abandon()
+                    raise
+                breaker.record_failure()
+                # Writes are only repeated when they never reached the server
+                if attempt >= config.FM_RETRY_ATTEMPTS or not (retry_reads or isinstance(error, NOT_SENT_ERRORS)):
+                    raise
+            except BaseException:
+                breaker.abandon()
+                raise
+            else:
+                if not is_busy_response(response):
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if attempt >= config.FM_RETRY_ATTEMPTS or not retry_reads:
+                    return response
+            attempt += 1
+            await asyncio.sleep(retry_delay(attempt))
+
+    async def get(self, fm_server, path, **kwargs):
+        return await self.request("GET", fm_server, path, **kwargs)
+
+    async def post(self, fm_server, path, **kwargs):
+        return await self.request("POST", fm_server, path, **kwargs)
+
+    async def patch(self, fm_server, path, **kwargs):
+        return await self.request("PATCH", fm_server, path, **kwargs)
+
+    async def delete(self, fm_server, path, **kwargs):
+        return await self.request("DELETE", fm_server, path, **kwargs)
+
+    # Opens a streamed GET on an absolute URL (e.g. a container URL) over the host's pooled client.
+    # FileMaker answers container URLs with a redirect that sets a session cookie; the cookie is
+    # carried through the redirect chain by hand. The caller must close the returned response.
+    async def stream_url(self, url, headers=None, max_redirects=5):
+        url = httpx.URL(url)
+        client = self.checkout(url.netloc.decode("ascii"))
+        try:
+            response = await self._stream_url(client, url, headers, max_redirects)
+        except BaseException:
+            await self.checkin(client)
+            raise
+        if response.is_closed:
+            await self.checkin(client)
+        else:
+            response.stream = CheckedOutStream(response.stream, lambda: self.checkin(client))
+        return response
+
+    async def _stream_url(self, client, url, headers, max_redirects):
+        request_headers = dict(headers or {})
+        cookies = []
+        for _ in range(max_redirects + 1):
+            if cookies:
+                request_headers["Cookie"] = "; ".join(cookies)
+            breaker = self.breaker_for(url.netloc.decode("ascii"))
+            breaker.before_call()
+            try:
+                response = await client.send(client.build_request("GET", url, headers=request_headers), stream=True)
+            except httpx.TransportError as error:
+                if isinstance(error, httpx.PoolTimeout):
+                    breaker.abandon()
+                else:
+                    breaker.record_failure()
+                raise
+            except BaseException:
+                breaker.abandon()
+                raise
+            if response.status_code in UNAVAILABLE_STATUS_CODES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if not response.is_redirect:
+                return response
+            cookies += [cookie.split(";", 1)[0] for cookie in response.headers.get_list("set-cookie")]
+            url = response.url.join(response.headers["location"])
+            await response.aclose()
+        raise HTTPException(status_code=502, detail="Too many redirects while fetching container data")
+
+    def stats(self):
+        return [breaker.stats() for breaker in self._breakers.values()]
+
+    async def close(self):
+        clients = list(self._clients.values()) + list(self._retired)
+        self._clients, self._retired = OrderedDict(), {}
+        for client in clients:
+            await client.aclose()
+
+
+# Process-wide client shared by all controllers
+fm_client = FileMakerClient()
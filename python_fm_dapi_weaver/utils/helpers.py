@@ -1,5 +1,5 @@
 from fastapi import HTTPException
-import requests
+import httpx
 
 def validate_required_params(params: dict):
     # Validate required parameters and raise error if any param missing.
@@ -7,7 +7,7 @@ def validate_required_params(params: dict):
     if missing:
         raise HTTPException(status_code=400, detail=f"Missing required parameters: {', '.join(missing)}")
 
-def handle_api_error(e: requests.HTTPError, message: str = "An error occurred"):
+def handle_api_error(e: httpx.HTTPStatusError, message: str = "An error occurred"):
     if e.response is not None:
         try:
             return HTTPException(
@@ -0,0 +1,175 @@
+import re
+import time
+from collections import OrderedDict
+from fastapi import HTTPException
+from .. import config
+from .singleflight import SingleFlight
+
+# "Field(2)" addresses the second repetition of a repeating field
+REPETITION = re.compile(r"^(.*)\((\d+)\)$")
+NUMBER = re.compile(r"^-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+ISO_DATE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+ISO_TIMESTAMP = re.compile(r"^(\d{4})-(\d{2})-(\d{2})[T ](\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?)$")
+FM_DATE = re.compile(r"^\d{1,2}/\d{1,2}/\d{4}$")
+FM_TIME = re.compile(r"^\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?$")
+FM_TIMESTAMP = re.compile(r"^\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}(:\d{2}(\.\d+)?)?$")
+
+
+class LayoutFields:
+    # A layout's Data API metadata with its fields indexed by name: the layout's own fields
+    # (related fields included as "Table::Field") and the fields of each portal
+
+    def __init__(self, layout, metadata):
+        self.layout = layout
+        self.metadata = metadata
+        self.fields = {field["name"]: field for field in metadata.get("fieldMetaData") or []}
+        self.portals = {
+            portal: {field["name"]: field for field in fields}
+            for portal, fields in (metadata.get("portalMetaData") or {}).items()
+        }
+        self.fetched_at = time.monotonic()
+
+    def field(self, name):
+        match = REPETITION.match(name)
+        base, repetition = (match.group(1), int(match.group(2))) if match else (name, 1)
+        field = self.fields.get(base)
+        if field is None or not 1 <= repetition <= int(field.get("maxRepeat") or 1):
+            return None
+        return field
+
+    def knows(self, name):
+        if self.field(name) is not None:
+            return True
+        return any(name in fields for fields in self.portals.values())
+
+    # Returns the record with values coerced to what FileMaker expects for each field's type,
+    # or raises 400 listing every unknown field and invalid value
+    def check_record(self, record):
+        unknown, invalid = [], []
+        checked = {}
+        for name, value in record.items():
+            field = self.field(name)
+            if field is None:
+                unknown.append(name)
+                continue
+            try:
+                checked[name] = coerce_value(field, value)
+            except ValueError as error:
+                invalid.append(f"'{name}' {error}")
+        self.raise_problems(unknown, invalid)
+        return checked
+
+    def check_find(self, query, sort, portals):
+        unknown = []
+        for request in query or []:
+            unknown += [name for name in request if name != "omit" and not self.knows(name)]
+        unknown += [term.get("fieldName") for term in sort or [] if not self.knows(str(term.get("fieldName")))]
+        unknown_portals = [portal for portal in portals or [] if portal not in self.portals]
+        invalid = [f"unknown portal '{portal}'" for portal in unknown_portals]
+        self.raise_problems(list(dict.fromkeys(unknown)), invalid)
+
+    def raise_problems(self, unknown, invalid):
+        problems = []
+        if unknown:
+            problems.append(f"unknown fields {', '.join(map(repr, unknown))}")
+        problems += invalid
+        if problems:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid request for layout '{self.layout}': {'; '.join(problems)}",
+            )
+
+
+def _us_date(year, month, day):
+    return f"{month}/{day}/{year}"
+
+
+# Coerces a value for a field of the given Data API metadata, raising ValueError when it cannot
+# be stored there. Dates accept ISO 8601 and are sent in the Data API's MM/DD/YYYY format.
+def coerce_value(field, value):
+    if field.get("type") in ("calculation", "summary"):
+        raise ValueError(f"is a {field['type']} field and cannot be modified")
+    result = field.get("result")
+    if result == "container":
+        raise ValueError("is a container field; use uploadContainer")
+    if isinstance(value, (dict, list)):
+        raise ValueError("must be a single value")
+    if value is None or value == "":
+        return ""
+    if result == "number":
+        if isinstance(value, bool):
+            return int(value)
+        if isinstance(value, (int, float)):
+            return value
+        text = str(value).strip()
+        if not NUMBER.match(text):
+            raise ValueError(f"expects a number, got {value!r}")
+        number = float(text)
+        return int(number) if number.is_integer() and "." not in text and "e" not in text.lower() else number
+    text = value if isinstance(value, str) else str(value)
+    if result == "date":
+        match = ISO_DATE.match(text)
+        if match:
+            return _us_date(*match.groups())
+        if not FM_DATE.match(text):
+            raise ValueError(f"expects a date (YYYY-MM-DD or MM/DD/YYYY), got {value!r}")
+    elif result == "time":
+        if not FM_TIME.match(text):
+            raise ValueError(f"expects a time (HH:MM:SS), got {value!r}")
+    elif result == "timeStamp":
+        match = ISO_TIMESTAMP.match(text)
+        if match:
+            return f"{_us_date(*match.groups()[:3])} {match.group(4)}"
+        if not FM_TIMESTAMP.match(text):
+            raise ValueError(f"expects a timestamp (YYYY-MM-DDTHH:MM:SS or MM/DD/YYYY HH:MM:SS), got {value!r}")
+    return text
+
+
+class LayoutMetadataCache:
+    # LRU cache of layout metadata keyed by (fmServer, database, layout, credentials hash), since
+    # field access privileges differ between accounts. Entries expire after `ttl` seconds;
+    # concurrent misses for the same layout share one upstream call.
+
+    def __init__(self, ttl, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    # Returns the LayoutFields for `key`, calling `fetch()` for the metadata when it is not cached
+    # (or `refresh` is set)
+    async def get(self, key, fetch, refresh=False):
+        entry = self._entries.get(key)
+        if entry is not None and not refresh and time.monotonic() - entry.fetched_at < self.ttl:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        if refresh:
+            self.refreshes += 1
+        else:
+            self.misses += 1
+
+        async def load():
+            fields = LayoutFields(key[2], await fetch())
+            self._entries[key] = fields
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return fields
+
+        return await self._flights.do((key, refresh), load)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+        }
+
+
+layout_metadata = LayoutMetadataCache(config.FM_LAYOUT_METADATA_TTL)
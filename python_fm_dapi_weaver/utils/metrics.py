@@ -0,0 +1,199 @@
+import time
+from bisect import bisect_left
+
+# In-process metrics in the Prometheus text exposition format, served at GET /api/metrics.
+# Recording a sample is a dict lookup and a few additions, so the metrics are always on.
+# Samples are only recorded from the event loop thread, so no locking is needed.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        _metrics.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def remove(self, *label_values):
+        self._values.pop(label_values, None)
+
+    def render(self):
+        lines = self.header()
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_text(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        # Per-bucket counts are kept non-cumulative and summed up at render time
+        index = bisect_left(self.buckets, value)
+        series = self._values.get(label_values)
+        if series is None:
+            series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = self.header()
+        for label_values, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _label_text(self.labels + ("le",), label_values + (_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# dataApi requests
+requests_total = Counter("fm_weaver_requests_total", "dataApi requests by method and HTTP status.", ("method", "status"))
+request_duration = Histogram("fm_weaver_request_duration_seconds", "dataApi request latency by method, until the last byte of the response.", ("method",))
+requests_in_flight = Gauge("fm_weaver_requests_in_flight", "dataApi requests currently being handled.")
+request_bytes = Counter("fm_weaver_request_bytes_total", "dataApi request body bytes by method.", ("method",))
+response_bytes = Counter("fm_weaver_response_bytes_total", "dataApi response body bytes by method.", ("method",))
+
+# Calls to FileMaker Server
+upstream_duration = Histogram("fm_weaver_upstream_duration_seconds", "FileMaker Data API call latency by phase, retries included.", ("phase",))
+upstream_requests_total = Counter("fm_weaver_upstream_requests_total", "FileMaker Data API calls by phase and HTTP status (error when no response).", ("phase", "status"))
+upstream_in_flight = Gauge("fm_weaver_upstream_in_flight", "FileMaker Data API calls currently in flight by host, for the hosts whose connection pool is kept (FM_MAX_HOSTS).", ("fm_server",))
+upstream_response_bytes = Counter("fm_weaver_upstream_response_bytes_total", "FileMaker Data API response bytes by phase.", ("phase",))
+
+# Where the session of a request came from: pool, cache, validated (validateSession) or login
+session_sources = Counter("fm_weaver_session_source_total", "Sessions resolved for dataApi requests by source.", ("source",))
+
+# Reads asking for "source": "mirror", by who answered them: the mirror or FileMaker (fallback)
+mirror_reads = Counter("fm_weaver_read_mirror_reads_total", "Reads asking for the read mirror by result.", ("result",))
+
+
+# Phase of a Data API call, derived from its method and path
+def upstream_phase(method, path):
+    path = path.rstrip("/")
+    if path.endswith("validateSession"):
+        return "validateSession"
+    if "/sessions" in path:
+        return "login" if method == "POST" else "logout"
+    return "main"
+
+
+def observe_request(method, status, started, body_bytes, sent_bytes):
+    requests_total.inc(method, str(status))
+    request_duration.observe(time.perf_counter() - started, method)
+    request_bytes.inc(method, amount=body_bytes)
+    response_bytes.inc(method, amount=sent_bytes)
+
+
+# Counts the bytes of a streamed response and records the request once the stream ends
+async def observe_stream(chunks, method, status, started, body_bytes):
+    sent = 0
+    try:
+        async for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        requests_in_flight.dec()
+        observe_request(method, status, started, body_bytes, sent)
+
+
+def _gauge_lines(name, help_text, samples, kind="gauge", labels=()):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for label_values, value in samples:
+        lines.append(f"{name}{_label_text(labels, label_values)} {_number(value)}")
+    return lines
+
+
+# Metrics read from the caches, pools, breakers and limiters' own stats() at scrape time
+def state_lines(session_cache, response_cache, session_pools, circuit_breakers, concurrency):
+    pool_labels = ("fm_server", "database")
+    lines = []
+    lines += _gauge_lines("fm_weaver_session_cache_hits_total", "Session token cache hits.", [((), session_cache["hits"])], "counter")
+    lines += _gauge_lines("fm_weaver_session_cache_misses_total", "Session token cache misses.", [((), session_cache["misses"])], "counter")
+    lines += _gauge_lines("fm_weaver_session_cache_entries", "Cached session tokens.", [((), session_cache["size"])])
+    lines += _gauge_lines("fm_weaver_response_cache_hits_total", "Read cache hits.", [((), response_cache["hits"])], "counter")
+    lines += _gauge_lines("fm_weaver_response_cache_misses_total", "Read cache misses.", [((), response_cache["misses"])], "counter")
+    lines += _gauge_lines("fm_weaver_response_cache_evictions_total", "Read cache entries evicted for space.", [((), response_cache["evictions"])], "counter")
+    lines += _gauge_lines("fm_weaver_response_cache_bytes", "Payload bytes held by the read cache.", [((), response_cache["sizeBytes"])])
+    for name, key, help_text, kind in (
+        ("fm_weaver_session_pool_idle", "idle", "Idle pooled sessions.", "gauge"),
+        ("fm_weaver_session_pool_in_use", "inUse", "Pooled sessions lent out.", "gauge"),
+        ("fm_weaver_session_pool_waiting", "waiting", "Requests waiting for a pooled session.", "gauge"),
+        ("fm_weaver_session_pool_acquired_total", "acquired", "Pooled sessions handed out.", "counter"),
+        ("fm_weaver_session_pool_replaced_total", "replaced", "Pooled sessions replaced after failing.", "counter"),
+    ):
+        samples = [((pool["fmServer"], pool["database"]), pool[key]) for pool in session_pools]
+        lines += _gauge_lines(name, help_text, samples, kind, pool_labels)
+    lines += _gauge_lines(
+        "fm_weaver_circuit_open", "1 while calls to the host fail fast.",
+        [((breaker["fmServer"],), int(breaker["state"] != "closed")) for breaker in circuit_breakers],
+        labels=("fm_server",),
+    )
+    lines += _gauge_lines(
+        "fm_weaver_concurrency_queued", "Requests queued for a concurrency slot.",
+        [((limiter["name"],), limiter["queued"]) for limiter in concurrency],
+        labels=("limiter",),
+    )
+    lines += _gauge_lines(
+        "fm_weaver_concurrency_timeouts_total", "Requests rejected after waiting for a concurrency slot.",
+        [((limiter["name"],), limiter["timeouts"]) for limiter in concurrency],
+        "counter", ("limiter",),
+    )
+    return lines
+
+
+def render(extra_lines=()):
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+    lines += extra_lines
+    return "\n".join(lines) + "\n"
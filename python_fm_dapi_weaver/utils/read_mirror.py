@@ -0,0 +1,495 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from fastapi import HTTPException
+from .. import config
+from . import fast_json
+from .session_cache import credentials_key, is_invalid_token_error
+
+try:
+    import fcntl
+except ImportError:  # Windows: every worker process syncs its mirrors
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Local SQLite copies of read-heavy layouts (FM_READ_MIRRORS). A background task per layout keeps
+# its copy current with the same timestamp-cursor reads as syncRecords, and findRecord /
+# getAllRecords with "source": "mirror" are answered from it, Data API query and sort included.
+# Reads the mirror cannot translate, or while it is behind, go to FileMaker instead. Dates and
+# timestamps are stored and returned in ISO 8601, so only "dateformats": 2 reads are served.
+
+# Characters FileMaker reads as find operators that the mirror does not translate
+UNSUPPORTED_OPERATORS = ("!", "//", "?", "~", '"', "#")
+NUMBER = re.compile(r"^-?\d+(\.\d+)?$")
+
+
+class MirrorUnsupported(Exception):
+    # Raised while translating a read the mirror cannot answer exactly
+    pass
+
+
+def no_records_error():
+    # Same answer FileMaker gives a find without matches
+    return HTTPException(status_code=500, detail={
+        "messages": [{"code": "401", "message": "No records match the request"}],
+        "response": {},
+    })
+
+
+# SQL expression for a field's value. Mirror indexes are built on the same expression, which is
+# what lets SQLite use them for the translated queries.
+def field_expression(field):
+    if not isinstance(field, str) or not field or '"' in field:
+        raise MirrorUnsupported(f"field name {field!r}")
+    path = '$."' + field + '"'
+    return "json_extract(data, '" + path.replace("'", "''") + "') COLLATE NOCASE"
+
+
+def _number(text):
+    if not NUMBER.match(text):
+        return None
+    return float(text) if "." in text else int(text)
+
+
+def _like_pattern(text):
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped.replace("*", "%").replace("@", "_")
+
+
+def _compare(expr, operator, operand):
+    number = _number(operand.strip())
+    if number is not None:
+        return f"(typeof({expr}) IN ('integer', 'real') AND {expr} {operator} ?)", [number]
+    return f"(typeof({expr}) = 'text' AND {expr} {operator} ?)", [operand.strip()]
+
+
+# Translates one field criterion of a find request to (sql, params); text matches ignore case.
+# Bare and "=" values match any word of the field in FileMaker ("Smith" finds "John Smith"), which
+# the whole-field values in the mirror cannot answer, so those finds go to FileMaker. "==" (whole
+# field, wildcards included), "*", "=", comparisons and ranges are translated.
+def criterion_sql(field, criterion):
+    expr = field_expression(field)
+    if isinstance(criterion, (bool, int, float)) or criterion is None:
+        raise MirrorUnsupported(f"criterion {criterion!r}")
+    text = str(criterion).strip()
+    if not text:
+        return None, []
+    if any(operator in text for operator in UNSUPPORTED_OPERATORS):
+        raise MirrorUnsupported(f"criterion {text!r}")
+    if text == "*":
+        return f"({expr} IS NOT NULL AND {expr} != '')", []
+    if text == "=":
+        return f"({expr} IS NULL OR {expr} = '')", []
+    for operator in (">=", "<=", ">", "<"):
+        if text.startswith(operator):
+            return _compare(expr, operator, text[len(operator):])
+    if "..." in text:
+        low, high = text.split("...", 1)
+        low_sql, low_params = _compare(expr, ">=", low)
+        high_sql, high_params = _compare(expr, "<=", high)
+        return f"({low_sql} AND {high_sql})", low_params + high_params
+    if not text.startswith("=="):
+        raise MirrorUnsupported(f"word match {text!r}")
+    text = text[2:]
+    if "*" in text or "@" in text:
+        return f"{expr} LIKE ? ESCAPE '\\'", [_like_pattern(text)]
+    number = _number(text)
+    if number is not None:
+        return f"{expr} IN (?, ?)", [number, text]
+    return f"{expr} = ?", [text]
+
+
+# Translates a Data API query (requests OR-ed in order, omit requests taking records out of the
+# found set so far) to a WHERE clause and its params. No query means every record.
+def query_sql(query):
+    if query is None:
+        return "1", []
+    if not isinstance(query, list):
+        raise MirrorUnsupported("query")
+    where, params = None, []
+    for request in query:
+        if not isinstance(request, dict):
+            raise MirrorUnsupported("query")
+        omit = str(request.get("omit", "")).lower() == "true"
+        clauses, clause_params = [], []
+        for field, criterion in request.items():
+            if field == "omit":
+                continue
+            sql, sql_params = criterion_sql(field, criterion)
+            if sql is not None:
+                clauses.append(sql)
+                clause_params += sql_params
+        condition = " AND ".join(clauses) or "1"
+        if omit:
+            if where is not None:
+                where = f"({where}) AND NOT ({condition})"
+                params += clause_params
+        elif where is None:
+            where, params = condition, clause_params
+        else:
+            where = f"({where}) OR ({condition})"
+            params += clause_params
+    return where or "0", params
+
+
+def order_sql(sort):
+    terms = []
+    for term in sort or []:
+        if not isinstance(term, dict):
+            raise MirrorUnsupported("sort")
+        order = str(term.get("sortOrder", "ascend")).lower()
+        if order not in ("ascend", "descend"):
+            # Sorting by a value list needs the layout's value list
+            raise MirrorUnsupported(f"sort order {order!r}")
+        terms.append(field_expression(term.get("fieldName")) + (" DESC" if order == "descend" else " ASC"))
+    terms.append("record_id")
+    return ", ".join(terms)
+
+
+# A mirrored record in the response shape, limited to `fields` when given
+def project(record_id, field_data, fields=None):
+    if fields is None:
+        return {"recordId": record_id, **field_data}
+    record = {"recordId": record_id}
+    for name in fields:
+        if name in field_data:
+            record[name] = field_data[name]
+    return record
+
+
+class MirrorDatabase:
+    # The SQLite file holding every mirror: one table per layout and a mirror_state row each.
+    # Connections are opened per process and thread; WAL mode lets reads run during a sync.
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock_file = None
+
+    def connection(self):
+        local = self._local
+        if getattr(local, "connection", None) is None or local.pid != os.getpid():
+            new_file = not os.path.exists(self.path)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            if new_file:
+                os.chmod(self.path, 0o600)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS mirror_state ("
+                "key TEXT PRIMARY KEY, fm_table TEXT, since TEXT, seen TEXT, "
+                "synced_at REAL, full_synced_at REAL)"
+            )
+            local.connection = connection
+            local.pid = os.getpid()
+            self._connections.append(connection)
+        return local.connection
+
+    # With several worker processes only the one holding the lock file syncs; the others read
+    def try_lead(self):
+        if fcntl is None:
+            return True
+        if self._lock_file is None:
+            self._lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.close()
+            except sqlite3.ProgrammingError:
+                pass
+        self._connections = []
+        self._local = threading.local()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class LayoutMirror:
+    # The mirror of one layout, read with one service account
+
+    def __init__(self, database_file, settings, login, read_changes):
+        self.db = database_file
+        self.fm_server = settings["fmServer"]
+        self.database = settings["database"]
+        self.layout = settings["layout"]
+        self.basic_auth_token = settings["authToken"]
+        self.credentials = credentials_key(self.fm_server, self.database, self.basic_auth_token)[2]
+        self.timestamp_field = settings.get("timestampField") or config.FM_SYNC_TIMESTAMP_FIELD
+        self.indexes = list(settings.get("indexes") or [])
+        self.interval = float(settings.get("interval") or config.FM_READ_MIRROR_INTERVAL)
+        self.max_staleness = float(settings.get("maxStaleness", config.FM_READ_MIRROR_MAX_STALENESS))
+        # By default only callers signed in with the mirror's own account read from it, since
+        # other FileMaker accounts may not be allowed to see every record
+        self.allow_all_users = bool(settings.get("allowAllUsers", False))
+        self.login = login
+        self.read_changes = read_changes
+        self.key = json.dumps([self.fm_server, self.database, self.layout])
+        self.table = "mirror_" + hashlib.sha256(self.key.encode()).hexdigest()[:16]
+        self.token = None
+        self.written_at = 0.0
+        self.wake = asyncio.Event()
+        self.syncs = 0
+        self.errors = 0
+        self.last_error = None
+        self.reads = 0
+
+    def create_table(self):
+        connection = self.db.connection()
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "record_id INTEGER PRIMARY KEY, mod_id TEXT, data TEXT NOT NULL, seen_at REAL NOT NULL)"
+        )
+        for field in self.indexes:
+            name = self.table + "_" + hashlib.sha256(field.encode()).hexdigest()[:12]
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {self.table} ({field_expression(field)})")
+
+    def state(self):
+        row = self.db.connection().execute(
+            "SELECT fm_table, since, seen, synced_at, full_synced_at FROM mirror_state WHERE key = ?", (self.key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "table": row[0],
+            "since": row[1],
+            "seen": json.loads(row[2] or "{}"),
+            "syncedAt": row[3],
+            "fullSyncedAt": row[4],
+        }
+
+    # True when a read may be answered from the mirror: a full pass has completed, the last sync
+    # started after this process's last write to the layout and is recent enough
+    def is_fresh(self, state):
+        if state is None or state["syncedAt"] is None or state["fullSyncedAt"] is None:
+            return False
+        if state["syncedAt"] < self.written_at:
+            return False
+        return not self.max_staleness or time.time() - state["syncedAt"] <= self.max_staleness
+
+    def allows(self, credentials):
+        return self.allow_all_users or credentials == self.credentials
+
+    # Writes through the weaver: reads fall back to FileMaker until the next sync has picked the
+    # change up, and deleted records, which delta syncs cannot see, are dropped right away
+    def note_write(self, deleted_record_id=None):
+        self.written_at = time.time()
+        self.wake.set()
+        if deleted_record_id is not None and str(deleted_record_id).isdigit():
+            self.db.connection().execute(f"DELETE FROM {self.table} WHERE record_id = ?", (int(deleted_record_id),))
+
+    async def run(self):
+        while True:
+            self.wake.clear()
+            if self.db.try_lead():
+                try:
+                    await self.sync()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error:
+                    self.errors += 1
+                    self.last_error = str(getattr(error, "detail", error))
+                    logger.warning("Read mirror sync error for %s/%s/%s: %s", self.fm_server, self.database, self.layout, self.last_error)
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    # One sync pass: the changes since the stored cursor, or every record on a full pass, which
+    # also removes records deleted in FileMaker. Passes resume from the cursor after a restart.
+    async def sync(self):
+        started = time.time()
+        await asyncio.to_thread(self.create_table)
+        state = await asyncio.to_thread(self.state) or {"since": None, "seen": {}, "table": None, "fullSyncedAt": None}
+        full = state["fullSyncedAt"] is None or started - state["fullSyncedAt"] >= config.FM_READ_MIRROR_FULL_SYNC
+        since, seen = (None, {}) if full else (state["since"], state["seen"])
+        fm_table = state["table"]
+        expected = None
+        while True:
+            changes = await self._read_changes(since, seen)
+            if expected is None:
+                expected = changes.found_count or 0
+            if changes.data_info is not None:
+                fm_table = changes.data_info["table"]
+            if changes.since:
+                since, seen = changes.since, changes.seen
+            await asyncio.to_thread(self._store, changes.records, fm_table, since, seen, started)
+            if not changes.has_more:
+                break
+        await asyncio.to_thread(self._finish, started, full, expected)
+        self.syncs += 1
+
+    async def _read_changes(self, since, seen):
+        for attempt in range(2):
+            if self.token is None:
+                self.token = await self.login(self.fm_server, self.database, self.basic_auth_token)
+            try:
+                return await self.read_changes(
+                    self.fm_server, self.database, self.layout, self.token, self.timestamp_field,
+                    since, seen, config.FM_SYNC_MAX_RECORDS, config.FM_STREAM_PAGE_SIZE,
+                )
+            except HTTPException as error:
+                if attempt or not is_invalid_token_error(error):
+                    raise
+                self.token = None
+
+    def _store(self, records, fm_table, since, seen, started):
+        connection = self.db.connection()
+        rows = [
+            (int(record["recordId"]), record["modId"], fast_json.dumps(record["fieldData"]).decode("utf-8"), started)
+            for record in records
+        ]
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (record_id, mod_id, data, seen_at) VALUES (?, ?, ?, ?)", rows
+            )
+            connection.execute(
+                "INSERT INTO mirror_state (key, fm_table, since, seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET fm_table = excluded.fm_table, since = excluded.since, seen = excluded.seen",
+                (self.key, fm_table, since, json.dumps(seen)),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    # `expected` is how many records FileMaker found when the pass began
+    def _finish(self, started, full, expected):
+        connection = self.db.connection()
+        connection.execute("BEGIN")
+        try:
+            if full:
+                seen_count = connection.execute(f"SELECT COUNT(*) FROM {self.table} WHERE seen_at >= ?", (started,)).fetchone()[0]
+                if seen_count >= expected:
+                    # Every record still in FileMaker was written during this pass
+                    connection.execute(f"DELETE FROM {self.table} WHERE seen_at < ?", (started,))
+                    connection.execute("UPDATE mirror_state SET full_synced_at = ? WHERE key = ?", (started, self.key))
+                else:
+                    # The pass may have missed live records: keep the rows it did not see, and the
+                    # mirror stale, until a later full pass reads them all
+                    logger.warning(
+                        "Read mirror full sync of %s/%s/%s saw %s of %s records, not removing unseen rows",
+                        self.fm_server, self.database, self.layout, seen_count, expected,
+                    )
+            connection.execute("UPDATE mirror_state SET synced_at = ? WHERE key = ?", (started, self.key))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def query(self, where, params, order, offset, limit):
+        connection = self.db.connection()
+        found_count = connection.execute(f"SELECT COUNT(*) FROM {self.table} WHERE {where}", params).fetchone()[0]
+        rows = []
+        if found_count:
+            rows = connection.execute(
+                f"SELECT record_id, data FROM {self.table} WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [limit, offset - 1],
+            ).fetchall()
+        total_count = connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        return found_count, total_count, rows
+
+    def stats(self):
+        state = self.state() if os.path.exists(self.db.path) else None
+        return {
+            "fmServer": self.fm_server,
+            "database": self.database,
+            "layout": self.layout,
+            "indexes": self.indexes,
+            "syncedAt": state["syncedAt"] if state else None,
+            "fullSyncedAt": state["fullSyncedAt"] if state else None,
+            "fresh": self.is_fresh(state),
+            "syncs": self.syncs,
+            "errors": self.errors,
+            "lastError": self.last_error,
+            "reads": self.reads,
+        }
+
+
+class ReadMirrorManager:
+    # Owns the configured layout mirrors and their sync tasks. `login` opens a session for a
+    # mirror's account and `read_changes` is the syncRecords reader.
+
+    def __init__(self, login, read_changes):
+        self.login = login
+        self.read_changes = read_changes
+        self.database_file = None
+        self.mirrors = {}
+        self._tasks = []
+
+    def add_layout(self, settings):
+        if self.database_file is None:
+            self.database_file = MirrorDatabase(config.FM_READ_MIRROR_PATH)
+        for field in settings.get("indexes") or []:
+            field_expression(field)
+        mirror = LayoutMirror(self.database_file, settings, self.login, self.read_changes)
+        self.mirrors[(mirror.fm_server, mirror.database, mirror.layout)] = mirror
+        return mirror
+
+    def get(self, fm_server, database, layout):
+        return self.mirrors.get((fm_server, database, layout))
+
+    async def start(self):
+        for settings in json.loads(config.FM_READ_MIRRORS or "[]"):
+            self.add_layout(settings)
+        self._tasks = [asyncio.ensure_future(mirror.run()) for mirror in self.mirrors.values()]
+
+    def note_write(self, fm_server, database, layout, deleted_record_id=None):
+        mirror = self.get(fm_server, database, layout)
+        if mirror is not None:
+            mirror.note_write(deleted_record_id)
+
+    # Answers a findRecord/getAllRecords read from the mirror, in the records_response shape
+    # without the session, or returns None when FileMaker has to answer it
+    async def read(self, fm_server, database, layout, credentials, query=None, sort=None, offset=None, limit=None, fields=None):
+        mirror = self.get(fm_server, database, layout)
+        if mirror is None or not mirror.allows(credentials):
+            return None
+        try:
+            where, params = query_sql(query)
+            order = order_sql(sort)
+            offset = max(1, int(offset or 1))
+            limit = max(0, int(100 if limit is None else limit))
+        except (MirrorUnsupported, TypeError, ValueError):
+            return None
+        state = await asyncio.to_thread(mirror.state)
+        if not mirror.is_fresh(state):
+            return None
+        found_count, total_count, rows = await asyncio.to_thread(mirror.query, where, params, order, offset, limit)
+        if not found_count:
+            raise no_records_error()
+        mirror.reads += 1
+        return {
+            "recordInfo": {
+                "table": state["table"],
+                "layout": layout,
+                "totalRecordCount": total_count,
+                "foundCount": found_count,
+            },
+            "records": [project(str(record_id), fast_json.loads(data), fields) for record_id, data in rows],
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.database_file is not None:
+            self.database_file.close()
+
+    def stats(self):
+        return [mirror.stats() for mirror in self.mirrors.values()]
@@ -0,0 +1,92 @@
+import asyncio
+from fastapi import HTTPException
+from starlette.responses import Response
+from . import fast_json
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ModuleNotFoundError:
+    pyarrow = None
+
+# Output formats of getAllRecords/findRecord. "records" is the usual list of record objects,
+# "columnar" names each field once with an array of its values, and "arrow" / "parquet" return
+# the same columns as Arrow IPC stream or Parquet file bytes (needs pyarrow).
+FORMATS = ("records", "columnar", "arrow", "parquet")
+MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+# Returns the requested format, rejecting unknown ones before anything is read from FileMaker
+def requested_format(method_body):
+    name = method_body.get("format") or "records"
+    if name not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    if name in MEDIA_TYPES and pyarrow is None:
+        raise HTTPException(status_code=400, detail=f"format {name} needs pyarrow (pip install \"python-fm-dapi-weaver[arrow]\")")
+    if name != "records" and method_body.get("stream"):
+        raise HTTPException(status_code=400, detail=f"format {name} cannot be combined with stream")
+    return name
+
+
+# Field name -> list of values, in the order fields first appear; records without a field get None
+def columns_of(records):
+    names = {}
+    for record in records:
+        for name in record:
+            names.setdefault(name)
+    return {name: [record.get(name) for record in records] for name in names}
+
+
+def _arrow_array(values):
+    try:
+        return pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        pass
+    # FileMaker sends "" for empty number, date and time fields
+    try:
+        return pyarrow.array([None if value == "" else value for value in values])
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        pass
+    # Mixed values (or portal rows) end up as text, JSON-encoded when they are not strings
+    return pyarrow.array(
+        [value if value is None or isinstance(value, str) else fast_json.dumps(value).decode("utf-8") for value in values],
+        type=pyarrow.string(),
+    )
+
+
+def _arrow_bytes(name, columns):
+    table = pyarrow.table({field: _arrow_array(values) for field, values in columns.items()})
+    sink = pyarrow.BufferOutputStream()
+    if name == "arrow":
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pyarrow.parquet.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+# Turns a records response ({"recordInfo", "records", "session"}) into the requested format
+async def render(name, response):
+    if name == "records":
+        return response
+    columns = columns_of(response["records"])
+    if name == "columnar":
+        return {"recordInfo": response["recordInfo"], "columns": columns, "session": response["session"]}
+
+    record_info = response["recordInfo"]
+    content = await asyncio.to_thread(_arrow_bytes, name, columns)
+    return Response(
+        content,
+        media_type=MEDIA_TYPES[name],
+        headers={
+            "X-Table": str(record_info["table"]),
+            "X-Layout": str(record_info["layout"]),
+            "X-Total-Record-Count": str(record_info["totalRecordCount"]),
+            "X-Found-Count": str(record_info["foundCount"]),
+            "X-Session-Token": response["session"],
+        },
+    )
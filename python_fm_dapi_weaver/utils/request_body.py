@@ -0,0 +1,53 @@
+from fastapi import HTTPException, Request
+from .. import config
+from . import fast_json
+from .streaming import MultipartStreamReader, limited_body
+
+
+# Parses the dataApi request body into req.state.body (and req.state.file for uploads).
+# Runs once per request, from the route that needs it, so other routes never read the body.
+async def parse_body(request: Request):
+    if hasattr(request.state, "body"):
+        return request.state.body
+
+    content_type = request.headers.get("Content-Type", "")
+
+    if "application/json" in content_type:
+        body = b"".join([chunk async for chunk in limited_body(request, config.FM_MAX_BODY_SIZE)])
+        request.state.body = load_body(body, "Invalid JSON body")
+
+    elif "multipart/form-data" in content_type:
+        # Only the 'data' field is read up front; the file part stays on the wire and is
+        # streamed straight to FileMaker by the uploadContainer handler
+        reader = MultipartStreamReader(
+            request, max_size=config.FM_MAX_UPLOAD_SIZE, max_field_size=config.FM_MAX_BODY_SIZE
+        )
+        form = await reader.read_fields("data")
+
+        json_data = form.get("data")
+        if not json_data:
+            raise HTTPException(status_code=400, detail="Missing 'data' in form")
+        request.state.body = load_body(json_data, "Invalid JSON in 'data'")
+
+        if not reader.file:
+            raise HTTPException(status_code=400, detail="No file provided")
+        request.state.file = {
+            "filename": reader.file["filename"],
+            "content_type": reader.file["content_type"],
+            "stream": reader.file_chunks()
+        }
+
+    else:
+        raise HTTPException(status_code=415, detail="Expected an application/json or multipart/form-data body")
+
+    return request.state.body
+
+
+def load_body(data, error_message):
+    try:
+        body = fast_json.loads(data)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=error_message)
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail=error_message)
+    return body
@@ -0,0 +1,95 @@
+import json
+import time
+from collections import OrderedDict
+from .. import config
+
+
+class ResponseCache:
+    # LRU cache of findRecord/getAllRecords pages with per-layout TTLs.
+    # Memory is bounded by the total size of the cached upstream payloads. Entries are grouped
+    # by (fmServer, database, layout) so a write on a layout drops everything cached for it.
+
+    def __init__(self, default_ttl, layout_ttls, max_bytes):
+        self.default_ttl = default_ttl
+        self.layout_ttls = layout_ttls
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._keys_by_layout = {}
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0 and (self.default_ttl > 0 or any(ttl > 0 for ttl in self.layout_ttls.values()))
+
+    def ttl_for(self, layout):
+        return self.layout_ttls.get(layout, self.default_ttl)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    # `layout_key` is (fmServer, database, layout); `size` is the payload size in bytes
+    def put(self, key, layout_key, value, size):
+        ttl = self.ttl_for(layout_key[2])
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, layout_key, value, size)
+        self._keys_by_layout.setdefault(layout_key, set()).add(key)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        _, layout_key, _, size = entry
+        self.size_bytes -= size
+        keys = self._keys_by_layout.get(layout_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_layout[layout_key]
+
+    def invalidate_layout(self, fm_server, database, layout):
+        keys = self._keys_by_layout.pop((fm_server, database, layout), set())
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_layout.clear()
+        self.size_bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "sizeBytes": self.size_bytes,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(
+    config.FM_RESPONSE_CACHE_TTL,
+    json.loads(config.FM_RESPONSE_CACHE_LAYOUT_TTLS or "{}"),
+    config.FM_RESPONSE_CACHE_MAX_BYTES,
+)
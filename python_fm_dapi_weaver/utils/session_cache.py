@@ -0,0 +1,157 @@
+import hashlib
+import time
+from collections import OrderedDict
+from .. import config
+from .session_store import SQLiteSessionStore
+
+# FileMaker Data API error code for an expired or unknown session token
+INVALID_TOKEN_CODE = "952"
+
+
+def credentials_key(fm_server, database, basic_auth_token):
+    # Never keep the raw Basic auth credentials in memory longer than the request
+    digest = hashlib.sha256((basic_auth_token or "").encode()).hexdigest()
+    return (fm_server, database, digest)
+
+
+def is_invalid_token_response(response):
+    if response.status_code != 401:
+        return False
+    try:
+        messages = response.json().get("messages") or [{}]
+    except Exception:
+        return False
+    return str(messages[0].get("code")) == INVALID_TOKEN_CODE
+
+
+def is_invalid_token_error(error):
+    detail = getattr(error, "detail", None)
+    if getattr(error, "status_code", None) != 401 or not isinstance(detail, dict):
+        return False
+    messages = detail.get("messages") or [{}]
+    return str(messages[0].get("code")) == INVALID_TOKEN_CODE
+
+
+class SessionCache:
+    # LRU cache of FileMaker session tokens keyed by (fmServer, database, credentials hash).
+    # A token is trusted without a validateSession call while it was last known valid less
+    # than `ttl` seconds ago, which should stay below FileMaker's session idle timeout.
+    # With a shared `store`, worker processes also pick up tokens the other workers obtained.
+
+    def __init__(self, ttl, max_size, store=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.store = store
+        self._entries = OrderedDict()
+        self._keys_by_token = {}
+        self._shared_at = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] >= self.ttl:
+            # Only stale here: another worker may have used the token since
+            self._forget(key)
+            entry = None
+        if entry is None and self.store is not None:
+            shared = self.store.get(key)
+            if shared is not None and shared[1] < self.ttl:
+                entry = (shared[0], time.monotonic() - shared[1])
+                self._remember(key, *entry)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _remember(self, key, token, last_valid):
+        self._forget(key)
+        self._entries[key] = (token, last_valid)
+        self._keys_by_token[token] = key
+        while len(self._entries) > self.max_size:
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._keys_by_token.pop(entry[0], None)
+            self._shared_at.pop(entry[0], None)
+
+    # Returns a cached token for the credentials, or None
+    def get(self, key):
+        if not self.enabled:
+            return None
+        token = self._lookup(key)
+        if token is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return token
+
+    # True when `token` is the token cached for these credentials and is still fresh
+    def is_valid(self, key, token):
+        if not self.enabled or not token:
+            return False
+        valid = self._lookup(key) == token
+        if valid:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return valid
+
+    def put(self, key, token):
+        if not self.enabled or not token:
+            return
+        now = time.monotonic()
+        self._remember(key, token, now)
+        if self.store is not None:
+            self.store.put(key, token)
+            self._shared_at[token] = now
+
+    # Every successful Data API call resets FileMaker's idle timer for the token.
+    # The shared store is refreshed at most every ttl/8 seconds per token to keep writes rare.
+    def touch(self, token):
+        key = self._keys_by_token.get(token)
+        if key is not None and key in self._entries:
+            now = time.monotonic()
+            self._entries[key] = (token, now)
+            if self.store is not None and now - self._shared_at.get(token, 0.0) >= self.ttl / 8:
+                self.store.touch(token)
+                self._shared_at[token] = now
+
+    def invalidate(self, key):
+        self._forget(key)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def invalidate_token(self, token):
+        key = self._keys_by_token.get(token)
+        if key is not None:
+            self._forget(key)
+        if self.store is not None:
+            self.store.delete_token(token)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_token.clear()
+        self._shared_at.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "shared": self.store is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+session_cache = SessionCache(
+    config.FM_SESSION_CACHE_TTL,
+    config.FM_SESSION_CACHE_SIZE,
+    SQLiteSessionStore(config.FM_SESSION_STORE) if config.FM_SESSION_STORE else None,
+)
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from fastapi import HTTPException
+from .. import config
+from .session_cache import credentials_key
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession:
+    def __init__(self, token):
+        self.token = token
+        self.last_used = time.monotonic()
+
+
+class SessionPool:
+    # Bounded pool of pre-authenticated FileMaker sessions for one service account
+    # (fmServer, database, credentials). Requests borrow a session and give it back when done.
+
+    def __init__(self, fm_server, database, basic_auth_token, size, manager):
+        self.fm_server = fm_server
+        self.database = database
+        self.basic_auth_token = basic_auth_token
+        self.size = size
+        self.manager = manager
+        self._idle = asyncio.Queue()
+        self._opened = 0
+        # Tokens of every open session, idle or borrowed
+        self._tokens = set()
+        self._closed = False
+        self.waiting = 0
+        self.acquired = 0
+        self.replaced = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def in_use(self):
+        return self._opened - self._idle.qsize()
+
+    async def _open(self):
+        self._opened += 1
+        try:
+            token = await self.manager.login(self.fm_server, self.database, self.basic_auth_token)
+        except Exception:
+            self._opened -= 1
+            raise
+        self._tokens.add(token)
+        return PooledSession(token)
+
+    def _forget(self, session):
+        self._opened -= 1
+        self._tokens.discard(session.token)
+
+    def owns(self, token):
+        return token in self._tokens
+
+    async def warm_up(self):
+        missing = self.size - self._opened
+        sessions = await asyncio.gather(
+            *[self._open() for _ in range(missing)], return_exceptions=True
+        )
+        for session in sessions:
+            if isinstance(session, PooledSession):
+                self._idle.put_nowait(session)
+        errors = [session for session in sessions if isinstance(session, Exception)]
+        if errors:
+            logger.warning("Session pool warm-up error for %s/%s: %s", self.fm_server, self.database, errors[0])
+
+    async def acquire(self, timeout=None):
+        started = time.monotonic()
+        if self._idle.empty() and self._opened < self.size:
+            session = await self._open()
+        else:
+            self.waiting += 1
+            try:
+                session = await asyncio.wait_for(self._idle.get(), timeout)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail="Timed out waiting for a pooled FileMaker session")
+            finally:
+                self.waiting -= 1
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return session
+
+    # Borrows an idle session, or opens one while under the size limit; None when the pool is busy
+    async def acquire_nowait(self):
+        if self._idle.empty() and self._opened >= self.size:
+            return None
+        return await self.acquire()
+
+    def release(self, session, discard=False):
+        if discard or self._closed:
+            self._forget(session)
+            asyncio.ensure_future(self._logout(session))
+            if self.waiting and not self._closed:
+                asyncio.ensure_future(self._replace())
+            return
+        session.last_used = time.monotonic()
+        self._idle.put_nowait(session)
+
+    async def _replace(self):
+        try:
+            self.release(await self._open())
+            self.replaced += 1
+        except Exception as error:
+            logger.warning("Session pool replace error for %s/%s: %s", self.fm_server, self.database, error)
+
+    async def _logout(self, session):
+        try:
+            await self.manager.logout(self.fm_server, self.database, session.token)
+        except Exception:
+            pass
+
+    # Validates sessions idle for longer than `max_idle` seconds, replacing dead ones.
+    # Any call on a session resets FileMaker's idle timer, so this keeps the pool alive.
+    async def keep_alive(self, max_idle):
+        stale = []
+        fresh = []
+        while not self._idle.empty():
+            session = self._idle.get_nowait()
+            if time.monotonic() - session.last_used >= max_idle:
+                stale.append(session)
+            else:
+                fresh.append(session)
+        for session in fresh:
+            self._idle.put_nowait(session)
+
+        async def refresh(session):
+            try:
+                is_valid = await self.manager.validate(self.fm_server, session.token)
+            except Exception as error:
+                # Host unreachable: keep the session as is and try again on the next round
+                logger.warning("Session pool keep-alive error for %s/%s: %s", self.fm_server, self.database, error)
+                self._idle.put_nowait(session)
+                return
+            if is_valid:
+                self.release(session)
+                return
+            self._forget(session)
+            await self._replace()
+
+        await asyncio.gather(*[refresh(session) for session in stale])
+
+    async def close(self):
+        self._closed = True
+        sessions = []
+        while not self._idle.empty():
+            sessions.append(self._idle.get_nowait())
+        for session in sessions:
+            self._forget(session)
+        await asyncio.gather(*[self._logout(session) for session in sessions])
+
+    def stats(self):
+        return {
+            "fmServer": self.fm_server,
+            "database": self.database,
+            "size": self.size,
+            "open": self._opened,
+            "idle": self._idle.qsize(),
+            "inUse": self.in_use,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "replaced": self.replaced,
+            "avgWaitSeconds": self.total_wait / self.acquired if self.acquired else 0.0,
+            "maxWaitSeconds": self.max_wait,
+        }
+
+
+class SessionPoolManager:
+    # Owns one SessionPool per configured service account and the background keep-alive task
+
+    def __init__(self, login, logout, validate):
+        self.login = login
+        self.logout = logout
+        self.validate = validate
+        self.pools = {}
+        self._keep_alive_task = None
+
+    # `size` is the account's total; with several worker processes each one opens its share
+    def add_account(self, fm_server, database, basic_auth_token, size=None):
+        key = credentials_key(fm_server, database, basic_auth_token)
+        if key not in self.pools:
+            size = size or config.FM_SESSION_POOL_SIZE
+            self.pools[key] = SessionPool(
+                fm_server, database, basic_auth_token, max(1, math.ceil(size / config.FM_WORKER_COUNT)), self
+            )
+        return self.pools[key]
+
+    def get(self, key):
+        return self.pools.get(key)
+
+    # True when `token` is a session of one of the pools, which callers must not sign out
+    def owns(self, token):
+        return any(pool.owns(token) for pool in self.pools.values())
+
+    async def start(self):
+        for account in json.loads(config.FM_SESSION_POOL_ACCOUNTS or "[]"):
+            self.add_account(
+                account["fmServer"], account["database"], account["authToken"], account.get("size")
+            )
+        if not self.pools:
+            return
+        await asyncio.gather(*[pool.warm_up() for pool in self.pools.values()])
+        self._keep_alive_task = asyncio.ensure_future(self._keep_alive_loop())
+
+    async def _keep_alive_loop(self):
+        interval = config.FM_SESSION_POOL_KEEPALIVE
+        while True:
+            # Check often enough that no session sits idle much longer than `interval`
+            await asyncio.sleep(interval / 4)
+            await asyncio.gather(*[pool.keep_alive(interval) for pool in self.pools.values()])
+
+    async def close(self):
+        if self._keep_alive_task is not None:
+            self._keep_alive_task.cancel()
+            self._keep_alive_task = None
+        await asyncio.gather(*[pool.close() for pool in self.pools.values()])
+        self.pools = {}
+
+    def stats(self):
+        return [pool.stats() for pool in self.pools.values()]
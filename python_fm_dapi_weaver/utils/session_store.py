@@ -0,0 +1,80 @@
+import json
+import os
+import sqlite3
+import time
+
+
+class SQLiteSessionStore:
+    # Session tokens shared between worker processes through a local SQLite file (WAL mode).
+    # Rows hold the session cache key, which carries a hash of the credentials and never the
+    # credentials themselves, the token and the wall-clock time it was last known valid.
+    # Statements are single-row lookups on indexed columns, so they run inline on the event loop.
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._pid = None
+
+    def _db(self):
+        # One connection per process; a forked worker opens its own
+        if self._connection is None or self._pid != os.getpid():
+            self._check_private()
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fm_sessions ("
+                "key TEXT PRIMARY KEY, token TEXT NOT NULL, last_valid REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS fm_sessions_token ON fm_sessions (token)")
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    # The file holds live session tokens: it is created readable by this user only, and an existing
+    # file that belongs to someone else or that other users can access is refused
+    def _check_private(self):
+        try:
+            os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+        except FileExistsError:
+            pass
+        if os.name != "posix":
+            return
+        info = os.stat(self.path)
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"Session store {self.path} is not owned by the server's user")
+        if info.st_mode & 0o077:
+            raise PermissionError(f"Session store {self.path} is accessible to other users; chmod 600 it")
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key)
+
+    # Returns (token, seconds since it was last known valid), or None
+    def get(self, key):
+        row = self._db().execute(
+            "SELECT token, last_valid FROM fm_sessions WHERE key = ?", (self._key(key),)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], max(0.0, time.time() - row[1])
+
+    def put(self, key, token):
+        self._db().execute(
+            "INSERT OR REPLACE INTO fm_sessions (key, token, last_valid) VALUES (?, ?, ?)",
+            (self._key(key), token, time.time()),
+        )
+
+    def touch(self, token):
+        self._db().execute("UPDATE fm_sessions SET last_valid = ? WHERE token = ?", (time.time(), token))
+
+    def delete(self, key):
+        self._db().execute("DELETE FROM fm_sessions WHERE key = ?", (self._key(key),))
+
+    def delete_token(self, token):
+        self._db().execute("DELETE FROM fm_sessions WHERE token = ?", (token,))
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,34 @@
+import asyncio
+
+
+class SingleFlight:
+    # Coalesces concurrent calls that share a key: the first caller starts the work and every
+    # caller arriving while it is in flight awaits the same result (or the same exception).
+
+    def __init__(self):
+        self._calls = {}
+
+    def in_flight(self, key):
+        return key in self._calls
+
+    # Detaches in-flight calls whose key matches; callers already waiting still get their result,
+    # but later callers start a fresh call
+    def forget(self, predicate):
+        for key in [key for key in self._calls if predicate(key)]:
+            del self._calls[key]
+
+    async def do(self, key, fn, *args, **kwargs):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # Shield the shared task so one cancelled caller does not cancel it for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when every waiter has gone away
+        if not task.cancelled():
+            task.exception()
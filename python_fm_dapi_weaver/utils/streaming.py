@@ -0,0 +1,194 @@
+import inspect
+import uuid
+from collections import deque
+from tempfile import SpooledTemporaryFile
+from fastapi import HTTPException
+from .. import config
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.multipart import parse_options_header
+
+
+class MultipartStreamReader:
+    # Incremental multipart/form-data reader over the raw request stream.
+    # Text fields are collected as they arrive; the upload part is handed out as an async
+    # iterator of chunks, so at most one network chunk of it is held in memory at a time.
+
+    # `max_size` bounds the whole body and `max_field_size` each text field, in bytes (0 = no limit)
+    def __init__(self, request, file_field="file", max_size=0, max_field_size=0):
+        _, params = parse_options_header(request.headers.get("Content-Type", ""))
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise HTTPException(status_code=400, detail="Missing multipart boundary")
+        self.file_field = file_field
+        self.max_field_size = max_field_size
+        self.fields = {}
+        self.file = None
+        self._stream = limited_body(request, max_size)
+        self._events = deque()
+        self._finished = False
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = multipart.MultipartParser(
+            boundary,
+            callbacks={
+                "on_part_begin": lambda: self._events.append(("begin", None)),
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": lambda: self._events.append(("headers", dict(self._headers))),
+                "on_part_data": lambda data, start, end: self._events.append(("data", bytes(data[start:end]))),
+                "on_part_end": lambda: self._events.append(("end", None)),
+            },
+        )
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    async def _next_event(self):
+        while not self._events:
+            if self._finished:
+                return None, None
+            try:
+                chunk = await self._stream.__anext__()
+            except StopAsyncIteration:
+                self._finished = True
+                self._parser.finalize()
+                continue
+            if chunk:
+                self._parser.write(chunk)
+        return self._events.popleft()
+
+    # Reads text fields until the upload part starts (or the body ends).
+    # If the upload arrives before `required_field`, it is spooled so the field can still be read.
+    async def read_fields(self, required_field):
+        name = None
+        value = []
+        size = 0
+        while True:
+            event, payload = await self._next_event()
+            if event is None:
+                return self.fields
+            if event == "begin":
+                self._headers = {}
+                name, value, size = None, [], 0
+            elif event == "headers":
+                _, disposition = parse_options_header(payload.get(b"content-disposition", b""))
+                name = disposition.get(b"name", b"").decode("latin-1")
+                if b"filename" in disposition and name == self.file_field:
+                    self.file = {
+                        "filename": disposition[b"filename"].decode("utf-8", "replace"),
+                        "content_type": payload.get(b"content-type", b"application/octet-stream").decode("latin-1"),
+                    }
+                    if required_field in self.fields:
+                        return self.fields
+                    self.file["spool"] = await self._spool_file()
+                elif b"filename" in disposition:
+                    # Ignore any other uploaded part
+                    name = None
+            elif event == "data" and name is not None:
+                size += len(payload)
+                if self.max_field_size and size > self.max_field_size:
+                    raise body_too_large(self.max_field_size)
+                value.append(payload)
+            elif event == "end" and name is not None:
+                self.fields[name] = b"".join(value).decode("utf-8")
+                name = None
+                if required_field in self.fields and self.file is not None:
+                    return self.fields
+
+    async def _spool_file(self):
+        spool = SpooledTemporaryFile(max_size=config.FM_UPLOAD_CHUNK_SIZE * 16)
+        async for chunk in self._file_part_chunks():
+            spool.write(chunk)
+        spool.seek(0)
+        return spool
+
+    async def _file_part_chunks(self):
+        while True:
+            event, payload = await self._next_event()
+            if event is None or event == "end":
+                return
+            if event == "data":
+                yield payload
+
+    # Async iterator over the bytes of the upload part
+    async def file_chunks(self):
+        spool = self.file.get("spool") if self.file else None
+        if spool is None:
+            async for chunk in self._file_part_chunks():
+                yield chunk
+            return
+        try:
+            while True:
+                chunk = spool.read(config.FM_UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            spool.close()
+
+
+def body_too_large(max_size):
+    return HTTPException(status_code=413, detail=f"Request body is larger than {max_size} bytes")
+
+
+# Yields the raw request body, answering 413 as soon as more than `max_size` bytes have arrived
+# (0 = no limit). A declared Content-Length over the limit is rejected before anything is read.
+async def limited_body(request, max_size):
+    content_length = request.headers.get("Content-Length", "")
+    if max_size and content_length.isdigit() and int(content_length) > max_size:
+        raise body_too_large(max_size)
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if max_size and received > max_size:
+            raise body_too_large(max_size)
+        yield chunk
+
+
+# Builds a single-file multipart/form-data body that is produced chunk by chunk.
+# Returns the Content-Type header value and the async body iterator.
+def multipart_file_body(field_name, filename, content_type, chunks):
+    boundary = uuid.uuid4().hex
+    # Same escaping browsers and httpx use for the filename parameter
+    quoted_filename = filename.replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field_name}"; filename="{quoted_filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    async def body():
+        yield head
+        async for chunk in chunks:
+            yield chunk
+        yield tail
+
+    return f"multipart/form-data; boundary={boundary}", body()
+
+
+# Yields everything from `chunks`, then runs `cleanup` - also when the client disconnects
+# mid-stream, where a response background task would be skipped
+async def close_after(chunks, cleanup):
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        result = cleanup()
+        if inspect.isawaitable(result):
+            await result
@@ -0,0 +1,76 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from .. import config
+from . import fast_json
+
+# Trace lines are logged at INFO; where they go is up to the application's logging setup
+logger = logging.getLogger(__name__)
+
+# Trace of the dataApi request being handled; tasks started by the request inherit it
+current_trace = ContextVar("fm_trace", default=None)
+
+# Order of the phases in the Server-Timing header and the log line
+PHASES = ("parse", "validate_token", "validate_session", "upstream", "serialize")
+
+
+class RequestTrace:
+    # Time spent per phase of one request. Phases that run more than once, or concurrently
+    # (e.g. parallel page fetches), add up, so "upstream" can exceed the wall-clock total.
+
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def server_timing(self):
+        entries = [f"{name};dur={self.phases[name] * 1000:.1f}" for name in PHASES if name in self.phases]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    # One JSON line per sampled request. Only the fields below are logged: never the
+    # Authorization header, session tokens or record data.
+    def log(self, body, status):
+        if not self.sampled:
+            return
+        method_body = body.get("methodBody") if isinstance(body, dict) else None
+        method_body = method_body if isinstance(method_body, dict) else {}
+        entry = {
+            "method": body.get("method") if isinstance(body, dict) else None,
+            "fmServer": body.get("fmServer") if isinstance(body, dict) else None,
+            "database": method_body.get("database"),
+            "layout": method_body.get("layout"),
+            "status": status,
+            "totalMs": round((time.perf_counter() - self.started) * 1000, 1),
+            "phasesMs": {name: round(self.phases[name] * 1000, 1) for name in PHASES if name in self.phases},
+        }
+        logger.info(fast_json.dumps(entry).decode("utf-8"))
+
+
+# Starts a trace for the current request when timings are reported or the request is sampled
+def start_trace():
+    sampled = config.FM_TRACE_SAMPLE_RATE > 0 and random.random() < config.FM_TRACE_SAMPLE_RATE
+    if not (config.FM_SERVER_TIMING or sampled):
+        return None
+    trace = RequestTrace(sampled)
+    current_trace.set(trace)
+    return trace
+
+
+# Adds the time spent in the block to `name` on the current trace, if any
+@contextmanager
+def phase(name):
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
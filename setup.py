@@ -25,9 +25,16 @@ setup(
     install_requires=[
         "fastapi",
         "uvicorn",
-        "requests",
+        "httpx",
         "python-multipart",
     ],
+    extras_require={
+        "fast-json": ["orjson"],
+        "server": ["uvloop; sys_platform != 'win32'", "httptools"],
+        "compression": ["brotli", "zstandard"],
+        "arrow": ["pyarrow"],
+        "dev": ["pytest", "requests", "python-dotenv"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Programming Language :: Python :: 3.10",
@@ -0,0 +1,114 @@
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+# The benchmark harness's FileMaker Data API simulator stands in for FileMaker Server
+sys.path.insert(0, str(ROOT / "benchmarks"))
+sys.path.insert(0, str(ROOT))
+
+import fm_simulator
+from fm_simulator import create_app, SimulatorSettings
+from python_fm_dapi_weaver.utils.fm_client import fm_client
+from python_fm_dapi_weaver.utils.session_cache import session_cache
+
+# Basic auth token the simulator accepts ("user:pass")
+BASIC_AUTH = "dXNlcjpwYXNz"
+
+
+class SimulatorClock:
+    # Modification timestamps of the simulator, `step` seconds apart, so tests decide which edits
+    # share a second
+
+    def __init__(self, step=1):
+        self.now = 1767225600
+        self.step = step
+
+    def __call__(self):
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.now))
+        self.now += self.step
+        return stamp
+
+
+class Simulator:
+    # Answers the calls of a FileMakerClient from the simulator app and records each one.
+    # Calls listed in `failures` (a list of httpx.Response or exceptions) are answered with those first.
+
+    def __init__(self, records=50):
+        self.client = TestClient(create_app(SimulatorSettings(records=records, latency_ms=0, jitter_ms=0)))
+        self.calls = []
+        self.failures = []
+        # Called with each request before it is answered, e.g. to change data mid-read
+        self.before_call = None
+
+    async def handle(self, request):
+        self.calls.append((request.method, request.url.path))
+        if self.before_call is not None:
+            self.before_call(request)
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return failure
+        response = self.client.request(
+            request.method, request.url.raw_path.decode(), headers=dict(request.headers), content=request.content
+        )
+        return httpx.Response(response.status_code, content=response.content, headers=response.headers)
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    def count(self, method, suffix):
+        return sum(1 for call in self.calls if call[0] == method and call[1].endswith(suffix))
+
+    # Edits a record behind the weaver's back, as another FileMaker client would
+    def edit(self, record_id, **field_data):
+        response = self.client.patch(
+            f"/fmi/data/vLatest/databases/d/layouts/l/records/{record_id}",
+            headers={"Authorization": f"Bearer {self.login()}"},
+            json={"fieldData": field_data},
+        )
+        assert response.status_code == 200
+
+    def login(self):
+        response = self.client.post(
+            "/fmi/data/vLatest/databases/d/sessions", headers={"Authorization": f"Basic {BASIC_AUTH}"}, json={}
+        )
+        return response.json()["response"]["token"]
+
+
+# A fresh simulator behind the shared fm_client, with no tokens cached from other tests
+@pytest.fixture
+def simulator(monkeypatch):
+    clock = SimulatorClock()
+    monkeypatch.setattr(fm_simulator, "timestamp", clock)
+    simulator = Simulator()
+    simulator.clock = clock
+    monkeypatch.setattr(fm_client, "transport", simulator.transport())
+    monkeypatch.setattr(fm_client, "_clients", OrderedDict())
+    monkeypatch.setattr(fm_client, "_breakers", OrderedDict())
+    monkeypatch.setattr(fm_client, "_users", {})
+    monkeypatch.setattr(fm_client, "_retired", {})
+    session_cache.clear()
+    yield simulator
+    session_cache.clear()
+
+
+# Calls the weaver's /api/dataApi with the simulator's credentials and returns the response
+@pytest.fixture
+def weaver(simulator):
+    from python_fm_dapi_weaver.main import app
+    client = TestClient(app)
+
+    def call(method, layout="l", headers=None, session=None, **method_body):
+        body = {"fmServer": "sim", "method": method, "methodBody": {"database": "d", "layout": layout, **method_body}}
+        if session is not None:
+            body["session"] = session
+        return client.post("/api/dataApi", json=body, headers={"Authorization": f"Basic {BASIC_AUTH}", **(headers or {})})
+
+    call.client = client
+    return call
@@ -14,6 +14,9 @@ FM_USERNAME = os.getenv("FM_USERNAME")
 FM_PASSWORD = os.getenv("FM_PASSWORD")
 URL = os.getenv("URL")
 
+# These tests call a running server backed by a real FileMaker database, configured in .env
+pytestmark = pytest.mark.skipif(not URL, reason="URL of a running server is not set")
+
 
 @pytest.fixture
 def auth_headers():
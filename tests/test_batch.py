@@ -0,0 +1,49 @@
+import pytest
+from conftest import BASIC_AUTH
+from python_fm_dapi_weaver.utils.session_cache import credentials_key, session_cache
+
+
+def test_operations_run_and_report_each_result(weaver, simulator):
+    response = weaver("batch", operations=[
+        {"method": "createRecord", "methodBody": {"record": {"name": "New"}}},
+        {"method": "updateRecord", "methodBody": {"recordId": "1", "record": {"name": "Renamed"}}},
+        {"method": "findRecord", "methodBody": {"query": [{"name": "Renamed"}]}},
+        {"method": "deleteRecord", "methodBody": {"recordId": "999"}},
+        {"method": "signOut"},
+    ], concurrency=1)
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert [item["status"] for item in result["results"]] == ["ok", "ok", "ok", "error", "error"]
+    assert (result["succeeded"], result["failed"]) == (3, 2)
+    assert result["results"][2]["result"]["records"][0]["recordId"] == "1"
+    assert result["results"][4]["statusCode"] == 400
+    # The batch signs in once for all of its operations
+    assert simulator.count("POST", "/sessions") == 1
+
+
+def test_operations_rejected_for_an_expired_session_run_again(weaver, simulator):
+    assert weaver("findRecord", query=[{"name": "*"}], limit=1).status_code == 200
+    token = session_cache.get(credentials_key("sim", "d", BASIC_AUTH))
+    assert token is not None
+    # FileMaker forgets the cached token, e.g. after a restart
+    simulator.client.delete(f"/fmi/data/vLatest/databases/d/sessions/{token}")
+
+    response = weaver("batch", operations=[
+        {"method": "updateRecord", "methodBody": {"recordId": str(record_id), "record": {"name": "Batch"}}}
+        for record_id in range(1, 6)
+    ])
+    result = response.json()
+    assert result["succeeded"] == 5
+    assert result["session"] != token
+    assert simulator.count("POST", "/sessions") == 2
+    assert simulator.count("PATCH", "/records/1") == 2
+
+
+@pytest.mark.parametrize("method_body", [
+    {},
+    {"operations": []},
+    {"operations": [{"method": "findRecord"}], "concurrency": "x"},
+    {"operations": [{"method": "findRecord"}], "concurrency": -2},
+])
+def test_invalid_batches_are_rejected(weaver, method_body):
+    assert weaver("batch", **method_body).status_code == 400
@@ -0,0 +1,77 @@
+import asyncio
+import gzip
+import json
+import pytest
+from python_fm_dapi_weaver.utils.compression import CompressionMiddleware, negotiate
+
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+def test_large_responses_are_compressed(weaver):
+    response = weaver("getAllRecords", limit=50, headers=GZIP)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert len(response.json()["records"]) == 50
+
+
+def test_small_responses_and_clients_without_gzip_get_plain_bodies(weaver):
+    assert "Content-Encoding" not in weaver("getAllRecords", limit=1, headers=GZIP).headers
+    assert "Content-Encoding" not in weaver("getAllRecords", limit=50, headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_streams_are_compressed_chunk_by_chunk(weaver):
+    response = weaver("getAllRecords", stream=True, pageSize=10, headers=GZIP)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert len(response.text.splitlines()) == 50
+
+
+# Only gzip is always available; br and zstd need the brotli/zstandard packages
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip", "gzip"),
+    ("GZIP;q=0.5, deflate", "gzip"),
+    ("*", "gzip"),
+    ("gzip;q=0, *", None),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiation(accept, expected):
+    assert negotiate(accept, ("gzip",)) == expected
+    assert negotiate(accept, ()) is None
+
+
+# Runs `app` behind the middleware and returns the (start, body) messages it sent
+def respond(status, headers, chunks):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        for index, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": index < len(chunks) - 1})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "path": "/api/dataApi", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(CompressionMiddleware(app, encodings=("gzip",), minimum_size=10)(scope, None, send))
+    start = messages[0]
+    return dict(start["headers"]), b"".join(message.get("body", b"") for message in messages[1:])
+
+
+def test_partial_and_binary_responses_are_sent_as_they_are():
+    body = b"x" * 100
+    for status, headers in [
+        (206, [(b"content-type", b"text/plain"), (b"content-range", b"bytes 0-99/1000")]),
+        (200, [(b"content-type", b"image/jpeg")]),
+        (200, [(b"content-type", b"application/vnd.apache.parquet")]),
+    ]:
+        sent_headers, sent_body = respond(status, headers, [body])
+        assert b"content-encoding" not in sent_headers
+        assert sent_body == body
+
+
+def test_streamed_chunks_decode_to_the_original_body():
+    chunks = [json.dumps({"line": index}).encode() + b"\n" for index in range(20)]
+    headers, body = respond(200, [(b"content-type", b"application/x-ndjson")], chunks)
+    assert headers[b"content-encoding"] == b"gzip"
+    assert gzip.decompress(body) == b"".join(chunks)
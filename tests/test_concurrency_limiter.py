@@ -0,0 +1,174 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from python_fm_dapi_weaver.utils.concurrency_limiter import ConcurrencyLimiter, HostLimiter, concurrency_limiter
+
+
+# Queues `waiters` ((caller, priority) pairs, in arrival order) behind a full limiter, then frees
+# the slot and returns the order in which the waiters were admitted
+async def admission_order(waiters, limit=1):
+    limiter = HostLimiter("fm", limit)
+    held = [await limiter.acquire("holder", 1, None) for _ in range(limit)]
+    order = []
+
+    async def wait(name, caller, priority):
+        slot = await limiter.acquire(caller, priority, None)
+        order.append(name)
+        await asyncio.sleep(0)
+        slot.release()
+
+    tasks = []
+    for name, (caller, priority) in enumerate(waiters):
+        tasks.append(asyncio.ensure_future(wait(name, caller, priority)))
+        await asyncio.sleep(0)
+    assert limiter.queued == len(waiters)
+    for slot in held:
+        slot.release()
+    await asyncio.gather(*tasks)
+    assert (limiter.active, limiter.queued) == (0, 0)
+    return order
+
+
+def test_callers_take_turns():
+    waiters = [("a", 1), ("a", 1), ("a", 1), ("b", 1), ("c", 1)]
+    assert asyncio.run(admission_order(waiters)) == [0, 3, 4, 1, 2]
+
+
+def test_higher_priority_goes_first():
+    waiters = [("a", 1), ("b", 1), ("c", 0), ("a", 0)]
+    assert asyncio.run(admission_order(waiters)) == [2, 3, 0, 1]
+
+
+def test_limit_is_never_exceeded():
+    async def run():
+        limiter = HostLimiter("fm", 3)
+        peak = [0]
+
+        async def request(caller):
+            slot = await limiter.acquire(caller, 1, None)
+            peak[0] = max(peak[0], limiter.active)
+            await asyncio.sleep(0.001)
+            slot.release()
+
+        await asyncio.gather(*[request(index % 4) for index in range(40)])
+        return limiter, peak[0]
+
+    limiter, peak = asyncio.run(run())
+    assert peak == 3
+    assert limiter.admitted == 40
+    assert limiter.active == 0
+
+
+def test_queue_timeout_answers_503_and_leaves_the_queue():
+    async def run():
+        limiter = HostLimiter("fm", 1)
+        slot = await limiter.acquire("a", 1, None)
+        with pytest.raises(HTTPException) as error:
+            await limiter.acquire("b", 1, 0.01)
+        assert (limiter.queued, limiter.timeouts) == (0, 1)
+        slot.release()
+        assert limiter.active == 0
+        return error.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert error.headers["Retry-After"] == "1"
+
+
+def test_cancelled_waiter_does_not_hold_a_slot():
+    async def run():
+        limiter = HostLimiter("fm", 1)
+        slot = await limiter.acquire("a", 1, None)
+        waiter = asyncio.ensure_future(limiter.acquire("b", 1, None))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        slot.release()
+        slot.release()  # releasing twice is harmless
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert (limiter.active, limiter.queued) == (0, 0)
+
+
+def test_limits_per_host_and_priorities_per_method():
+    async def run():
+        limiter = ConcurrencyLimiter(0, {"busy": 1}, False, 0.01, {"batch": 2})
+        assert await limiter.acquire("other", "d", "a", "findRecord") is None
+        slot = await limiter.acquire("busy", "d", "a", "findRecord")
+        with pytest.raises(HTTPException):
+            await limiter.acquire("busy", "d2", "b", "findRecord")
+        slot.release()
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert limiter.priority_for("findRecord") == 0
+    assert limiter.priority_for("batch") == 2
+    assert limiter.priority_for("unknown") == 1
+    assert limiter.stats()[0]["timeouts"] == 1
+
+
+def test_wide_requests_use_several_units_and_are_not_overtaken():
+    async def run():
+        limiter = HostLimiter("fm", 4)
+        held = await limiter.acquire("a", 1, None, weight=3)
+        wide = asyncio.ensure_future(limiter.acquire("b", 1, None, weight=2))
+        await asyncio.sleep(0)
+        narrow = asyncio.ensure_future(limiter.acquire("c", 1, None))
+        await asyncio.sleep(0)
+        # One unit is free, but the wide request queued first
+        assert (limiter.active, limiter.queued) == (3, 2)
+        held.release()
+        wide_slot, narrow_slot = await asyncio.gather(wide, narrow)
+        assert (wide_slot.weight, limiter.active) == (2, 3)
+
+        # Wider than the host's limit is admitted with the whole limit
+        too_wide = asyncio.ensure_future(limiter.acquire("d", 1, None, weight=10))
+        await asyncio.sleep(0)
+        wide_slot.release()
+        narrow_slot.release()
+        slot = await too_wide
+        assert slot.weight == limiter.active == 4
+        slot.release()
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert (limiter.active, limiter.queued) == (0, 0)
+
+
+def test_cancelled_wide_waiter_lets_the_next_ones_in():
+    async def run():
+        limiter = HostLimiter("fm", 2)
+        held = await limiter.acquire("a", 1, None)
+        wide = asyncio.ensure_future(limiter.acquire("b", 1, None, weight=2))
+        await asyncio.sleep(0)
+        narrow = asyncio.ensure_future(limiter.acquire("c", 1, None))
+        await asyncio.sleep(0)
+        wide.cancel()
+        await asyncio.gather(wide, return_exceptions=True)
+        slot = await asyncio.wait_for(narrow, 1)
+        slot.release()
+        held.release()
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert (limiter.active, limiter.queued) == (0, 0)
+
+
+def test_batches_and_parallel_reads_are_charged_their_width(weaver, simulator, monkeypatch):
+    monkeypatch.setattr(concurrency_limiter, "host_limits", {"sim": 3})
+    monkeypatch.setattr(concurrency_limiter, "_limiters", {})
+
+    # The units of the host's limit in use while FileMaker answers the calls of one request
+    def charged(method, **method_body):
+        active = set()
+        simulator.before_call = lambda request: active.add(concurrency_limiter.stats()[0]["active"])
+        assert weaver(method, **method_body).status_code == 200
+        assert concurrency_limiter.stats()[0]["active"] == 0
+        return active
+
+    updates = [{"method": "updateRecord", "methodBody": {"recordId": str(record_id), "record": {"name": "x"}}} for record_id in range(1, 9)]
+    assert charged("batch", operations=updates, concurrency=8) == {3}
+    assert charged("batch", operations=updates[:2]) == {2}
+    assert charged("getAllRecords", parallel=2, pageSize=10) == {2}
+    assert charged("findRecord", query=[{"name": "*"}], limit=5) == {1}
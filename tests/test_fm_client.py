@@ -0,0 +1,187 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+from python_fm_dapi_weaver import config
+from python_fm_dapi_weaver.utils import circuit_breaker
+from python_fm_dapi_weaver.utils.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+from python_fm_dapi_weaver.utils.fm_client import FileMakerClient, is_idempotent
+from python_fm_dapi_weaver.utils import metrics
+
+
+def busy():
+    return httpx.Response(503)
+
+
+def fm_busy():
+    return httpx.Response(500, json={"response": {}, "messages": [{"code": "812", "message": "Exceeded host's capacity"}]})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def client(simulator, monkeypatch):
+    monkeypatch.setattr(config, "FM_RETRY_ATTEMPTS", 2)
+    monkeypatch.setattr(config, "FM_RETRY_BACKOFF", 0.0)
+    monkeypatch.setattr(config, "FM_BREAKER_FAILURES", 3)
+    monkeypatch.setattr(config, "FM_BREAKER_RESET_TIMEOUT", 30.0)
+    return FileMakerClient(transport=simulator.transport())
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("fm", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock[0] += 10
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "20"
+    assert breaker.rejected == 1
+
+
+def test_half_open_breaker_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("fm", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # A failed probe opens the circuit again, a successful one closes it
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock[0] += 30
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_abandoned_probe_frees_the_probe_slot(clock):
+    breaker = CircuitBreaker("fm", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    breaker.before_call()
+    breaker.abandon()
+    breaker.before_call()
+
+
+def test_disabled_breaker_never_opens():
+    breaker = CircuitBreaker("fm", failure_threshold=0, reset_timeout=30)
+    for _ in range(10):
+        breaker.record_failure()
+        breaker.before_call()
+    assert breaker.state == CLOSED
+
+
+def test_idempotent_calls():
+    assert is_idempotent("GET", "databases/d/layouts/l/records")
+    assert is_idempotent("POST", "databases/d/layouts/l/_find", {"query": [{"city": "Pune"}]})
+    assert not is_idempotent("POST", "databases/d/layouts/l/records", {"fieldData": {}})
+    assert not is_idempotent("PATCH", "databases/d/layouts/l/records/1")
+    for script in ("script", "script.prerequest", "script.presort"):
+        assert not is_idempotent("POST", "databases/d/layouts/l/_find", {"query": [], script: "Log"})
+    assert not is_idempotent("GET", "databases/d/layouts/l/records", params={"script": "Log"})
+
+
+def test_reads_are_retried_on_busy_answers(simulator, client):
+    token = simulator.login()
+    simulator.failures = [busy(), fm_busy()]
+
+    response = asyncio.run(client.post("sim", "databases/d/layouts/l/_find", token=token, json={"query": [{"city": "Pune"}]}))
+    assert response.status_code == 200
+    assert simulator.count("POST", "/_find") == 3
+    assert client.breaker_for("sim").state == CLOSED
+
+
+def test_reads_give_up_after_the_retry_attempts(simulator, client):
+    token = simulator.login()
+    simulator.failures = [busy() for _ in range(4)]
+
+    response = asyncio.run(client.get("sim", "databases/d/layouts/l/records", token=token))
+    assert response.status_code == 503
+    assert simulator.count("GET", "/records") == 3
+
+
+def test_writes_and_scripted_finds_are_not_retried(simulator, client):
+    token = simulator.login()
+    simulator.failures = [busy(), busy()]
+
+    async def run():
+        write = await client.post("sim", "databases/d/layouts/l/records", token=token, json={"fieldData": {"name": "x"}})
+        find = await client.post("sim", "databases/d/layouts/l/_find", token=token, json={"query": [{"city": "Pune"}], "script": "Log"})
+        return write, find
+
+    write, find = asyncio.run(run())
+    assert (write.status_code, find.status_code) == (503, 503)
+    assert simulator.count("POST", "/records") == 1
+    assert simulator.count("POST", "/_find") == 1
+
+
+def test_writes_are_retried_when_nothing_was_sent(simulator, client):
+    token = simulator.login()
+    simulator.failures = [httpx.ConnectError("refused")]
+
+    response = asyncio.run(client.post("sim", "databases/d/layouts/l/records", token=token, json={"fieldData": {"name": "x"}}))
+    assert response.status_code == 200
+    assert simulator.count("POST", "/records") == 2
+
+
+def test_open_breaker_fails_fast_without_calling_the_host(simulator, client):
+    token = simulator.login()
+    simulator.failures = [busy() for _ in range(3)]
+
+    async def run():
+        first = await client.get("sim", "databases/d/layouts/l/records", token=token)
+        with pytest.raises(CircuitOpenError):
+            await client.get("sim", "databases/d/layouts/l/records", token=token)
+        return first
+
+    assert asyncio.run(run()).status_code == 503
+    assert simulator.count("GET", "/records") == 3
+    assert client.breaker_for("sim").state == OPEN
+
+
+def test_least_recently_used_hosts_are_dropped():
+    async def run():
+        answer_slow_call = asyncio.Event()
+
+        async def handle(request):
+            if request.url.path.endswith("/slow"):
+                await answer_slow_call.wait()
+            return httpx.Response(200, json={"response": {}, "messages": [{"code": "0"}]})
+
+        client = FileMakerClient(transport=httpx.MockTransport(handle), max_hosts=2)
+        # A call still waiting on host "a" keeps its pool open after the pool is evicted
+        slow = asyncio.ensure_future(client.get("a", "slow"))
+        await asyncio.sleep(0)
+        first = client.client_for("a")
+        for fm_server in ("b", "a", "c", "d"):
+            await client.get(fm_server, "records")
+        assert list(client._clients) == ["c", "d"]
+        assert list(client._breakers) == ["c", "d"]
+        assert not first.is_closed
+        answer_slow_call.set()
+        assert (await slow).status_code == 200
+        assert first.is_closed
+        assert client._retired == {} and client._users == {}
+
+        download = await client.stream_url("http://e/container.bin")
+        await download.aclose()
+        assert client._users == {}
+        await client.close()
+
+    asyncio.run(run())
+    assert {labels[0] for labels in metrics.upstream_in_flight._values}.isdisjoint({"a", "b"})
@@ -0,0 +1,58 @@
+from collections import OrderedDict
+import pytest
+from python_fm_dapi_weaver.utils.layout_metadata import layout_metadata
+
+
+@pytest.fixture(autouse=True)
+def empty_metadata_cache(monkeypatch):
+    monkeypatch.setattr(layout_metadata, "_entries", OrderedDict())
+
+
+def metadata_calls(simulator):
+    return simulator.count("GET", "/layouts/l")
+
+
+def test_layout_metadata_is_cached(weaver, simulator):
+    first = weaver("getLayoutMetadata").json()
+    assert [field["name"] for field in first["fieldMetaData"]][:3] == ["id", "name", "city"]
+    weaver("getLayoutMetadata")
+    assert metadata_calls(simulator) == 1
+    weaver("getLayoutMetadata", refresh=True)
+    assert metadata_calls(simulator) == 2
+
+
+def test_records_are_checked_against_the_layout(weaver, simulator):
+    response = weaver("createRecord", validate=True, record={"name": "New", "colour": "red", "amount": "lots", "photo": "x"})
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert "unknown fields 'colour'" in detail
+    assert "'amount' expects a number" in detail
+    assert "'photo' is a container field" in detail
+    assert simulator.count("POST", "/records") == 0
+
+    assert weaver("createRecord", validate=True, record={"name": "New", "amount": " 12 "}).status_code == 200
+    assert weaver("updateRecord", validate=True, recordId="1", record={"ModificationTimestamp": "2026-01-02T03:04:05"}).status_code == 200
+    assert metadata_calls(simulator) == 1
+    assert simulator.count("POST", "/records") == 1
+
+
+def test_finds_are_checked_against_the_layout(weaver, simulator):
+    response = weaver("findRecord", validate=True, query=[{"colour": "red"}], sort=[{"fieldName": "size", "sortOrder": "ascend"}])
+    assert response.status_code == 400
+    assert "'colour', 'size'" in response.json()["detail"]
+    assert weaver("findRecord", validate=True, query=[{"city": "Pune", "omit": "true"}, {"name": "*"}]).status_code == 200
+    assert simulator.count("POST", "/_find") == 1
+
+
+def test_validation_is_off_unless_asked_for(weaver, simulator):
+    weaver("createRecord", record={"name": "New", "colour": "red"})
+    assert metadata_calls(simulator) == 0
+    assert simulator.count("POST", "/records") == 1
+
+
+def test_stale_metadata_is_fetched_again_before_rejecting(weaver, simulator):
+    weaver("getLayoutMetadata")
+    for fields in layout_metadata._entries.values():
+        fields.fetched_at -= 60
+    assert weaver("createRecord", validate=True, record={"colour": "red"}).status_code == 400
+    assert metadata_calls(simulator) == 2
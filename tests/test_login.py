@@ -0,0 +1,64 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+from conftest import BASIC_AUTH
+from python_fm_dapi_weaver.controllers.auth import fm_login_shared
+from python_fm_dapi_weaver.utils.session_cache import credentials_key, session_cache
+from python_fm_dapi_weaver.utils.singleflight import SingleFlight
+
+
+def test_concurrent_logins_share_one_call(simulator):
+    async def run():
+        return await asyncio.gather(*[fm_login_shared("sim", "d", BASIC_AUTH) for _ in range(5)])
+
+    tokens = asyncio.run(run())
+    assert len(set(tokens)) == 1
+    assert simulator.count("POST", "/sessions") == 1
+    assert session_cache.get(credentials_key("sim", "d", BASIC_AUTH)) == tokens[0]
+
+
+def test_failed_login_is_raised_to_every_waiter_and_not_kept(simulator):
+    simulator.failures = [httpx.Response(401, json={"response": {}, "messages": [{"code": "212", "message": "Invalid user account and/or password"}]})]
+
+    async def run():
+        return await asyncio.gather(*[fm_login_shared("sim", "d", BASIC_AUTH) for _ in range(3)], return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert all(isinstance(error, HTTPException) and error.status_code == 401 for error in errors)
+    assert simulator.count("POST", "/sessions") == 1
+
+    # The next login is a new call
+    assert asyncio.run(fm_login_shared("sim", "d", BASIC_AUTH))
+    assert simulator.count("POST", "/sessions") == 2
+
+
+def test_other_credentials_log_in_separately(simulator):
+    async def run():
+        return await asyncio.gather(fm_login_shared("sim", "d", BASIC_AUTH), fm_login_shared("sim", "other", BASIC_AUTH))
+
+    first, second = asyncio.run(run())
+    assert first != second
+    assert simulator.count("POST", "/sessions") == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    async def run():
+        flights = SingleFlight()
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.01)
+            return "done"
+
+        first = asyncio.ensure_future(flights.do("key", work))
+        second = asyncio.ensure_future(flights.do("key", work))
+        await started.wait()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        result = await second
+        return result, flights.in_flight("key")
+
+    assert asyncio.run(run()) == ("done", False)
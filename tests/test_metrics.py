@@ -0,0 +1,17 @@
+import pytest
+from python_fm_dapi_weaver.utils import metrics
+
+
+@pytest.mark.parametrize("path", ["/api/metrics", "/metrics"])
+def test_metrics_are_served_in_the_prometheus_format(weaver, path):
+    weaver("getAllRecords", limit=1)
+    response = weaver.client.get(path)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    assert 'fm_weaver_requests_total{method="getAllRecords",status="200"}' in response.text
+    assert "# TYPE fm_weaver_upstream_duration_seconds histogram" in response.text
+
+
+def test_unknown_methods_share_one_label(weaver):
+    weaver("dropDatabase")
+    assert 'method="dropDatabase"' not in weaver.client.get("/metrics").text
@@ -0,0 +1,57 @@
+import json
+from collections import OrderedDict
+import pytest
+from python_fm_dapi_weaver.controllers import records
+from python_fm_dapi_weaver.utils.layout_metadata import layout_metadata
+
+
+@pytest.fixture
+def sent(simulator, monkeypatch):
+    monkeypatch.setattr(layout_metadata, "_entries", OrderedDict())
+    requests = []
+    simulator.before_call = requests.append
+    return requests
+
+
+def reads(sent):
+    return [request for request in sent if request.url.path.endswith(("/records", "/_find"))]
+
+
+def test_fields_select_and_order_the_returned_fields(weaver):
+    response = weaver("getAllRecords", limit=2, fields=["status", "name", "missing"])
+    assert [list(record) for record in response.json()["records"]] == [["recordId", "status", "name"]] * 2
+
+    streamed = weaver("findRecord", query=[{"name": "*"}], stream=True, pageSize=2, limit=3, fields=["city"])
+    assert [list(json.loads(line)) for line in streamed.text.splitlines()] == [["recordId", "city"]] * 3
+
+
+@pytest.mark.parametrize("fields", ["name", [1], {"name": True}])
+def test_fields_must_be_a_list_of_names(weaver, simulator, fields):
+    assert weaver("getAllRecords", fields=fields).status_code == 400
+
+
+def test_portal_windows_are_passed_to_filemaker(weaver, sent):
+    records = weaver("getAllRecords", limit=1, portal=["Orders"], **{"limit.Orders": 5, "offset.Orders": 2}).json()["records"]
+    assert records[0]["portalData"] == {}
+    weaver("findRecord", query=[{"name": "*"}], limit=1, portal=["Orders"], **{"limit.Orders": 5})
+
+    get, find = reads(sent)
+    assert get.url.params["portal"] == '["Orders"]'
+    assert (get.url.params["_limit.Orders"], get.url.params["_offset.Orders"]) == ("5", "2")
+    body = json.loads(find.content)
+    assert (body["portal"], body["limit.Orders"]) == (["Orders"], 5)
+
+
+def test_reads_asking_for_fields_on_the_slim_layout_go_through_it(weaver, sent, monkeypatch):
+    monkeypatch.setattr(records, "RESPONSE_LAYOUTS", {"l": "l_slim"})
+    weaver("getAllRecords", limit=1, fields=["name", "city"])
+    weaver("findRecord", query=[{"name": "*"}], limit=1, fields=["name"])
+    # Fields the slim layout lacks, or no fields at all, keep the full layout
+    weaver("getAllRecords", limit=1, fields=["name", "colour"])
+    weaver("getAllRecords", limit=1)
+
+    get, find, unknown, everything = reads(sent)
+    assert get.url.params["layout.response"] == "l_slim"
+    assert json.loads(find.content)["layout.response"] == "l_slim"
+    assert "layout.response" not in unknown.url.params
+    assert "layout.response" not in everything.url.params
@@ -0,0 +1,52 @@
+import asyncio
+from python_fm_dapi_weaver.controllers.records import ReadScope, fetch_records_page, invalidate_reads
+
+FIND = "databases/d/layouts/l/_find"
+
+
+def scope(credentials="a", coalesce=True):
+    return ReadScope(("sim", "d", "l"), credentials, False, coalesce)
+
+
+def find(token, read_scope, query=None):
+    return fetch_records_page("POST", "sim", FIND, token, "error", scope=read_scope, json={"query": query or [{"city": "Pune"}]})
+
+
+def test_identical_reads_in_flight_share_one_call(simulator):
+    token = simulator.login()
+
+    async def run():
+        return await asyncio.gather(*[find(token, scope()) for _ in range(5)])
+
+    pages = asyncio.run(run())
+    assert all(page == pages[0] for page in pages)
+    assert simulator.count("POST", "/_find") == 1
+
+
+def test_reads_differing_in_query_credentials_or_scripts_are_not_merged(simulator):
+    token = simulator.login()
+
+    async def run():
+        await asyncio.gather(
+            find(token, scope()),
+            find(token, scope(), [{"city": "Oslo"}]),
+            find(token, scope("b")),
+            find(token, scope(coalesce=False)),
+            find(token, scope(coalesce=False)),
+        )
+
+    asyncio.run(run())
+    assert simulator.count("POST", "/_find") == 5
+
+
+def test_reads_after_a_write_do_not_join_a_read_started_before_it(simulator):
+    token = simulator.login()
+
+    async def run():
+        before = asyncio.ensure_future(find(token, scope()))
+        await asyncio.sleep(0)
+        invalidate_reads("sim", "d", "l")
+        await asyncio.gather(before, find(token, scope()))
+
+    asyncio.run(run())
+    assert simulator.count("POST", "/_find") == 2
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import sqlite3
+import pytest
+from fastapi import HTTPException
+from conftest import BASIC_AUTH
+from python_fm_dapi_weaver import config
+from python_fm_dapi_weaver.controllers.auth import fm_login
+from python_fm_dapi_weaver.controllers.records import read_changes
+from python_fm_dapi_weaver.utils.fm_client import fm_client
+from python_fm_dapi_weaver.utils.read_mirror import (
+    MirrorUnsupported,
+    ReadMirrorManager,
+    criterion_sql,
+    order_sql,
+    query_sql,
+)
+from python_fm_dapi_weaver.utils.session_cache import credentials_key
+
+ROWS = [
+    {"name": "John Smith", "city": "Berlin", "amount": 10},
+    {"name": "Smith", "city": "berlin", "amount": 250.5},
+    {"name": "Anna", "city": "Pune", "amount": 99},
+    {"name": "", "city": "Oslo", "amount": ""},
+    {"name": "Bob", "city": "Lima", "amount": "n/a"},
+]
+
+
+# Record ids (1-based) of ROWS matched by a Data API query, evaluated the way mirror reads are
+def matching(query, sort=None):
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE mirror (record_id INTEGER PRIMARY KEY, data TEXT)")
+    db.executemany("INSERT INTO mirror VALUES (?, ?)", [(index + 1, json.dumps(row)) for index, row in enumerate(ROWS)])
+    where, params = query_sql(query)
+    return [row[0] for row in db.execute(f"SELECT record_id FROM mirror WHERE {where} ORDER BY {order_sql(sort)}", params)]
+
+
+@pytest.mark.parametrize("criterion", ["Smith", "=Smith", "smi*", "=Smi*", 10, 2.5, True, None, "!Smith", "~Smith", '"Smith"'])
+def test_word_matching_and_unsupported_criteria_fall_back(criterion):
+    with pytest.raises(MirrorUnsupported):
+        criterion_sql("name", criterion)
+
+
+def test_unsafe_field_names_fall_back():
+    with pytest.raises(MirrorUnsupported):
+        criterion_sql('name") OR 1 --', "==x")
+
+
+def test_exact_match_ignores_case_and_covers_the_whole_field():
+    assert matching([{"name": "==smith"}]) == [2]
+    assert matching([{"city": "==BERLIN"}]) == [1, 2]
+
+
+def test_exact_match_with_wildcards():
+    assert matching([{"name": "==*Smith"}]) == [1, 2]
+    assert matching([{"name": "==@nna"}]) == [3]
+    assert matching([{"name": "==Smi"}]) == []
+
+
+def test_empty_and_not_empty():
+    assert matching([{"name": "="}]) == [4]
+    assert matching([{"name": "*"}]) == [1, 2, 3, 5]
+
+
+def test_numeric_comparisons_skip_text_values():
+    assert matching([{"amount": ">99"}]) == [2]
+    assert matching([{"amount": "<=99"}]) == [1, 3]
+    assert matching([{"amount": "10...100"}]) == [1, 3]
+    assert matching([{"amount": "==99"}]) == [3]
+
+
+def test_requests_are_ored_and_omit_requests_remove_records():
+    assert matching([{"city": "==Berlin"}, {"city": "==Pune"}]) == [1, 2, 3]
+    assert matching([{"city": "==Berlin"}, {"name": "==Smith", "omit": "true"}]) == [1]
+    assert matching([{"name": "*"}, {"city": "==Lima", "omit": "true"}, {"city": "==Oslo"}]) == [1, 2, 3, 4]
+    assert matching(None) == [1, 2, 3, 4, 5]
+
+
+def test_sort():
+    assert matching([{"name": "*"}], [{"fieldName": "name", "sortOrder": "descend"}]) == [2, 1, 5, 3]
+    with pytest.raises(MirrorUnsupported):
+        order_sql([{"fieldName": "name", "sortOrder": "Cities"}])
+
+
+def test_mirror_answers_like_filemaker_and_falls_back_after_writes(simulator, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "FM_READ_MIRROR_PATH", str(tmp_path / "mirror.sqlite3"))
+    manager = ReadMirrorManager(fm_login, read_changes)
+    mirror = manager.add_layout({"fmServer": "sim", "database": "d", "layout": "l", "authToken": BASIC_AUTH, "indexes": ["city"]})
+    credentials = credentials_key("sim", "d", BASIC_AUTH)[2]
+    query = [{"city": "==Berlin"}, {"city": "==Pune"}]
+
+    async def run():
+        assert await manager.read("sim", "d", "l", credentials, query=query) is None  # not synced yet
+        await mirror.sync()
+
+        token = simulator.login()
+        response = await fm_client.post("sim", "databases/d/layouts/l/_find", token=token, json={"query": query, "limit": 1000})
+        expected = sorted(int(record["recordId"]) for record in response.json()["response"]["data"])
+        finds = simulator.count("POST", "/_find")
+
+        mirrored = await manager.read("sim", "d", "l", credentials, query=query, limit=1000)
+        assert sorted(int(record["recordId"]) for record in mirrored["records"]) == expected
+        assert mirrored["recordInfo"]["foundCount"] == len(expected)
+        assert simulator.count("POST", "/_find") == finds
+
+        # Other accounts, word matches and reads right after a write go to FileMaker
+        assert await manager.read("sim", "d", "l", "someone else", query=query) is None
+        assert await manager.read("sim", "d", "l", credentials, query=[{"city": "Berlin"}]) is None
+        manager.note_write("sim", "d", "l")
+        assert await manager.read("sim", "d", "l", credentials, query=query) is None
+        await mirror.sync()
+        assert await manager.read("sim", "d", "l", credentials, query=query) is not None
+
+        with pytest.raises(HTTPException) as error:
+            await manager.read("sim", "d", "l", credentials, query=[{"city": "==Nowhere"}])
+        assert error.value.detail["messages"][0]["code"] == "401"
+        await manager.close()
+
+    asyncio.run(run())
+
+
+def test_full_pass_that_misses_records_keeps_them(simulator, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "FM_READ_MIRROR_PATH", str(tmp_path / "mirror.sqlite3"))
+    monkeypatch.setattr(config, "FM_READ_MIRROR_FULL_SYNC", 0)
+    missing = set()
+
+    # Loses the records in `missing`, as a pass that skipped them would
+    async def lossy_read_changes(*args, **kwargs):
+        changes = await read_changes(*args, **kwargs)
+        return changes._replace(records=[record for record in changes.records if record["recordId"] not in missing])
+
+    manager = ReadMirrorManager(fm_login, lossy_read_changes)
+    mirror = manager.add_layout({"fmServer": "sim", "database": "d", "layout": "l", "authToken": BASIC_AUTH})
+    credentials = credentials_key("sim", "d", BASIC_AUTH)[2]
+
+    async def mirrored_count():
+        return (await manager.read("sim", "d", "l", credentials, limit=1000))["recordInfo"]["totalRecordCount"]
+
+    async def run():
+        await mirror.sync()
+        assert await mirrored_count() == 50
+        full_synced_at = mirror.state()["fullSyncedAt"]
+
+        missing.add("6")
+        await mirror.sync()
+        assert await mirrored_count() == 50
+        assert mirror.state()["fullSyncedAt"] == full_synced_at
+
+        # Records deleted in FileMaker go once a pass has seen everything else
+        missing.clear()
+        simulator.client.delete(
+            "/fmi/data/vLatest/databases/d/layouts/l/records/7", headers={"Authorization": f"Bearer {simulator.login()}"}
+        )
+        await mirror.sync()
+        assert await mirrored_count() == 49
+        assert mirror.state()["fullSyncedAt"] > full_synced_at
+        await manager.close()
+
+    asyncio.run(run())
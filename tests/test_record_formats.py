@@ -0,0 +1,46 @@
+import pytest
+from python_fm_dapi_weaver.utils import record_formats
+
+
+def test_columnar_names_each_field_once(weaver):
+    result = weaver("getAllRecords", limit=3, format="columnar", fields=["name", "city"]).json()
+    assert list(result["columns"]) == ["recordId", "name", "city"]
+    assert result["columns"]["recordId"] == ["1", "2", "3"]
+    assert result["recordInfo"]["foundCount"] == 50
+    assert "records" not in result
+
+
+def test_columns_fill_missing_fields_with_none():
+    columns = record_formats.columns_of([{"a": 1}, {"b": 2}, {"a": 3, "b": 4}])
+    assert columns == {"a": [1, None, 3], "b": [None, 2, 4]}
+
+
+@pytest.mark.parametrize("method_body", [{"format": "xml"}, {"format": "columnar", "stream": True}])
+def test_unknown_or_streamed_formats_are_rejected(weaver, simulator, method_body):
+    assert weaver("findRecord", query=[{"name": "*"}], **method_body).status_code == 400
+    assert simulator.count("POST", "/_find") == 0
+
+
+@pytest.mark.skipif(record_formats.pyarrow is not None, reason="pyarrow is installed")
+def test_arrow_formats_need_pyarrow(weaver):
+    response = weaver("getAllRecords", format="parquet")
+    assert response.status_code == 400
+    assert "pyarrow" in response.text
+
+
+@pytest.mark.skipif(record_formats.pyarrow is None, reason="needs pyarrow")
+@pytest.mark.parametrize("name", ["arrow", "parquet"])
+def test_arrow_and_parquet_hold_the_same_columns(weaver, name):
+    import io
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    response = weaver("getAllRecords", limit=5, format=name, fields=["name", "amount"])
+    assert response.headers["content-type"] == record_formats.MEDIA_TYPES[name]
+    assert response.headers["X-Found-Count"] == "50"
+    if name == "arrow":
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+    else:
+        table = pyarrow.parquet.read_table(io.BytesIO(response.content))
+    assert table.column_names == ["recordId", "name", "amount"]
+    assert table.num_rows == 5
@@ -17,6 +17,13 @@ FM_LAYOUT = os.getenv("FM_LAYOUT")
 FM_USERNAME = os.getenv("FM_USERNAME")
 FM_PASSWORD = os.getenv("FM_PASSWORD")
 URL = os.getenv("URL")
+# Record and container field used by the container tests, and the file uploaded to it
+FM_CONTAINER_RECORD_ID = os.getenv("FM_CONTAINER_RECORD_ID", "9")
+FM_CONTAINER_FIELD = os.getenv("FM_CONTAINER_FIELD", "Image")
+FM_UPLOAD_FILE = os.getenv("FM_UPLOAD_FILE", str(Path.home() / "Downloads" / "vivo-v29.jpg"))
+
+# These tests call a running server backed by a real FileMaker database, configured in .env
+pytestmark = pytest.mark.skipif(not URL, reason="URL of a running server is not set")
 
 # signin should run only once,so session scope used
 @pytest.fixture(scope="session")
@@ -186,7 +193,7 @@ def tes_delete_record(auth_headers, fm_info, signin_token):
 
 
 def test_upload_container(auth_headers, fm_info, signin_token):
-    file_path = Path.home() / "Downloads" / "vivo-v29.jpg"
+    file_path = Path(FM_UPLOAD_FILE)
 
     assert file_path.exists(), f"File not found at {file_path}"
 
@@ -199,8 +206,8 @@ def test_upload_container(auth_headers, fm_info, signin_token):
         "methodBody": {
             "database": fm_info["database"],
             "layout": fm_info["layout"],
-            "recordId": "9", 
-            "fieldName": "Image",  
+            "recordId": FM_CONTAINER_RECORD_ID,
+            "fieldName": FM_CONTAINER_FIELD,
             "repetition": 1
         },
         "session": {
@@ -211,7 +218,7 @@ def test_upload_container(auth_headers, fm_info, signin_token):
 
     files = {
         "data": (None, json.dumps(json_payload), "application/json"),
-        "file": ("vivo-v29.jpg", file_data, "image/jpeg")
+        "file": (file_path.name, file_data, "image/jpeg")
     }
 
 
@@ -226,6 +233,131 @@ def test_upload_container(auth_headers, fm_info, signin_token):
     assert response.status_code == 200
     assert response.json()["status"] == "uploaded"
  
+
+def test_download_container(auth_headers, fm_info, signin_token):
+
+    payload = {
+        "method": "downloadContainer",
+        "fmServer": fm_info["server"],
+        "methodBody": {
+            "database": fm_info["database"],
+            "layout": fm_info["layout"],
+            "recordId": FM_CONTAINER_RECORD_ID,
+            "fieldName": FM_CONTAINER_FIELD
+        },
+        "session": {
+            "token": signin_token,
+            "required": ""
+        }
+    }
+
+    response = requests.post(
+        URL,
+        headers={**auth_headers, "Range": "bytes=0-99"},
+        json=payload
+    )
+
+    assert response.status_code in (200, 206)
+    if response.status_code == 206:
+        assert len(response.content) <= 100
+
+
+def test_batch(auth_headers, fm_info, signin_token):
+
+    payload = {
+        "method": "batch",
+        "fmServer": fm_info["server"],
+        "methodBody": {
+            "database": fm_info["database"],
+            "layout": fm_info["layout"],
+            "operations": [
+                {"method": "findRecord", "methodBody": {"query": [{"Stock": 20}]}},
+                {"method": "signout"}
+            ]
+        },
+        "session": {
+            "token": signin_token,
+            "required": ""
+        }
+    }
+
+    response = requests.post(
+        URL,
+        headers=auth_headers,
+        json=payload
+    )
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 2
+    assert results[1]["status"] == "error"
+    assert results[1]["statusCode"] == 400
+
+
+def test_sync_records(auth_headers, fm_info, signin_token):
+
+    payload = {
+        "method": "syncRecords",
+        "fmServer": fm_info["server"],
+        "methodBody": {
+            "database": fm_info["database"],
+            "layout": fm_info["layout"],
+            "limit": 100
+        },
+        "session": {
+            "token": signin_token,
+            "required": ""
+        }
+    }
+
+    response = requests.post(
+        URL,
+        headers=auth_headers,
+        json=payload
+    )
+
+    assert response.status_code == 200
+    first = response.json()
+    assert "records" in first
+
+    # Nothing changed in between, so syncing from the new cursor returns nothing new
+    if first["cursor"] and not first["hasMore"]:
+        payload["methodBody"]["cursor"] = first["cursor"]
+        response = requests.post(URL, headers=auth_headers, json=payload)
+        assert response.status_code == 200
+        assert response.json()["records"] == []
+
+
+def test_get_layout_metadata(auth_headers, fm_info, signin_token):
+
+    payload = {
+        "method": "getLayoutMetadata",
+        "fmServer": fm_info["server"],
+        "methodBody": {
+            "database": fm_info["database"],
+            "layout": fm_info["layout"]
+        },
+        "session": {
+            "token": signin_token,
+            "required": ""
+        }
+    }
+
+    response = requests.post(
+        URL,
+        headers=auth_headers,
+        json=payload
+    )
+
+    assert response.status_code == 200
+    assert "fieldMetaData" in response.json()
+
+    # Unknown fields are rejected locally when validation is asked for
+    create_payload = {**payload, "method": "createRecord"}
+    create_payload["methodBody"] = {**payload["methodBody"], "record": {"NoSuchField__": "x"}, "validate": True}
+    response = requests.post(URL, headers=auth_headers, json=create_payload)
+    assert response.status_code == 400
+
  
 def test_signout(auth_headers, fm_info,signin_token):
 
@@ -0,0 +1,67 @@
+import json
+import pytest
+from conftest import BASIC_AUTH
+from python_fm_dapi_weaver import config
+
+HEADERS = {"Authorization": f"Basic {BASIC_AUTH}"}
+FIND = {"fmServer": "sim", "method": "findRecord", "methodBody": {"database": "d", "layout": "l", "query": [{"name": "*"}], "limit": 1}}
+UPLOAD = {"fmServer": "sim", "method": "uploadContainer", "methodBody": {"database": "d", "layout": "l", "recordId": "1", "fieldName": "photo"}}
+
+
+@pytest.fixture
+def client(weaver, monkeypatch):
+    monkeypatch.setattr(config, "FM_MAX_BODY_SIZE", 1024)
+    monkeypatch.setattr(config, "FM_MAX_UPLOAD_SIZE", 4096)
+    return weaver.client
+
+
+def post_json(client, body, **kwargs):
+    return client.post("/api/dataApi", headers={**HEADERS, "Content-Type": "application/json"}, **kwargs, content=body)
+
+
+def upload(client, size, data=UPLOAD):
+    files = {"file": ("photo.jpg", b"x" * size, "image/jpeg")}
+    return client.post("/api/dataApi", headers=HEADERS, data={"data": json.dumps(data)} if data else {}, files=files)
+
+
+def test_json_bodies_within_the_limit_are_read(client, simulator):
+    assert post_json(client, json.dumps(FIND)).status_code == 200
+
+
+def test_json_bodies_over_the_limit_are_rejected(client, simulator):
+    padded = json.dumps({**FIND, "padding": "x" * 2000})
+    assert post_json(client, padded).status_code == 413
+
+    # Without a Content-Length the body is cut off while it arrives
+    def chunks():
+        for start in range(0, len(padded), 100):
+            yield padded[start:start + 100].encode()
+
+    assert post_json(client, chunks()).status_code == 413
+    assert simulator.calls == []
+
+
+@pytest.mark.parametrize("body, status", [("{not json", 400), ("[1, 2]", 400)])
+def test_invalid_json_is_rejected(client, body, status):
+    assert post_json(client, body).status_code == status
+
+
+def test_other_content_types_are_rejected(client):
+    response = client.post("/api/dataApi", headers={**HEADERS, "Content-Type": "text/plain"}, content=json.dumps(FIND))
+    assert response.status_code == 415
+
+
+def test_uploads_are_streamed_to_filemaker(client, simulator):
+    response = upload(client, 3000)
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "uploaded"
+    assert simulator.count("POST", "/containers/photo") == 1
+
+
+def test_uploads_over_the_limit_are_rejected(client, simulator):
+    assert upload(client, 5000).status_code == 413
+    assert simulator.count("POST", "/containers/photo") == 0
+
+
+def test_upload_without_data_is_rejected(client):
+    assert upload(client, 10, data=None).status_code == 400
@@ -0,0 +1,82 @@
+import pytest
+from fastapi.testclient import TestClient
+from conftest import BASIC_AUTH
+from python_fm_dapi_weaver.controllers import records
+from python_fm_dapi_weaver.main import app
+from python_fm_dapi_weaver.utils.response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResponseCache(60, {}, 1024 * 1024)
+    monkeypatch.setattr(records, "response_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def call(simulator, cache):
+    client = TestClient(app)
+
+    def call(method, layout="l", **method_body):
+        response = client.post(
+            "/api/dataApi",
+            json={"fmServer": "sim", "method": method, "methodBody": {"database": "d", "layout": layout, **method_body}},
+            headers={"Authorization": f"Basic {BASIC_AUTH}"},
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return call
+
+
+def names(response):
+    return [record["name"] for record in response["records"]]
+
+
+def test_repeated_reads_are_served_from_the_cache(simulator, cache, call):
+    first = call("getAllRecords", limit=5)
+    assert call("getAllRecords", limit=5)["records"] == first["records"]
+    assert simulator.count("GET", "/records") == 1
+    assert cache.hits == 1
+
+    # A different read, or one that opts out, goes to FileMaker
+    call("getAllRecords", limit=6)
+    call("getAllRecords", limit=5, cache=False)
+    assert simulator.count("GET", "/records") == 3
+
+
+def test_writes_invalidate_the_layout(simulator, cache, call):
+    call("findRecord", query=[{"city": "Pune"}])
+    call("getAllRecords", limit=5)
+    call("getAllRecords", layout="other", limit=5)
+    assert cache.stats()["entries"] == 3
+
+    call("updateRecord", recordId="1", record={"name": "Renamed"})
+    assert cache.stats()["entries"] == 1
+    assert names(call("getAllRecords", limit=5))[0] == "Renamed"
+    call("findRecord", query=[{"city": "Pune"}])
+    assert simulator.count("GET", "/records") == 3
+    assert simulator.count("POST", "/_find") == 2
+
+    # The other layout's cached reads are kept
+    call("getAllRecords", layout="other", limit=5)
+    assert simulator.count("GET", "/records") == 3
+
+
+@pytest.mark.parametrize("method, method_body", [
+    ("createRecord", {"record": {"name": "New"}}),
+    ("deleteRecord", {"recordId": "1"}),
+])
+def test_creates_and_deletes_invalidate_the_layout(simulator, cache, call, method, method_body):
+    before = call("getAllRecords", limit=100)["recordInfo"]["totalRecordCount"]
+    call(method, **method_body)
+    after = call("getAllRecords", limit=100)["recordInfo"]["totalRecordCount"]
+    assert after == before + (1 if method == "createRecord" else -1)
+    assert simulator.count("GET", "/records") == 2
+
+
+def test_finds_that_run_scripts_are_not_cached(simulator, cache, call):
+    for _ in range(2):
+        call("findRecord", query=[{"city": "Pune"}], scripts={"script": "Log"})
+    assert simulator.count("POST", "/_find") == 2
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,41 @@
+from conftest import BASIC_AUTH
+from python_fm_dapi_weaver.utils.session_cache import credentials_key, session_cache
+
+
+def read(weaver, **kwargs):
+    response = weaver("findRecord", query=[{"name": "*"}], limit=1, **kwargs)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_requests_without_a_token_share_one_login(weaver, simulator):
+    tokens = {read(weaver)["session"] for _ in range(3)}
+    assert len(tokens) == 1
+    assert simulator.count("POST", "/sessions") == 1
+    assert simulator.count("GET", "/validateSession") == 0
+
+
+def test_tokens_from_signin_skip_validate_session(weaver, simulator):
+    token = weaver("signin").json()["session"]
+    for _ in range(2):
+        assert read(weaver, session={"token": token})["session"] == token
+    assert simulator.count("GET", "/validateSession") == 0
+
+
+def test_tokens_obtained_elsewhere_are_validated_and_never_shared(weaver, simulator):
+    token = simulator.login()
+    for _ in range(2):
+        assert read(weaver, session={"token": token})["session"] == token
+    assert simulator.count("GET", "/validateSession") == 2
+    assert session_cache.get(credentials_key("sim", "d", BASIC_AUTH)) is None
+
+    # A request without a token gets a session of its own
+    assert read(weaver)["session"] != token
+    assert simulator.count("POST", "/sessions") == 1
+
+
+def test_expired_token_is_replaced_by_a_new_login(weaver, simulator):
+    token = read(weaver)["session"]
+    simulator.client.delete(f"/fmi/data/vLatest/databases/d/sessions/{token}")
+    assert read(weaver)["session"] != token
+    assert simulator.count("POST", "/sessions") == 2
@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from conftest import BASIC_AUTH
+from python_fm_dapi_weaver.controllers.auth import session_pools
+from python_fm_dapi_weaver.utils.session_pool import SessionPoolManager
+
+
+@pytest.fixture
+def pool(simulator, monkeypatch):
+    monkeypatch.setattr(session_pools, "pools", {})
+    return session_pools.add_account("sim", "d", BASIC_AUTH, size=2)
+
+
+def read(weaver, **kwargs):
+    return weaver("findRecord", query=[{"name": "*"}], limit=1, **kwargs)
+
+
+def test_requests_without_a_token_borrow_a_pooled_session(weaver, simulator, pool):
+    for _ in range(3):
+        response = read(weaver)
+        assert response.status_code == 200, response.text
+        # The pooled token stays with the pool
+        assert "session" not in response.json()
+    assert simulator.count("POST", "/sessions") == 1
+    assert pool.stats()["acquired"] == 3
+    assert pool.stats()["inUse"] == 0
+
+    streamed = weaver("getAllRecords", stream=True, pageSize=10)
+    assert "X-Session-Token" not in streamed.headers
+    assert pool.stats()["inUse"] == 0
+
+
+def test_pooled_sessions_cannot_be_signed_out(weaver, pool):
+    read(weaver)
+    token = next(iter(pool._tokens))
+    assert weaver("signout", session={"token": token}).status_code == 400
+
+    # A signout without a token does not borrow, and so never closes, a pooled session
+    assert weaver("signout").status_code == 200
+    assert pool.owns(token)
+    assert read(weaver).status_code == 200
+
+
+def test_session_filemaker_no_longer_accepts_is_replaced(weaver, simulator, pool):
+    read(weaver)
+    token = next(iter(pool._tokens))
+    simulator.client.delete(f"/fmi/data/vLatest/databases/d/sessions/{token}")
+
+    assert read(weaver).status_code == 200
+    assert not pool.owns(token)
+    assert simulator.count("POST", "/sessions") == 2
+    assert pool.stats()["open"] == 1
+
+
+def test_pool_never_opens_more_than_its_size(simulator):
+    opened = []
+
+    async def login(fm_server, database, basic_auth_token):
+        opened.append(basic_auth_token)
+        return f"token{len(opened)}"
+
+    manager = SessionPoolManager(login, None, None)
+
+    async def run():
+        pool = manager.add_account("sim", "d", BASIC_AUTH, size=1)
+        session = await pool.acquire()
+        assert await pool.acquire_nowait() is None
+        with pytest.raises(HTTPException) as error:
+            await pool.acquire(timeout=0.01)
+        waiter = asyncio.ensure_future(pool.acquire(timeout=1))
+        await asyncio.sleep(0)
+        pool.release(session)
+        assert (await waiter) is session
+        return pool, error.value
+
+    pool, error = asyncio.run(run())
+    assert error.status_code == 503
+    assert len(opened) == 1
+    assert pool.stats()["maxWaitSeconds"] > 0
+
+
+def test_keep_alive_replaces_dead_sessions():
+    tokens = iter(["dead", "fresh"])
+
+    async def login(fm_server, database, basic_auth_token):
+        return next(tokens)
+
+    async def logout(fm_server, database, token):
+        return True
+
+    async def validate(fm_server, token):
+        return token != "dead"
+
+    manager = SessionPoolManager(login, logout, validate)
+
+    async def run():
+        pool = manager.add_account("sim", "d", BASIC_AUTH, size=1)
+        await pool.warm_up()
+        await pool.keep_alive(0)
+        session = await pool.acquire()
+        return pool, session
+
+    pool, session = asyncio.run(run())
+    assert session.token == "fresh"
+    assert pool.owns("fresh") and not pool.owns("dead")
+    assert pool.stats()["replaced"] == 1
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import httpx
+import pytest
+from python_fm_dapi_weaver import config
+from python_fm_dapi_weaver.controllers.records import iter_pages
+
+
+def lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+@pytest.mark.parametrize("method, method_body", [
+    ("getAllRecords", {}),
+    ("findRecord", {"query": [{"name": "*"}]}),
+])
+def test_stream_returns_the_whole_found_set_as_ndjson(weaver, simulator, method, method_body):
+    response = weaver(method, stream=True, pageSize=7, **method_body)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["X-Found-Count"] == "50"
+    records = lines(response)
+    assert [int(record["recordId"]) for record in records] == list(range(1, 51))
+    assert simulator.count(*(("GET", "/records") if method == "getAllRecords" else ("POST", "/_find"))) == 8
+
+
+def test_offset_and_limit_bound_the_stream(weaver, simulator):
+    response = weaver("getAllRecords", stream=True, pageSize=4, offset=11, limit=10)
+    assert [int(record["recordId"]) for record in lines(response)] == list(range(11, 21))
+    assert simulator.count("GET", "/records") == 3
+
+
+def test_stream_reports_a_failed_page_in_band(weaver, simulator):
+    def fail_third_page(request):
+        if request.url.params.get("_offset") == "21":
+            simulator.failures.append(httpx.Response(500, json={"response": {}, "messages": [{"code": "802", "message": "Unable to open file"}]}))
+
+    simulator.before_call = fail_third_page
+    records = lines(weaver("getAllRecords", stream=True, pageSize=10))
+    assert len(records) == 21
+    assert set(records[-1]) == {"error", "statusCode"}
+
+
+@pytest.mark.parametrize("page_size", [-5, 0, "x", 2.5, True])
+def test_invalid_page_size_is_rejected(weaver, simulator, page_size):
+    response = weaver("getAllRecords", stream=True, pageSize=page_size)
+    assert response.status_code == 400
+    assert "pageSize" in response.text
+    assert simulator.count("GET", "/records") == 0
+
+
+def test_parallel_read_returns_the_records_in_order(weaver, simulator, monkeypatch):
+    monkeypatch.setattr(config, "FM_MAX_PARALLEL_PAGES", 2)
+    response = weaver("getAllRecords", parallel=16, pageSize=6)
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert [int(record["recordId"]) for record in result["records"]] == list(range(1, 51))
+    assert simulator.count("GET", "/records") == 9
+
+
+@pytest.mark.parametrize("parallel", [-1, "x", True])
+def test_invalid_parallel_is_rejected(weaver, simulator, parallel):
+    response = weaver("findRecord", query=[{"name": "*"}], parallel=parallel)
+    assert response.status_code == 400
+    assert "parallel" in response.text
+
+
+def test_parallel_pages_stay_within_the_limit():
+    async def run(ordered):
+        in_flight = [0, 0]
+
+        async def fetch_page(page_offset, page_limit):
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+            # Later pages answer first
+            await asyncio.sleep(0.001 * (20 - page_offset))
+            in_flight[0] -= 1
+            return page_offset
+
+        pages = [(page_offset, 1) for page_offset in range(1, 11)]
+        offsets = [page async for page in iter_pages(fetch_page, pages, 3, ordered)]
+        return offsets, in_flight[1]
+
+    offsets, peak = asyncio.run(run(True))
+    assert offsets == list(range(1, 11))
+    assert peak == 3
+    offsets, peak = asyncio.run(run(False))
+    assert sorted(offsets) == list(range(1, 11)) and offsets != list(range(1, 11))
+    assert peak == 3
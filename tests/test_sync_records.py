@@ -0,0 +1,77 @@
+import pytest
+
+
+# Runs syncRecords from `cursor` until hasMore is false; returns the records and the last cursor
+def sync_all(weaver, cursor=None, **method_body):
+    records = []
+    while True:
+        response = weaver("syncRecords", cursor=cursor, **method_body)
+        assert response.status_code == 200, response.text
+        result = response.json()
+        records += result["records"]
+        cursor = result["cursor"]
+        if not result["hasMore"]:
+            return records, cursor
+
+
+def ids(records):
+    return [int(record["recordId"]) for record in records]
+
+
+def test_first_sync_returns_every_record_in_modification_order(weaver):
+    records, cursor = sync_all(weaver, limit=7, pageSize=3)
+    assert ids(records) == list(range(1, 51))
+
+    # Nothing changed since: the next sync is empty and keeps the cursor
+    again, same_cursor = sync_all(weaver, cursor=cursor)
+    assert again == []
+    assert same_cursor == cursor
+
+
+def test_changes_since_the_cursor(weaver, simulator):
+    _, cursor = sync_all(weaver)
+    simulator.edit("7", name="Seven")
+    simulator.edit("3", name="Three")
+    records, _ = sync_all(weaver, cursor=cursor)
+    assert ids(records) == [7, 3]
+    assert records[1]["name"] == "Three"
+
+
+def test_record_edited_during_a_read_does_not_hide_others(weaver, simulator):
+    pages = []
+
+    def edit_after_first_page(request):
+        if request.url.path.endswith("/_find"):
+            pages.append(request)
+            if len(pages) == 2:
+                simulator.edit("2", name="Edited")
+
+    simulator.before_call = edit_after_first_page
+    records, _ = sync_all(weaver, pageSize=5)
+    assert sorted(set(ids(records))) == list(range(1, 51))
+    assert ids(records)[-1] == 2
+    assert records[-1]["name"] == "Edited"
+
+
+def test_records_sharing_a_timestamp_are_neither_repeated_nor_lost(weaver, simulator):
+    simulator.clock.step = 0
+    for record_id in range(1, 21):
+        simulator.edit(str(record_id), name=f"Batch {record_id}")
+    records, cursor = sync_all(weaver, limit=4, pageSize=3)
+    assert sorted(ids(records)) == list(range(1, 51))
+    assert len(records) == 50
+
+    # Edits in the cursor's own second are picked up again
+    simulator.edit("5", name="Same second")
+    again, _ = sync_all(weaver, cursor=cursor)
+    assert ids(again) == [5]
+
+
+@pytest.mark.parametrize("option, value", [("limit", 0), ("limit", -1), ("pageSize", "x"), ("pageSize", 0)])
+def test_invalid_limits_are_rejected(weaver, option, value):
+    response = weaver("syncRecords", **{option: value})
+    assert response.status_code == 400
+
+
+def test_invalid_cursor_is_rejected(weaver):
+    assert weaver("syncRecords", cursor="not a cursor").status_code == 400
@@ -0,0 +1,28 @@
+import json
+import logging
+from python_fm_dapi_weaver import config
+from python_fm_dapi_weaver.utils import tracing
+
+
+def test_sampled_requests_are_logged_without_credentials(weaver, monkeypatch, caplog):
+    monkeypatch.setattr(config, "FM_TRACE_SAMPLE_RATE", 1.0)
+    with caplog.at_level(logging.INFO, logger=tracing.__name__):
+        response = weaver("findRecord", query=[{"name": "*"}], limit=1)
+    records = [record for record in caplog.records if record.name == tracing.__name__]
+    assert len(records) == 1
+    entry = json.loads(records[0].getMessage())
+    assert (entry["method"], entry["fmServer"], entry["database"], entry["layout"], entry["status"]) == ("findRecord", "sim", "d", "l", 200)
+    assert set(entry["phasesMs"]) >= {"parse", "validate_session", "upstream", "serialize"}
+    assert response.json()["session"] not in records[0].getMessage()
+
+
+def test_the_trace_logger_leaves_handlers_to_the_application():
+    assert tracing.logger.handlers == []
+    assert tracing.logger.propagate
+
+
+def test_server_timing_header(weaver, monkeypatch):
+    monkeypatch.setattr(config, "FM_SERVER_TIMING", True)
+    timing = weaver("getAllRecords", limit=1).headers["Server-Timing"]
+    assert timing.startswith("parse;dur=")
+    assert "upstream;dur=" in timing and "total;dur=" in timing